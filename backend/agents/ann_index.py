@@ -0,0 +1,446 @@
+"""
+Local approximate-nearest-neighbour index, used instead of the SQL scan when
+RETRIEVAL_ENGINE=ann.
+
+One partition per retrieval scope ("public" and "user-<id>"), each an IVF index
+stored as .npy files and opened with mmap so every uvicorn worker shares the same
+page cache. Layout under ANN_INDEX_DIR/<scope>/:
+
+    CURRENT                 name of the live generation directory
+    gen-<ts>/manifest.json  model, metric, nlist, delta segments, tombstone count
+    gen-<ts>/vectors.npy    rows grouped by IVF list
+    gen-<ts>/ids.npy        document id per row
+    gen-<ts>/centroids.npy  IVF list centroids (absent for small, flat partitions)
+    gen-<ts>/offsets.npy    start row of each list
+    gen-<ts>/delta-*.npy    chunks ingested since the build, searched exhaustively
+    gen-<ts>/tombstones.npy soft-deleted document ids
+
+Deltas are compacted as they arrive: past ANN_MAX_DELTAS segments they are merged
+into one, and once they hold ANN_DELTA_REBUILD_RATIO of the partition it is rebuilt.
+
+    python -m backend.agents.ann_index rebuild [--scope public|<user_id>]
+    python -m backend.agents.ann_index check
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+import numpy as np
+from sqlalchemy import select, func
+from prometheus_client import Counter
+from backend.agents.embeddings import active_model, is_v2
+from backend.database import SessionLocal
+from backend.models import Document
+
+logger = logging.getLogger(__name__)
+
+# sql | ann
+RETRIEVAL_ENGINE = os.getenv("RETRIEVAL_ENGINE", "sql")
+ANN_INDEX_DIR = os.getenv("ANN_INDEX_DIR", "/data/ann_index")
+# IVF lists probed per query; more lists = better recall, more rows scanned
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+# Below this many rows a partition is scanned flat, k-means isn't worth it
+ANN_MIN_IVF_ROWS = int(os.getenv("ANN_MIN_IVF_ROWS", "2048"))
+# Delta segments merged into one once there are more than this many
+ANN_MAX_DELTAS = int(os.getenv("ANN_MAX_DELTAS", "16"))
+# Partition rebuilt once its delta rows exceed this share of the built rows
+ANN_DELTA_REBUILD_RATIO = float(os.getenv("ANN_DELTA_REBUILD_RATIO", "0.2"))
+ANN_KMEANS_ITERATIONS = 10
+ANN_KMEANS_SAMPLE = 50000
+BUILD_BATCH = 1000
+
+ANN_SEARCHES = Counter("ann_index_searches_total", "Retrieval searches by engine outcome", ["result"])
+ANN_COMPACTIONS = Counter("ann_index_compactions_total", "Automatic delta compactions by kind", ["kind"])
+
+_partitions = {}
+_partitions_lock = threading.Lock()
+
+def scope_name(user_id):
+    return "public" if user_id is None else f"user-{user_id}"
+
+def _scope_user_id(scope):
+    return None if scope == "public" else int(scope.split("-", 1)[1])
+
+def _scope_dir(scope):
+    return os.path.join(ANN_INDEX_DIR, scope)
+
+def _current_generation(scope):
+    try:
+        with open(os.path.join(_scope_dir(scope), "CURRENT")) as f:
+            return os.path.join(_scope_dir(scope), f.read().strip())
+    except FileNotFoundError:
+        return None
+
+def _write_atomic(path, write):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    write(tmp)
+    os.replace(tmp, path)
+
+def _write_json(path, data):
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+    _write_atomic(path, write)
+
+def _write_text(path, text):
+    def write(tmp):
+        with open(tmp, "w") as f:
+            f.write(text)
+    _write_atomic(path, write)
+
+def _save_npy(path, array):
+    def write(tmp):
+        # np.save appends .npy to names without it
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+    _write_atomic(path, write)
+
+@contextmanager
+def _scope_lock(scope):
+    """Serializes writers (ingestion, deletes, rebuilds) of one partition across processes."""
+    os.makedirs(_scope_dir(scope), exist_ok=True)
+    with open(os.path.join(_scope_dir(scope), ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _prepare(vectors, metric):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if metric == "cosine":
+        # On unit vectors L2 order equals cosine order, so one search routine serves both
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+    return vectors
+
+def _nearest(vectors, centroids):
+    # argmin ||v - c||^2 == argmin (||c||^2 - 2 v.c)
+    scores = (centroids ** 2).sum(axis=1) - 2 * vectors @ centroids.T
+    return scores.argmin(axis=1)
+
+def _kmeans(sample, nlist):
+    rng = np.random.default_rng(0)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(ANN_KMEANS_ITERATIONS):
+        assign = _nearest(sample, centroids)
+        for c in range(nlist):
+            members = sample[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return centroids
+
+def _l2(block, query):
+    diff = block - query
+    return np.einsum("ij,ij->i", diff, diff)
+
+class Partition:
+    """Read-only view of one generation; reloaded when its manifest changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.stamp = os.stat(os.path.join(path, "manifest.json")).st_mtime_ns
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.model = self.manifest["model"]
+        self.metric = self.manifest["metric"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self.nlist = self.manifest["nlist"]
+        if self.nlist:
+            self.centroids = np.load(os.path.join(path, "centroids.npy"))
+            self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.deltas = [
+            (np.load(os.path.join(path, f"{name}.ids.npy")), np.load(os.path.join(path, f"{name}.vectors.npy"), mmap_mode="r"))
+            for name in self.manifest["deltas"]
+        ]
+        tombstones = os.path.join(path, "tombstones.npy")
+        self.tombstones = np.load(tombstones) if os.path.exists(tombstones) else np.empty(0, dtype=np.int64)
+
+    def live_ids(self):
+        ids = np.concatenate([np.asarray(self.ids)] + [d[0] for d in self.deltas])
+        return set(ids[~np.isin(ids, self.tombstones)].tolist())
+
+    def _blocks(self, query):
+        if self.nlist:
+            probe = np.argsort(_l2(self.centroids, query))[:ANN_NPROBE]
+            for lst in probe:
+                start, end = self.offsets[lst], self.offsets[lst + 1]
+                if end > start:
+                    yield self.ids[start:end], self.vectors[start:end]
+        else:
+            yield self.ids, self.vectors
+        yield from self.deltas
+
+    def search(self, query, k):
+        """Returns [(distance, id)] of the k nearest live rows."""
+        query = _prepare(query, self.metric)
+        hits = []
+        for ids, block in self._blocks(query):
+            if not len(ids):
+                continue
+            ids = np.asarray(ids)
+            distances = _l2(np.asarray(block), query)
+            live = ~np.isin(ids, self.tombstones)
+            ids, distances = ids[live], distances[live]
+            if len(ids) > k:
+                top = np.argpartition(distances, k)[:k]
+                ids, distances = ids[top], distances[top]
+            hits.extend(zip(distances.tolist(), ids.tolist()))
+        return sorted(hits)[:k]
+
+def _partition(scope):
+    path = _current_generation(scope)
+    if path is None:
+        return None
+    stamp = os.stat(os.path.join(path, "manifest.json")).st_mtime_ns
+    cached = _partitions.get(scope)
+    if cached is not None and cached.path == path and cached.stamp == stamp:
+        return cached
+    with _partitions_lock:
+        partition = Partition(path)
+        _partitions[scope] = partition
+        return partition
+
+def search(query_vector, user_id, model, k):
+    """
+    Ranked document ids over the public partition plus the user's own, or None when
+    the index can't answer (not built, other embedding model) and SQL has to.
+    """
+    try:
+        scopes = ["public"] + ([scope_name(user_id)] if user_id else [])
+        hits = []
+        for scope in scopes:
+            partition = _partition(scope)
+            if partition is None:
+                if scope == "public":
+                    ANN_SEARCHES.labels(result="missing").inc()
+                    return None
+                # A user without uploads has no partition of their own
+                continue
+            if partition.model != model:
+                ANN_SEARCHES.labels(result="model_mismatch").inc()
+                return None
+            hits.extend(partition.search(query_vector, k))
+        ANN_SEARCHES.labels(result="hit").inc()
+        return [doc_id for _, doc_id in sorted(hits)[:k]]
+    except Exception as e:
+        ANN_SEARCHES.labels(result="error").inc()
+        logger.warning(f"ANN index search failed, falling back to SQL: {e}")
+        return None
+
+def _vector_column(model):
+    return Document.embedding_v2 if is_v2(model) else Document.embedding
+
+def _scope_rows(user_id):
+    return Document.tenant_id == (user_id or 0)
+
+def build_partition(scope, model=None):
+    """Writes a fresh generation for `scope` from Postgres and makes it current."""
+    # Held for the whole build so no delta lands in the generation being replaced
+    with _scope_lock(scope):
+        return _build(scope, model or active_model())
+
+def _build(scope, model):
+    metric = "cosine" if is_v2(model) else "l2"
+    user_id = _scope_user_id(scope)
+    column = _vector_column(model)
+    filters = (_scope_rows(user_id), Document.is_deleted == False, column != None)
+
+    generation = f"gen-{time.time_ns()}"
+    path = os.path.join(_scope_dir(scope), generation)
+    os.makedirs(path)
+
+    with SessionLocal() as db:
+        count = db.execute(select(func.count(Document.id)).filter(*filters)).scalar()
+        dim = db.execute(select(column).filter(*filters).limit(1)).scalar()
+        dim = len(dim) if dim is not None else 0
+
+        # Staged on disk first so large partitions never sit in memory twice
+        staged = np.lib.format.open_memmap(os.path.join(path, "staged.npy"), mode="w+", dtype=np.float32, shape=(count, dim))
+        ids = np.empty(count, dtype=np.int64)
+        row = 0
+        for doc_id, vector in db.execute(select(Document.id, column).filter(*filters).order_by(Document.id).execution_options(yield_per=BUILD_BATCH)):
+            if row >= count:
+                break
+            staged[row] = _prepare(vector, metric)
+            ids[row] = doc_id
+            row += 1
+        count = row
+
+    nlist = int(np.sqrt(count)) if count >= ANN_MIN_IVF_ROWS else 0
+    if nlist:
+        rng = np.random.default_rng(0)
+        sample = staged[np.sort(rng.choice(count, min(count, ANN_KMEANS_SAMPLE), replace=False))]
+        centroids = _kmeans(np.asarray(sample), nlist)
+        assign = np.concatenate([_nearest(np.asarray(staged[i:i + BUILD_BATCH]), centroids) for i in range(0, count, BUILD_BATCH)])
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+        np.save(os.path.join(path, "centroids.npy"), centroids)
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+    else:
+        order = np.arange(count)
+
+    vectors = np.lib.format.open_memmap(os.path.join(path, "vectors.npy"), mode="w+", dtype=np.float32, shape=(count, dim))
+    for i in range(0, count, BUILD_BATCH):
+        vectors[i:i + BUILD_BATCH] = staged[order[i:i + BUILD_BATCH]]
+    vectors.flush()
+    del staged, vectors
+    os.remove(os.path.join(path, "staged.npy"))
+    np.save(os.path.join(path, "ids.npy"), ids[:count][order])
+
+    _write_json(os.path.join(path, "manifest.json"), {
+        "model": model, "metric": metric, "dim": dim, "count": count,
+        "nlist": nlist, "deltas": [], "built_at": time.time(),
+    })
+    _write_text(os.path.join(_scope_dir(scope), "CURRENT"), generation)
+
+    # Open mmaps of the old generation stay valid until their readers reload
+    for name in os.listdir(_scope_dir(scope)):
+        if name.startswith("gen-") and name != generation:
+            shutil.rmtree(os.path.join(_scope_dir(scope), name), ignore_errors=True)
+
+    logger.info(f"Built ANN partition {scope}: {count} rows, {nlist} lists, model {model}")
+    return count
+
+def _update_manifest(path, change):
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    change(manifest)
+    _write_json(os.path.join(path, "manifest.json"), manifest)
+
+def add_documents(user_id, ids, vectors, model):
+    """Appends freshly committed chunks as a delta segment. No-op unless the partition is built for `model`."""
+    if RETRIEVAL_ENGINE != "ann" or not ids:
+        return
+    scope = scope_name(user_id)
+    try:
+        with _scope_lock(scope):
+            path = _current_generation(scope)
+            if path is None:
+                # First upload of this scope: the committed rows are all it holds, build it outright
+                if model == active_model():
+                    _build(scope, model)
+                return
+            with open(os.path.join(path, "manifest.json")) as f:
+                manifest = json.load(f)
+            if manifest["model"] != model:
+                return
+            name = f"delta-{time.time_ns()}"
+            _save_npy(os.path.join(path, f"{name}.vectors.npy"), _prepare(vectors, manifest["metric"]))
+            _save_npy(os.path.join(path, f"{name}.ids.npy"), np.asarray(ids, dtype=np.int64))
+            _update_manifest(path, lambda m: m["deltas"].append(name))
+            _compact(scope, path, model)
+    except Exception as e:
+        # Index misses these chunks until the next rebuild; `check` reports them
+        logger.warning(f"ANN index update failed for {scope}: {e}")
+
+def _compact(scope, path, model):
+    """Keeps the exhaustively scanned delta tail short. The caller holds the scope lock."""
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    delta_rows = sum(len(np.load(os.path.join(path, f"{name}.ids.npy"), mmap_mode="r")) for name in manifest["deltas"])
+    # Small partitions are scanned flat anyway, don't rebuild them for every few chunks
+    if delta_rows > ANN_DELTA_REBUILD_RATIO * max(manifest["count"], ANN_MIN_IVF_ROWS):
+        ANN_COMPACTIONS.labels(kind="rebuild").inc()
+        _build(scope, model)
+    elif len(manifest["deltas"]) > ANN_MAX_DELTAS:
+        ANN_COMPACTIONS.labels(kind="merge").inc()
+        _merge_deltas(path, manifest)
+
+def _merge_deltas(path, manifest):
+    """Rewrites every delta segment as one, leaving out tombstoned rows."""
+    tombstones_path = os.path.join(path, "tombstones.npy")
+    tombstones = np.load(tombstones_path) if os.path.exists(tombstones_path) else np.empty(0, dtype=np.int64)
+    old = manifest["deltas"]
+    ids = np.concatenate([np.load(os.path.join(path, f"{name}.ids.npy")) for name in old])
+    vectors = np.concatenate([np.load(os.path.join(path, f"{name}.vectors.npy")) for name in old])
+    live = ~np.isin(ids, tombstones)
+
+    name = f"delta-{time.time_ns()}"
+    _save_npy(os.path.join(path, f"{name}.vectors.npy"), vectors[live])
+    _save_npy(os.path.join(path, f"{name}.ids.npy"), ids[live])
+    _update_manifest(path, lambda m: m.update(deltas=[name]))
+
+    # Open mmaps of the merged segments stay valid until their readers reload
+    for segment in old:
+        for suffix in ("ids", "vectors"):
+            os.remove(os.path.join(path, f"{segment}.{suffix}.npy"))
+
+def remove_documents(user_id, ids):
+    """Tombstones soft-deleted chunks so searches skip them right away."""
+    if RETRIEVAL_ENGINE != "ann" or not ids:
+        return
+    scope = scope_name(user_id)
+    try:
+        with _scope_lock(scope):
+            path = _current_generation(scope)
+            if path is None:
+                return
+            tombstones_path = os.path.join(path, "tombstones.npy")
+            existing = np.load(tombstones_path) if os.path.exists(tombstones_path) else np.empty(0, dtype=np.int64)
+            tombstones = np.union1d(existing, np.asarray(ids, dtype=np.int64))
+            _save_npy(tombstones_path, tombstones)
+            # Manifest mtime is what readers watch
+            _update_manifest(path, lambda m: m.update(tombstones=int(len(tombstones))))
+    except Exception as e:
+        logger.warning(f"ANN index delete failed for {scope}: {e}")
+
+def _scopes_in_db(db):
+    user_ids = db.execute(select(Document.user_id).filter(Document.user_id != None).distinct()).scalars().all()
+    return ["public"] + [scope_name(user_id) for user_id in sorted(user_ids)]
+
+def rebuild(scope=None):
+    with SessionLocal() as db:
+        scopes = [scope] if scope else _scopes_in_db(db)
+    return {s: build_partition(s) for s in scopes}
+
+def check(scope=None):
+    """Compares each partition's live ids with Postgres. Returns one report per scope."""
+    reports = []
+    with SessionLocal() as db:
+        for s in ([scope] if scope else _scopes_in_db(db)):
+            partition = _partition(s)
+            column = _vector_column(partition.model if partition else active_model())
+            expected = set(db.execute(select(Document.id).filter(
+                _scope_rows(_scope_user_id(s)), Document.is_deleted == False, column != None
+            )).scalars().all())
+            indexed = partition.live_ids() if partition else set()
+            reports.append({
+                "scope": s,
+                "built": partition is not None,
+                "model": partition.model if partition else None,
+                "expected": len(expected),
+                "indexed": len(indexed),
+                "missing": len(expected - indexed),
+                "stale": len(indexed - expected),
+                "consistent": partition is not None and expected == indexed,
+            })
+    return reports
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local ANN retrieval index")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--scope", help="public or a user id; default: every scope")
+    args = parser.parse_args(argv)
+    scope = None if args.scope is None else (args.scope if args.scope == "public" else scope_name(int(args.scope)))
+
+    if args.command == "rebuild":
+        for s, count in rebuild(scope).items():
+            print(f"{s}: {count} rows")
+        return 0
+
+    reports = check(scope)
+    for report in reports:
+        print(json.dumps(report))
+    return 0 if all(r["consistent"] for r in reports) else 1
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
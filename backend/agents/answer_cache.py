@@ -0,0 +1,207 @@
+import os
+import re
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, update
+from prometheus_client import Counter, Histogram
+from backend.cache import corpus_version, acorpus_version, bump_corpus_version
+from backend.agents.embeddings import client_for, active_model, aactive_model
+from backend.database import SessionLocal, AsyncSessionLocal
+from backend.models import AnswerCache
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+# Cosine similarity a stored question needs to count as "the same question"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# LRU cap per user; the least recently used entries are evicted on insert
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "200"))
+
+ANSWER_CACHE_REQUESTS = Counter(
+    "answer_cache_requests_total",
+    "Semantic answer cache lookups",
+    ["result"]
+)
+ANSWER_CACHE_SIMILARITY_SEEN = Histogram(
+    "answer_cache_best_similarity",
+    "Similarity of the closest cached question per lookup",
+    buckets=(0.5, 0.7, 0.8, 0.85, 0.9, 0.93, 0.95, 0.97, 0.99, 1.0)
+)
+
+def _lookup_query(user_id, query_vector, model, version):
+    distance = AnswerCache.embedding.cosine_distance(query_vector).label("distance")
+    return select(AnswerCache, distance).filter(
+        AnswerCache.user_id == user_id,
+        AnswerCache.embedding_model == model,
+        AnswerCache.corpus_version == version,
+        AnswerCache.created_at >= datetime.utcnow() - timedelta(seconds=ANSWER_CACHE_TTL)
+    ).order_by(distance).limit(1)
+
+def _touch(entry_id):
+    return update(AnswerCache).where(AnswerCache.id == entry_id).values(
+        hits=AnswerCache.hits + 1,
+        last_used_at=datetime.utcnow()
+    )
+
+def _evict(user_id, version):
+    """Drops stale/expired entries and everything beyond the per-user LRU cap."""
+    keep = select(AnswerCache.id).filter(
+        AnswerCache.user_id == user_id
+    ).order_by(AnswerCache.last_used_at.desc()).limit(ANSWER_CACHE_MAX_ENTRIES)
+
+    return delete(AnswerCache).where(
+        AnswerCache.user_id == user_id,
+        (AnswerCache.corpus_version != version)
+        | (AnswerCache.created_at < datetime.utcnow() - timedelta(seconds=ANSWER_CACHE_TTL))
+        | AnswerCache.id.not_in(keep.scalar_subquery())
+    ).execution_options(synchronize_session=False)
+
+def _entry(question, user_id, query_vector, model, version, answer, citations):
+    return AnswerCache(
+        user_id=user_id,
+        question=question,
+        embedding=query_vector,
+        embedding_model=model,
+        corpus_version=version,
+        answer=answer,
+        citations=citations,
+        hits=0
+    )
+
+def _to_hit(row):
+    if row is None:
+        ANSWER_CACHE_REQUESTS.labels(result="miss").inc()
+        return None
+    entry, distance = row
+    similarity = 1 - distance
+    ANSWER_CACHE_SIMILARITY_SEEN.observe(similarity)
+    if similarity < ANSWER_CACHE_SIMILARITY:
+        ANSWER_CACHE_REQUESTS.labels(result="miss").inc()
+        return None
+    ANSWER_CACHE_REQUESTS.labels(result="hit").inc()
+    return {"id": entry.id, "answer": entry.answer, "citations": entry.citations or []}
+
+def lookup_answer(user_id, query_vector, model):
+    """Closest cached answer to `query_vector` (embedded with `model`), or None."""
+    try:
+        version = corpus_version(user_id)
+        with SessionLocal() as db:
+            hit = _to_hit(db.execute(_lookup_query(user_id, query_vector, model, version)).first())
+            if hit:
+                db.execute(_touch(hit["id"]))
+                db.commit()
+        return hit
+    except Exception as e:
+        ANSWER_CACHE_REQUESTS.labels(result="error").inc()
+        logger.warning(f"Answer cache lookup failed: {e}")
+        return None
+
+async def alookup_answer(user_id, query_vector, model):
+    try:
+        version = await acorpus_version(user_id)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(_lookup_query(user_id, query_vector, model, version))
+            hit = _to_hit(result.first())
+            if hit:
+                await db.execute(_touch(hit["id"]))
+                await db.commit()
+        return hit
+    except Exception as e:
+        ANSWER_CACHE_REQUESTS.labels(result="error").inc()
+        logger.warning(f"Answer cache lookup failed: {e}")
+        return None
+
+def _eligible(state):
+    """
+    Only safe, standalone questions are cached. A follow-up ("and the second one?")
+    means something else in every conversation, and the key is the question alone.
+    """
+    return ANSWER_CACHE_ENABLED and state.get("is_safe") and not state.get("history")
+
+def cache_applies(state):
+    return _eligible(state) and state.get("query_embedding") is not None
+
+def _needs_vector(state):
+    return _eligible(state) and state.get("query_embedding") is None
+
+def _embed_failed(e):
+    ANSWER_CACHE_REQUESTS.labels(result="error").inc()
+    logger.warning(f"Answer cache embedding failed: {e}")
+
+def _apply_hit(state, hit):
+    state["cached"] = True
+    state["debug"] = hit["answer"]
+    state["citations"] = hit["citations"]
+    return state
+
+def answer_cache_agent(state):
+    """
+    Runs after prefetch, once the question is known to be safe: a hit answers it
+    without the router or any answering node. The retriever's query vector is reused;
+    the lexical fast path doesn't embed, so the question is embedded here (a cheap
+    embedding cache hit for repeats) and the vector kept for the store after the answer.
+    """
+    if _needs_vector(state):
+        try:
+            model = state.get("embedding_model") or active_model()
+            state["query_embedding"] = client_for(model).embed_query(state["question"])
+            state["embedding_model"] = model
+        except Exception as e:
+            _embed_failed(e)
+    if not cache_applies(state):
+        return state
+    hit = lookup_answer(state["user_id"], state["query_embedding"], state["embedding_model"])
+    return _apply_hit(state, hit) if hit else state
+
+async def aanswer_cache_agent(state):
+    if _needs_vector(state):
+        try:
+            model = state.get("embedding_model") or await aactive_model()
+            state["query_embedding"] = await client_for(model).aembed_query(state["question"])
+            state["embedding_model"] = model
+        except Exception as e:
+            _embed_failed(e)
+    if not cache_applies(state):
+        return state
+    hit = await alookup_answer(state["user_id"], state["query_embedding"], state["embedding_model"])
+    return _apply_hit(state, hit) if hit else state
+
+def store_answer(question, user_id, query_vector, model, answer, citations):
+    try:
+        version = corpus_version(user_id)
+        with SessionLocal() as db:
+            db.add(_entry(question, user_id, query_vector, model, version, answer, citations))
+            db.flush()
+            db.execute(_evict(user_id, version))
+            db.commit()
+    except Exception as e:
+        logger.warning(f"Answer cache store failed: {e}")
+
+async def astore_answer(question, user_id, query_vector, model, answer, citations):
+    try:
+        version = await acorpus_version(user_id)
+        async with AsyncSessionLocal() as db:
+            db.add(_entry(question, user_id, query_vector, model, version, answer, citations))
+            await db.flush()
+            await db.execute(_evict(user_id, version))
+            await db.commit()
+    except Exception as e:
+        logger.warning(f"Answer cache store failed: {e}")
+
+def invalidate_answers(user_id):
+    """Called when a scope's documents change; user_id None invalidates every user (public docs)."""
+    try:
+        bump_corpus_version(user_id)
+        if user_id is not None:
+            # Entries of this user can never match again, free them right away
+            with SessionLocal() as db:
+                db.execute(delete(AnswerCache).where(AnswerCache.user_id == user_id))
+                db.commit()
+    except Exception as e:
+        # Stale entries still expire through the TTL
+        logger.warning(f"Answer cache invalidation failed: {e}")
+
+def replay_chunks(answer):
+    """Splits a cached answer into word-sized pieces so it streams like a live one."""
+    return re.findall(r"\S+\s*|\s+", answer or "")
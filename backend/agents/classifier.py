@@ -0,0 +1,103 @@
+import os
+import json
+import hashlib
+from langchain_core.messages import SystemMessage, HumanMessage
+from backend.agents.llm import classifier_llm
+from backend.agents.safety import safety_agent, asafety_agent, UNSAFE_MESSAGE
+from backend.cache import redis_client, async_redis_client
+
+# "combined": one JSON call decides safety + intent; "separate": safety and router each call the LLM
+CLASSIFIER_MODE = os.getenv("CLASSIFIER_MODE", "combined")
+VERDICT_CACHE_TTL = int(os.getenv("VERDICT_CACHE_TTL", "86400"))
+
+SYSTEM_PROMPT = (
+    "You classify user input for a coding assistant. Respond with JSON only, in the form "
+    '{"safe": true|false, "intent": "code"|"qa"}.\n'
+    "safe=false for: malware, hacking, violence, illegal acts, or harmful content.\n"
+    "intent=code when the user wants code written, debugged, explained technically, or modified.\n"
+    "intent=qa when the user asks a general question, wants an explanation from documents, or is chatting."
+)
+
+def normalize_question(question):
+    return " ".join(question.lower().split())
+
+def verdict_cache_key(question):
+    return f"verdict:{hashlib.sha256(normalize_question(question).encode()).hexdigest()}"
+
+def parse_verdict(text):
+    """Parses the classifier's JSON reply; returns None if it is not a usable verdict."""
+    try:
+        data = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("safe"), bool):
+        return None
+    intent = str(data.get("intent", "")).lower()
+    return {"safe": data["safe"], "intent": intent if intent in ("code", "qa") else None}
+
+def _messages(question):
+    return [
+        SystemMessage(content=SYSTEM_PROMPT),
+        HumanMessage(content=question)
+    ]
+
+def classify(question):
+    """Single length-capped call returning {"safe": bool, "intent": "code"|"qa"|None}."""
+    cache_key = verdict_cache_key(question)
+    try:
+        cached = redis_client.get(cache_key)
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"Redis Cache Error: {e}")
+
+    verdict = parse_verdict(classifier_llm.invoke(_messages(question)).content)
+    if verdict is None:
+        return None
+
+    try:
+        redis_client.setex(cache_key, VERDICT_CACHE_TTL, json.dumps(verdict))
+    except Exception as e:
+        print(f"Redis Save Error: {e}")
+    return verdict
+
+async def aclassify(question):
+    cache_key = verdict_cache_key(question)
+    try:
+        cached = await async_redis_client.get(cache_key)
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"Redis Cache Error: {e}")
+
+    response = await classifier_llm.ainvoke(_messages(question))
+    verdict = parse_verdict(response.content)
+    if verdict is None:
+        return None
+
+    try:
+        await async_redis_client.setex(cache_key, VERDICT_CACHE_TTL, json.dumps(verdict))
+    except Exception as e:
+        print(f"Redis Save Error: {e}")
+    return verdict
+
+def _apply_verdict(state, verdict):
+    state["is_safe"] = verdict["safe"]
+    if verdict["intent"]:
+        state["intent"] = verdict["intent"]
+    if not state["is_safe"]:
+        state["debug"] = UNSAFE_MESSAGE
+    return state
+
+def classify_agent(state):
+    verdict = classify(state["question"])
+    if verdict is None:
+        # Unparseable reply: fall back to the dedicated safety prompt, router decides intent
+        return safety_agent(state)
+    return _apply_verdict(state, verdict)
+
+async def aclassify_agent(state):
+    verdict = await aclassify(state["question"])
+    if verdict is None:
+        return await asafety_agent(state)
+    return _apply_verdict(state, verdict)
@@ -1,20 +1,23 @@
-from langchain_core.messages import SystemMessage, HumanMessage
-from backend.agents.llm import llm
+from backend.agents.prompt_budget import bounded_messages
+from backend.agents.llm import llm, PRIORITY_GENERATE
+
+SYSTEM_PROMPT = (
+    "You are an expert Python developer. "
+    "Write clean, efficient, and error-free code based on the provided plan. "
+    "Output ONLY the python code within markdown code blocks."
+)
+
+def _messages(state):
+    # The plan is cut to the coder budget so a long one can't overflow the context window
+    return bounded_messages("coder", SYSTEM_PROMPT, "Here is the plan:\n{body}\n\nWrite the code.", state["plan"])
 
 def coder_agent(state):
-    system_prompt = (
-        "You are an expert Python developer. "
-        "Write clean, efficient, and error-free code based on the provided plan. "
-        "Output ONLY the python code within markdown code blocks."
-    )
-    
-    user_message = f"Here is the plan:\n{state['plan']}\n\nWrite the code."
-    
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_message)
-    ]
-    
-    response = llm.invoke(messages)
+    # Long generation: queued behind classifier and QA calls when Ollama is saturated
+    response = llm.invoke(_messages(state), priority=PRIORITY_GENERATE)
+    state["code"] = response.content
+    return state
+
+async def acoder_agent(state):
+    response = await llm.ainvoke(_messages(state), priority=PRIORITY_GENERATE)
     state["code"] = response.content
     return state
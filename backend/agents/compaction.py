@@ -0,0 +1,128 @@
+import os
+import re
+from sqlalchemy import select, or_, and_
+from backend.models import Document
+from backend.document_queries import retrieval_columns
+
+# Merge adjacent hits of one file and strip the splitter's overlap before prompting
+COMPACT_CONTEXT = os.getenv("COMPACT_CONTEXT", "1") == "1"
+# Also fetch the following chunk when a hit stops mid-sentence
+COMPACT_PULL_NEXT = os.getenv("COMPACT_PULL_NEXT", "0") == "1"
+# chunk_docs uses chunk_overlap=100; leave room for whitespace the splitter trims
+MAX_OVERLAP = 200
+# Shorter matches are coincidences ("the "), not splitter overlap
+MIN_OVERLAP = 8
+
+SENTENCE_END = re.compile(r"([.!?:;]['\")\]]?|```)\s*$")
+FIRST_SENTENCE = re.compile(r"^.*?[.!?](?=\s|$)", re.DOTALL)
+
+def _key(doc):
+    return (getattr(doc, "tenant_id", None), doc.source)
+
+def overlap(a, b):
+    """Length of the longest suffix of `a` that is also a prefix of `b`."""
+    for n in range(min(len(a), len(b), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+def is_cut_off(text):
+    return not SENTENCE_END.search(text or "")
+
+def _join(text, nxt, pulled):
+    rest = nxt[overlap(text, nxt):]
+    if pulled:
+        # Only the rest of the interrupted sentence, not the whole neighbour
+        match = FIRST_SENTENCE.match(rest)
+        rest = match.group(0) if match else rest
+    if not rest:
+        return text
+    separator = "" if text.endswith((" ", "\n")) or rest.startswith((" ", "\n")) else " "
+    return text + separator + rest
+
+def _runs(entries):
+    """Splits one file's entries (sorted by chunk_index) into runs of consecutive chunks."""
+    run = []
+    for entry in entries:
+        doc = entry[1]
+        if run and (doc.chunk_index is None or run[-1][1].chunk_index is None or doc.chunk_index != run[-1][1].chunk_index + 1):
+            yield run
+            run = []
+        run.append(entry)
+    if run:
+        yield run
+
+def compact(docs, neighbours=()):
+    """
+    Merges ranked hits that are neighbouring chunks of the same file into one passage,
+    with the splitter overlap removed. Returns (chunks, citations): passages in the
+    rank order of their best hit, and every (source, page) they span.
+    """
+    seen = set()
+    groups = {}
+    for rank, doc in [(r, d) for r, d in enumerate(docs)] + [(None, d) for d in neighbours]:
+        if doc.id in seen:
+            continue
+        seen.add(doc.id)
+        groups.setdefault(_key(doc), []).append((rank, doc))
+
+    passages = []
+    for entries in groups.values():
+        entries.sort(key=lambda e: (e[1].chunk_index is None, e[1].chunk_index or 0))
+        for run in _runs(entries):
+            ranks = [rank for rank, _ in run if rank is not None]
+            if not ranks:
+                # A neighbour whose hit didn't make it in: nothing to complete
+                continue
+            text = run[0][1].content or ""
+            for rank, doc in run[1:]:
+                text = _join(text, doc.content or "", pulled=rank is None)
+            citations = []
+            for _, doc in run:
+                citation = {"source": doc.source, "page": doc.page}
+                if citation not in citations:
+                    citations.append(citation)
+            passages.append((min(ranks), text, citations))
+
+    passages.sort(key=lambda p: p[0])
+    chunks = [text for _, text, _ in passages]
+    citations = []
+    for _, _, passage_citations in passages:
+        citations.extend(c for c in passage_citations if c not in citations)
+    return chunks, citations
+
+def next_chunk_keys(docs):
+    """(tenant_id, source, chunk_index) of the chunk after every hit that stops mid-sentence."""
+    present = {(_key(d), d.chunk_index) for d in docs}
+    keys = []
+    for doc in docs:
+        if doc.chunk_index is None or not is_cut_off(doc.content):
+            continue
+        if (_key(doc), doc.chunk_index + 1) in present:
+            continue
+        keys.append((doc.tenant_id, doc.source, doc.chunk_index + 1))
+    return keys
+
+def neighbours_query(keys):
+    return select(Document).options(retrieval_columns()).filter(
+        Document.is_deleted == False,
+        or_(*[
+            and_(Document.tenant_id == tenant_id, Document.source == source, Document.chunk_index == chunk_index)
+            for tenant_id, source, chunk_index in keys
+        ])
+    )
+
+def fetch_neighbours(db, docs):
+    if not COMPACT_CONTEXT or not COMPACT_PULL_NEXT:
+        return []
+    keys = next_chunk_keys(docs)
+    return db.execute(neighbours_query(keys)).scalars().all() if keys else []
+
+async def afetch_neighbours(db, docs):
+    if not COMPACT_CONTEXT or not COMPACT_PULL_NEXT:
+        return []
+    keys = next_chunk_keys(docs)
+    if not keys:
+        return []
+    result = await db.execute(neighbours_query(keys))
+    return result.scalars().all()
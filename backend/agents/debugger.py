@@ -1,32 +1,23 @@
-import sys
-from langchain_core.messages import SystemMessage, HumanMessage
+from backend.agents.prompt_budget import bounded_messages
 from backend.agents.llm import llm
 
-def debug_agent(state):
-    system_prompt = (
-        "You are a senior QA engineer. "
-        "Analyze the provided code for syntax errors, logical flaws, and potential runtime issues. "
-        "Provide a concise summary of your findings. If the code is correct, confirm it."
-    )
-    
+SYSTEM_PROMPT = (
+    "You are a senior QA engineer. "
+    "Analyze the provided code for syntax errors, logical flaws, and potential runtime issues. "
+    "Provide a concise summary of your findings. If the code is correct, confirm it."
+)
+
+def _messages(state):
     code = state.get("code", "No code provided.")
-    user_message = f"Here is the code to review:\n{code}"
-    
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_message)
-    ]
-    
-    full_response = ""
-    try:
-        for chunk in llm.stream(messages):
-            token = chunk.content
-            if token:
-                full_response += token
-                # Yield partial update for graph.stream
-                yield {"debug": token}
-    except Exception as e:
-        pass
-    
-    # Ensure final state is updated
-    return {"debug": full_response}
+    return bounded_messages("debugger", SYSTEM_PROMPT, "Here is the code to review:\n{body}", code)
+
+def debug_agent(state):
+    # Tokens reach the client through graph.stream(stream_mode="messages")
+    response = llm.invoke(_messages(state))
+    state["debug"] = response.content
+    return state
+
+async def adebug_agent(state):
+    response = await llm.ainvoke(_messages(state))
+    state["debug"] = response.content
+    return state
@@ -0,0 +1,188 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from prometheus_client import Counter
+from backend.cache import redis_client, async_redis_client
+
+# Entries kept in each process before the least recently used one is dropped
+EMBEDDING_CACHE_LOCAL_SIZE = int(os.getenv("EMBEDDING_CACHE_LOCAL_SIZE", "2048"))
+# Entries kept in Redis per model; the least recently used are trimmed on insert.
+# An entry is 4 bytes per dimension: 5000 legacy 4096-dim vectors are ~80 MB
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "5000"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+
+EMBEDDING_CACHE_REQUESTS = Counter(
+    "embedding_cache_requests_total",
+    "Text embeddings served per cache tier",
+    ["model", "tier"]
+)
+
+WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text):
+    # Case is kept: embeddings of "Error" and "error" genuinely differ
+    return WHITESPACE.sub(" ", text or "").strip()
+
+def _pack(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+def _unpack(raw):
+    return np.frombuffer(raw, dtype=np.float32).tolist()
+
+def _as_stored(vector):
+    # Fresh vectors get the float32 rounding of cached ones, so results don't depend on cache state
+    return _unpack(_pack(vector))
+
+def uncached(client):
+    """
+    The model behind a CachedEmbeddings. Bulk ingestion embeds through this: its
+    vectors are kept in chunk_embeddings and would only push queries out of Redis.
+    """
+    return client.client if isinstance(client, CachedEmbeddings) else client
+
+class CachedEmbeddings:
+    """
+    Wraps an embeddings client with a per-process LRU in front of a Redis LRU,
+    keyed by model + normalized text. Stored vectors never go stale, a given model
+    always embeds the same text the same way, so there is no TTL.
+    """
+
+    def __init__(self, client, model):
+        self.client = client
+        self.model = model
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self.lru_key = f"emb:lru:{model}"
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _key(self, text):
+        return f"emb:{self.model}:{hashlib.sha256(normalize_text(text).encode()).hexdigest()}"
+
+    def _local_get(self, key):
+        with self.lock:
+            vector = self.local.get(key)
+            if vector is not None:
+                self.local.move_to_end(key)
+            return vector
+
+    def _local_put(self, key, vector):
+        with self.lock:
+            self.local[key] = vector
+            self.local.move_to_end(key)
+            while len(self.local) > EMBEDDING_CACHE_LOCAL_SIZE:
+                self.local.popitem(last=False)
+
+    def _count(self, tier, n=1):
+        if n:
+            EMBEDDING_CACHE_REQUESTS.labels(model=self.model, tier=tier).inc(n)
+
+    def _split(self, keys):
+        """Local hits in place, returns the indexes still missing."""
+        found = [self._local_get(key) for key in keys]
+        self._count("local", sum(v is not None for v in found))
+        return found, [i for i, v in enumerate(found) if v is None]
+
+    def _apply_remote(self, keys, found, missing, raws):
+        still_missing = []
+        hits = {}
+        for i, raw in zip(missing, raws):
+            if raw is None:
+                still_missing.append(i)
+            else:
+                found[i] = _unpack(raw)
+                hits[keys[i]] = time.time()
+                self._local_put(keys[i], found[i])
+        self._count("redis", len(hits))
+        self._count("miss", len(still_missing))
+        return still_missing, hits
+
+    def _store_commands(self, pipe, entries, touched):
+        now = time.time()
+        for key, vector in entries:
+            pipe.set(key, _pack(vector))
+        scores = dict(touched)
+        scores.update({key: now for key, _ in entries})
+        if scores:
+            pipe.zadd(self.lru_key, scores)
+
+    def embed_documents(self, texts):
+        if not EMBEDDING_CACHE_ENABLED:
+            return self.client.embed_documents(texts)
+        keys = [self._key(text) for text in texts]
+        found, missing = self._split(keys)
+        touched = {}
+        if missing:
+            try:
+                raws = redis_client.mget([keys[i] for i in missing])
+            except Exception as e:
+                print(f"Redis Cache Error: {e}")
+                raws = [None] * len(missing)
+            missing, touched = self._apply_remote(keys, found, missing, raws)
+
+        computed = self.client.embed_documents([texts[i] for i in missing]) if missing else []
+        for i, vector in zip(missing, computed):
+            found[i] = vector = _as_stored(vector)
+            self._local_put(keys[i], vector)
+
+        if computed or touched:
+            try:
+                pipe = redis_client.pipeline(transaction=False)
+                self._store_commands(pipe, [(keys[i], found[i]) for i in missing], touched)
+                pipe.zcard(self.lru_key)
+                size = pipe.execute()[-1]
+                # Evicts the least recently used vectors beyond the cap
+                excess = size - EMBEDDING_CACHE_MAX_ENTRIES
+                if excess > 0:
+                    evicted = [k.decode() if isinstance(k, bytes) else k for k, _ in redis_client.zpopmin(self.lru_key, excess)]
+                    redis_client.delete(*evicted)
+            except Exception as e:
+                print(f"Redis Save Error: {e}")
+        return found
+
+    async def aembed_documents(self, texts):
+        if not EMBEDDING_CACHE_ENABLED:
+            return await self.client.aembed_documents(texts)
+        keys = [self._key(text) for text in texts]
+        found, missing = self._split(keys)
+        touched = {}
+        if missing:
+            try:
+                raws = await async_redis_client.mget([keys[i] for i in missing])
+            except Exception as e:
+                print(f"Redis Cache Error: {e}")
+                raws = [None] * len(missing)
+            missing, touched = self._apply_remote(keys, found, missing, raws)
+
+        computed = await self.client.aembed_documents([texts[i] for i in missing]) if missing else []
+        for i, vector in zip(missing, computed):
+            found[i] = vector = _as_stored(vector)
+            self._local_put(keys[i], vector)
+
+        if computed or touched:
+            try:
+                pipe = async_redis_client.pipeline(transaction=False)
+                self._store_commands(pipe, [(keys[i], found[i]) for i in missing], touched)
+                pipe.zcard(self.lru_key)
+                size = (await pipe.execute())[-1]
+                # Evicts the least recently used vectors beyond the cap
+                excess = size - EMBEDDING_CACHE_MAX_ENTRIES
+                if excess > 0:
+                    evicted = [k.decode() if isinstance(k, bytes) else k for k, _ in await async_redis_client.zpopmin(self.lru_key, excess)]
+                    await async_redis_client.delete(*evicted)
+            except Exception as e:
+                print(f"Redis Save Error: {e}")
+        return found
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0] if EMBEDDING_CACHE_ENABLED else self.client.embed_query(text)
+
+    async def aembed_query(self, text):
+        if not EMBEDDING_CACHE_ENABLED:
+            return await self.client.aembed_query(text)
+        return (await self.aembed_documents([text]))[0]
@@ -1,7 +1,81 @@
+import os
+import time
 from langchain_ollama import OllamaEmbeddings
+from sqlalchemy import select, func
+from backend.agents.llm import OLLAMA_BASE_URL
+from backend.agents.embedding_cache import CachedEmbeddings
+from backend.database import SessionLocal, AsyncSessionLocal
+from backend.models import Document
 
-# Use the same base_url as the LLM for consistency within docker network
-embeddings = OllamaEmbeddings(
-    model="llama3:8b-instruct-q4_0",
-    base_url="http://ollama:11434"
-)
+# Legacy model, fills documents.embedding (4096 dims, too wide for an ANN index)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "llama3:8b-instruct-q4_0")
+# Dedicated embedding model for documents.embedding_v2, e.g. nomic-embed-text (768).
+# Empty disables the second column entirely.
+EMBEDDING_V2_MODEL = os.getenv("EMBEDDING_V2_MODEL", "")
+# legacy | v2 | auto (v2 as soon as every live chunk has a v2 vector)
+RETRIEVAL_EMBEDDING = os.getenv("RETRIEVAL_EMBEDDING", "auto")
+COVERAGE_CHECK_INTERVAL = int(os.getenv("EMBEDDING_COVERAGE_CHECK_INTERVAL", "60"))
+
+# Use the same base_url as the LLM for consistency within docker network.
+# Both clients sit behind the shared embedding cache (retrieval, ingestion, router).
+embeddings = CachedEmbeddings(OllamaEmbeddings(
+    model=EMBEDDING_MODEL,
+    base_url=OLLAMA_BASE_URL
+), EMBEDDING_MODEL)
+
+embeddings_v2 = CachedEmbeddings(OllamaEmbeddings(
+    model=EMBEDDING_V2_MODEL,
+    base_url=OLLAMA_BASE_URL
+), EMBEDDING_V2_MODEL) if EMBEDDING_V2_MODEL else None
+
+_coverage = {"complete": False, "checked_at": None}
+
+def client_for(model):
+    return embeddings_v2 if embeddings_v2 is not None and model == EMBEDDING_V2_MODEL else embeddings
+
+def is_v2(model):
+    return embeddings_v2 is not None and model == EMBEDDING_V2_MODEL
+
+def _missing_v2_query():
+    # Served by the partial index on rows still waiting for the re-embed job
+    return select(func.count(Document.id)).filter(
+        Document.embedding_v2 == None,
+        Document.is_deleted == False
+    )
+
+def _coverage_due():
+    checked_at = _coverage["checked_at"]
+    return checked_at is None or time.monotonic() - checked_at > COVERAGE_CHECK_INTERVAL
+
+def _record_coverage(missing):
+    _coverage["complete"] = missing == 0
+    _coverage["checked_at"] = time.monotonic()
+
+def _pick_model():
+    if embeddings_v2 is None or RETRIEVAL_EMBEDDING == "legacy":
+        return EMBEDDING_MODEL
+    if RETRIEVAL_EMBEDDING == "v2" or _coverage["complete"]:
+        return EMBEDDING_V2_MODEL
+    return EMBEDDING_MODEL
+
+def active_model():
+    """Embedding model retrieval should query with right now."""
+    if embeddings_v2 is not None and RETRIEVAL_EMBEDDING == "auto" and not _coverage["complete"] and _coverage_due():
+        try:
+            with SessionLocal() as db:
+                _record_coverage(db.execute(_missing_v2_query()).scalar())
+        except Exception as e:
+            print(f"Embedding Coverage Error: {e}")
+            _coverage["checked_at"] = time.monotonic()
+    return _pick_model()
+
+async def aactive_model():
+    if embeddings_v2 is not None and RETRIEVAL_EMBEDDING == "auto" and not _coverage["complete"] and _coverage_due():
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(_missing_v2_query())
+                _record_coverage(result.scalar())
+        except Exception as e:
+            print(f"Embedding Coverage Error: {e}")
+            _coverage["checked_at"] = time.monotonic()
+    return _pick_model()
@@ -1,7 +1,20 @@
 from sqlalchemy import select
-from backend.database import SessionLocal
+from backend.database import SessionLocal, AsyncSessionLocal
 from backend.models import Message
 
+def _history_query(conversation_id):
+    # Fetch last 6 messages for context (context reduction)
+    return select(Message).filter(
+        Message.conversation_id == conversation_id
+    ).order_by(Message.created_at.desc()).limit(6)
+
+def _to_history(msgs):
+    # Reverse to get chronological order
+    return [
+        {"role": m.role, "content": m.content} 
+        for m in reversed(msgs)
+    ]
+
 def history_loader(state):
     conversation_id = state.get("conversation_id")
     if not conversation_id:
@@ -9,19 +22,19 @@ def history_loader(state):
         return state
 
     with SessionLocal() as db:
-        # Fetch last 6 messages for context (context reduction)
-        msgs = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.created_at.desc()).limit(6).all()
-        
-        # Reverse to get chronological order
-        msgs.reverse()
-        
-        history = [
-            {"role": m.role, "content": m.content} 
-            for m in msgs
-        ]
-        
-        state["history"] = history
+        msgs = db.execute(_history_query(conversation_id)).scalars().all()
+        state["history"] = _to_history(msgs)
+
+    return state
+
+async def ahistory_loader(state):
+    conversation_id = state.get("conversation_id")
+    if not conversation_id:
+        state["history"] = []
+        return state
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(_history_query(conversation_id))
+        state["history"] = _to_history(result.scalars().all())
 
     return state
@@ -1,7 +1,287 @@
+import os
+import time
+import heapq
+import asyncio
+import hashlib
+import itertools
+import threading
+import weakref
+from concurrent.futures import Future
 from langchain_ollama import ChatOllama
+from prometheus_client import Counter, Gauge, Histogram
 
-llm = ChatOllama(
-    model="llama3:8b-instruct-q4_0",
-    base_url="http://ollama:11434",
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3:8b-instruct-q4_0")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://ollama:11434")
+
+# Generations allowed to hit Ollama at once from this process; the rest queue by priority
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# Identical prompts that are already in flight share one generation
+LLM_COALESCE = os.getenv("LLM_COALESCE", "1") == "1"
+
+# Lower value = served first
+PRIORITY_CLASSIFY = 0
+PRIORITY_ANSWER = 1
+PRIORITY_GENERATE = 2
+PRIORITY_NAMES = {PRIORITY_CLASSIFY: "classify", PRIORITY_ANSWER: "answer", PRIORITY_GENERATE: "generate"}
+
+LLM_REQUESTS = Counter("llm_gateway_requests_total", "LLM calls through the gateway", ["priority"])
+LLM_COALESCED = Counter("llm_gateway_coalesced_total", "LLM calls served by an identical in-flight call", ["priority"])
+LLM_QUEUE_DEPTH = Gauge("llm_gateway_queue_depth", "LLM calls waiting for a generation slot", ["priority"])
+LLM_QUEUE_WAIT = Histogram("llm_gateway_queue_wait_seconds", "Time spent waiting for a generation slot", ["priority"])
+LLM_INFLIGHT = Gauge("llm_gateway_inflight", "LLM generations currently running")
+
+class PriorityGate:
+    """
+    Counting semaphore that wakes the highest-priority waiter first. Threads and
+    coroutines on any event loop queue in the same heap, so sync and async callers
+    share one budget of `limit` slots.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiters = []
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+
+    def acquire(self, priority):
+        with self.lock:
+            if self.active < self.limit and not self.waiters:
+                self.active += 1
+                return
+            event = threading.Event()
+            heapq.heappush(self.waiters, (priority, next(self.seq), event.set))
+        # The releasing thread hands its slot straight to us
+        event.wait()
+
+    async def aacquire(self, priority):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.active < self.limit and not self.waiters:
+                self.active += 1
+                return
+            future = loop.create_future()
+            entry = (priority, next(self.seq), lambda: loop.call_soon_threadsafe(self._grant, future))
+            heapq.heappush(self.waiters, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self.lock:
+                queued = entry in self.waiters
+                if queued:
+                    self.waiters.remove(entry)
+                    heapq.heapify(self.waiters)
+            if not queued and future.done() and not future.cancelled():
+                # Slot was handed over just before we were cancelled: pass it on
+                self.release()
+            # Otherwise a handover still in flight finds the future cancelled and passes it on
+            future.cancel()
+            raise
+
+    def _grant(self, future):
+        if future.done():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self):
+        with self.lock:
+            if self.waiters:
+                _, _, wake = heapq.heappop(self.waiters)
+            else:
+                self.active -= 1
+                return
+        wake()
+
+def _prompt_key(model, input, kwargs):
+    if isinstance(input, str):
+        parts = [input]
+    else:
+        parts = [f"{getattr(m, 'type', '')}:{getattr(m, 'content', m)}" for m in input]
+    raw = "\x1e".join([str(id(model)), repr(sorted(kwargs.items()))] + parts)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+class LLMGateway:
+    """
+    Front door to Ollama for every agent: coalesces identical in-flight prompts,
+    caps concurrent generations and serves queued calls by priority.
+    Exposes the invoke/ainvoke/stream/astream surface the agents already use.
+    """
+
+    # One budget for threads and event loops alike
+    _gate = PriorityGate(LLM_MAX_CONCURRENCY)
+    _inflight = {}
+    _inflight_lock = threading.Lock()
+    # Per event loop: in-flight futures
+    _loop_inflight = weakref.WeakKeyDictionary()
+
+    def __init__(self, model, priority=PRIORITY_ANSWER):
+        self.model = model
+        self.priority = priority
+
+    def __getattr__(self, name):
+        # Anything else (with_structured_output, bind, ...) goes straight to the model
+        return getattr(self.model, name)
+
+    def _label(self, priority):
+        return PRIORITY_NAMES.get(priority, str(priority))
+
+    def _async_inflight(self):
+        return self._loop_inflight.setdefault(asyncio.get_running_loop(), {})
+
+    def _acquire(self, label, priority):
+        start = time.perf_counter()
+        LLM_QUEUE_DEPTH.labels(priority=label).inc()
+        try:
+            self._gate.acquire(priority)
+        finally:
+            LLM_QUEUE_DEPTH.labels(priority=label).dec()
+        LLM_QUEUE_WAIT.labels(priority=label).observe(time.perf_counter() - start)
+        LLM_INFLIGHT.inc()
+
+    def _release(self):
+        LLM_INFLIGHT.dec()
+        self._gate.release()
+
+    async def _aacquire(self, label, priority):
+        start = time.perf_counter()
+        LLM_QUEUE_DEPTH.labels(priority=label).inc()
+        try:
+            await self._gate.aacquire(priority)
+        finally:
+            LLM_QUEUE_DEPTH.labels(priority=label).dec()
+        LLM_QUEUE_WAIT.labels(priority=label).observe(time.perf_counter() - start)
+        LLM_INFLIGHT.inc()
+
+    def invoke(self, input, config=None, *, priority=None, **kwargs):
+        priority = self.priority if priority is None else priority
+        label = self._label(priority)
+        LLM_REQUESTS.labels(priority=label).inc()
+
+        key = _prompt_key(self.model, input, kwargs) if LLM_COALESCE else None
+        if key:
+            with self._inflight_lock:
+                leader = self._inflight.get(key)
+                if leader is None:
+                    future = self._inflight[key] = Future()
+            if leader is not None:
+                LLM_COALESCED.labels(priority=label).inc()
+                return leader.result()
+
+        try:
+            self._acquire(label, priority)
+            try:
+                result = self.model.invoke(input, config, **kwargs)
+            finally:
+                self._release()
+        except BaseException as e:
+            if key:
+                future.set_exception(e)
+            raise
+        finally:
+            if key:
+                with self._inflight_lock:
+                    self._inflight.pop(key, None)
+
+        if key:
+            future.set_result(result)
+        return result
+
+    async def ainvoke(self, input, config=None, *, priority=None, **kwargs):
+        priority = self.priority if priority is None else priority
+        label = self._label(priority)
+        LLM_REQUESTS.labels(priority=label).inc()
+        inflight = self._async_inflight()
+
+        key = _prompt_key(self.model, input, kwargs) if LLM_COALESCE else None
+        while key and (leader := inflight.get(key)) is not None:
+            LLM_COALESCED.labels(priority=label).inc()
+            try:
+                # shield: a cancelled follower must not cancel the leader's generation
+                return await asyncio.shield(leader)
+            except asyncio.CancelledError:
+                # The leader was cancelled (a losing speculative branch, a client gone),
+                # not us: look again, the first follower through takes over the call
+                if leader.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+        if key:
+            future = inflight[key] = asyncio.get_running_loop().create_future()
+
+        try:
+            await self._aacquire(label, priority)
+            try:
+                result = await self.model.ainvoke(input, config, **kwargs)
+            finally:
+                self._release()
+        except BaseException as e:
+            if key:
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # Mark retrieved so an unawaited follower-less future doesn't warn
+                    future.exception()
+            raise
+        finally:
+            if key:
+                inflight.pop(key, None)
+
+        if key:
+            future.set_result(result)
+        return result
+
+    def stream(self, input, config=None, *, priority=None, cancel=None, **kwargs):
+        """`cancel`: threading.Event; once set while the call waits for a slot, no generation starts."""
+        priority = self.priority if priority is None else priority
+        label = self._label(priority)
+        LLM_REQUESTS.labels(priority=label).inc()
+        self._acquire(label, priority)
+        try:
+            if cancel is not None and cancel.is_set():
+                return
+            yield from self.model.stream(input, config, **kwargs)
+        finally:
+            self._release()
+
+    async def astream(self, input, config=None, *, priority=None, **kwargs):
+        priority = self.priority if priority is None else priority
+        label = self._label(priority)
+        LLM_REQUESTS.labels(priority=label).inc()
+        await self._aacquire(label, priority)
+        try:
+            async for chunk in self.model.astream(input, config, **kwargs):
+                yield chunk
+        finally:
+            self._release()
+
+llm = LLMGateway(ChatOllama(
+    model=LLM_MODEL,
+    base_url=OLLAMA_BASE_URL,
     streaming=True
-)
+))
+
+# Classification only needs a one-word label or a tiny JSON object,
+# so cap generation instead of letting llama3 ramble.
+label_llm = LLMGateway(ChatOllama(
+    model=LLM_MODEL,
+    base_url=OLLAMA_BASE_URL,
+    temperature=0,
+    num_predict=int(os.getenv("LABEL_NUM_PREDICT", "4"))
+), priority=PRIORITY_CLASSIFY)
+
+classifier_llm = LLMGateway(ChatOllama(
+    model=LLM_MODEL,
+    base_url=OLLAMA_BASE_URL,
+    temperature=0,
+    format="json",
+    num_predict=int(os.getenv("CLASSIFIER_NUM_PREDICT", "32"))
+), priority=PRIORITY_CLASSIFY)
+
+# Condenses conversation turns that no longer fit the prompt budget
+summary_llm = LLMGateway(ChatOllama(
+    model=LLM_MODEL,
+    base_url=OLLAMA_BASE_URL,
+    temperature=0,
+    num_predict=int(os.getenv("SUMMARY_NUM_PREDICT", "160"))
+), priority=PRIORITY_CLASSIFY)
@@ -1,39 +1,50 @@
-from backend.database import SessionLocal
+from backend.database import SessionLocal, AsyncSessionLocal
 from backend.models import Chat, Message
 
+def _records(state):
+    conversation_id = state.get("conversation_id")
+    user_id = state.get("user_id")
+
+    # 1. Save technical trace
+    chat = Chat(
+        question=state.get("question", ""),
+        plan=state.get("plan"),
+        code=state.get("code"),
+        debug=state.get("debug"),
+        user_id=user_id,
+        conversation_id=conversation_id
+    )
+
+    # 2. Save Conversation Messages for history recall
+    # Save User Message
+    user_msg = Message(
+        conversation_id=conversation_id,
+        role="user",
+        content=state.get("question")
+    )
+
+    # Save Assistant Message (what was streamed: code + review, or the QA answer)
+    answer = state.get("debug")
+    if state.get("code") and state.get("is_safe"):
+        answer = f"{state['code']}\n\n{answer or ''}".strip()
+    asst_msg = Message(
+        conversation_id=conversation_id,
+        role="assistant",
+        content=answer
+    )
+
+    return [chat, user_msg, asst_msg]
+
 def save_memory(state):
     with SessionLocal() as db:
-        conversation_id = state.get("conversation_id")
-        user_id = state.get("user_id")
-
-        # 1. Save technical trace
-        chat = Chat(
-            question=state.get("question", ""),
-            plan=state.get("plan"),
-            code=state.get("code"),
-            debug=state.get("debug"),
-            user_id=user_id,
-            conversation_id=conversation_id
-        )
-        db.add(chat)
-
-        # 2. Save Conversation Messages for history recall
-        # Save User Message
-        user_msg = Message(
-            conversation_id=conversation_id,
-            role="user",
-            content=state.get("question")
-        )
-        db.add(user_msg)
-
-        # Save Assistant Message (Final debug response)
-        asst_msg = Message(
-            conversation_id=conversation_id,
-            role="assistant",
-            content=state.get("debug")
-        )
-        db.add(asst_msg)
-
+        db.add_all(_records(state))
         db.commit()
     
     return state
+
+async def asave_memory(state):
+    async with AsyncSessionLocal() as db:
+        db.add_all(_records(state))
+        await db.commit()
+
+    return state
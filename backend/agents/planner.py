@@ -1,29 +1,31 @@
 from backend.agents.llm import llm
-from langchain_core.messages import SystemMessage, HumanMessage
+from backend.agents.prompt_budget import build_messages, abuild_messages
 
-def planner_agent(state):
-    history = state.get("history", [])
-    history_str = "\n".join([f"{m['role']}: {m['content']}" for m in history])
-    
-    system_prompt = (
-        "You are a master technical architect. "
-        "Based on the provided context, conversation history, and user question, "
-        "create a detailed step-by-step implementation plan. "
-        "Focus on technical accuracy and best practices."
-    )
-    
-    user_message = (
-        f"Context:\n{state['context']}\n\n"
-        f"Conversation History:\n{history_str}\n\n"
+SYSTEM_PROMPT = (
+    "You are a master technical architect. "
+    "Based on the provided context, conversation history, and user question, "
+    "create a detailed step-by-step implementation plan. "
+    "Focus on technical accuracy and best practices."
+)
+
+def _question(state):
+    return (
         f"Current Question: {state['question']}\n\n"
         "Create a plan."
     )
-    
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_message)
-    ]
-    
-    response = llm.invoke(messages)
+
+def planner_messages(state):
+    return build_messages("planner", state, SYSTEM_PROMPT, _question(state))
+
+async def aplanner_messages(state):
+    return await abuild_messages("planner", state, SYSTEM_PROMPT, _question(state))
+
+def planner_agent(state):
+    response = llm.invoke(planner_messages(state))
+    state["plan"] = response.content
+    return state
+
+async def aplanner_agent(state):
+    response = await llm.ainvoke(await aplanner_messages(state))
     state["plan"] = response.content
     return state
@@ -0,0 +1,142 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client import Histogram
+from backend.agents.safety import safety_agent, asafety_agent
+from backend.agents.classifier import classify_agent, aclassify_agent, CLASSIFIER_MODE
+from backend.agents.history_loader import history_loader, ahistory_loader
+from backend.agents.retriever import retriever_agent, aretriever_agent
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_BRANCH_LATENCY = Histogram(
+    "agent_prefetch_branch_latency_seconds",
+    "Latency of each parallel prefetch branch",
+    ["branch"]
+)
+
+# Shared pool: 3 branches per request, sized for a handful of concurrent requests per worker
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREFETCH_MAX_WORKERS", "24")),
+    thread_name_prefix="prefetch"
+)
+
+# Keys each branch is allowed to contribute back to the shared state
+BRANCH_KEYS = {
+    "safety": ("is_safe", "debug", "intent"),
+    "history": ("history",),
+    "retriever": ("chunks", "context", "citations", "query_embedding", "embedding_model"),
+}
+
+def _run_branch(name, agent, state):
+    start = time.perf_counter()
+    try:
+        # Each branch gets its own copy so the agents can mutate freely
+        result = agent(dict(state))
+    finally:
+        elapsed = time.perf_counter() - start
+        PREFETCH_BRANCH_LATENCY.labels(branch=name).observe(elapsed)
+    return result, elapsed
+
+async def _arun_branch(name, agent, state):
+    start = time.perf_counter()
+    try:
+        result = await agent(dict(state))
+    finally:
+        elapsed = time.perf_counter() - start
+        PREFETCH_BRANCH_LATENCY.labels(branch=name).observe(elapsed)
+    return result, elapsed
+
+def _merge(state, name, result):
+    for key in BRANCH_KEYS[name]:
+        if key in result:
+            state[key] = result[key]
+
+def prefetch_agent(state):
+    """
+    Fan out safety, history and retrieval concurrently, then join on the safety verdict.
+    Dropping the other branches is best effort: a queued branch never starts, but one a
+    pool thread already runs can't be interrupted and finishes with its result discarded.
+    """
+    branches = {
+        "safety": classify_agent if CLASSIFIER_MODE == "combined" else safety_agent,
+        "history": history_loader,
+        "retriever": retriever_agent,
+    }
+    # Pool threads don't inherit context: without a copy the graph's callbacks (token
+    # metrics) never see the branches' LLM calls. One copy per branch, a context can't
+    # be entered by two threads at once
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, _run_branch, name, agent, state)
+        for name, agent in branches.items()
+    }
+
+    timings = {}
+
+    try:
+        # 1. Join on safety first: an unsafe request never needs history or context
+        safety_result, timings["safety"] = futures["safety"].result()
+        _merge(state, "safety", safety_result)
+
+        if not state.get("is_safe"):
+            for name in ("history", "retriever"):
+                futures[name].cancel()
+            state["timings"] = timings
+            logger.info(f"Prefetch short-circuited (unsafe): {timings}")
+            return state
+
+        # 2. Merge the remaining branches
+        for name in ("history", "retriever"):
+            result, timings[name] = futures[name].result()
+            _merge(state, name, result)
+    except BaseException:
+        for future in futures.values():
+            future.cancel()
+        raise
+
+    state["timings"] = timings
+    logger.info(f"Prefetch branch timings: {timings}")
+    return state
+
+async def aprefetch_agent(state):
+    """Async variant of prefetch_agent: the branches run as tasks on the event loop."""
+    branches = {
+        "safety": aclassify_agent if CLASSIFIER_MODE == "combined" else asafety_agent,
+        "history": ahistory_loader,
+        "retriever": aretriever_agent,
+    }
+    tasks = {
+        name: asyncio.create_task(_arun_branch(name, agent, state))
+        for name, agent in branches.items()
+    }
+
+    timings = {}
+
+    try:
+        safety_result, timings["safety"] = await tasks["safety"]
+        _merge(state, "safety", safety_result)
+
+        if not state.get("is_safe"):
+            for name in ("history", "retriever"):
+                tasks[name].cancel()
+            state["timings"] = timings
+            logger.info(f"Prefetch short-circuited (unsafe): {timings}")
+            return state
+
+        (history_result, timings["history"]), (retriever_result, timings["retriever"]) = await asyncio.gather(
+            tasks["history"], tasks["retriever"]
+        )
+    except BaseException:
+        # gather doesn't cancel the siblings of a failed task, so nothing is left running
+        for task in tasks.values():
+            task.cancel()
+        raise
+    _merge(state, "history", history_result)
+    _merge(state, "retriever", retriever_result)
+
+    state["timings"] = timings
+    logger.info(f"Prefetch branch timings: {timings}")
+    return state
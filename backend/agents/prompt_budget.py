@@ -0,0 +1,194 @@
+import os
+import math
+import hashlib
+import json
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from prometheus_client import Counter, Histogram
+from backend.agents.llm import summary_llm
+from backend.cache import redis_client, async_redis_client
+
+# Rough llama3 ratio; only used to stay under the budget, not for billing
+CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "4"))
+
+NODE_BUDGETS = {
+    "qa": int(os.getenv("PROMPT_BUDGET_QA", "3000")),
+    "planner": int(os.getenv("PROMPT_BUDGET_PLANNER", "3000")),
+    "coder": int(os.getenv("PROMPT_BUDGET_CODER", "2500")),
+    "debugger": int(os.getenv("PROMPT_BUDGET_DEBUGGER", "2500")),
+}
+DEFAULT_BUDGET = 3000
+
+# Nodes whose prompt carries conversation history. qa answered from context alone
+# before the budget manager and still does unless PROMPT_QA_HISTORY=1
+HISTORY_NODES = {"planner"} | ({"qa"} if os.getenv("PROMPT_QA_HISTORY", "0") == "1" else set())
+
+# Share of the variable budget reserved for history; whatever it leaves unused goes to context
+HISTORY_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", "0.35"))
+# Summarize turns that fall out of the window instead of dropping them silently
+SUMMARIZE_HISTORY = os.getenv("PROMPT_SUMMARIZE_HISTORY", "0") == "1"
+SUMMARY_TOKENS = int(os.getenv("SUMMARY_NUM_PREDICT", "160"))
+SUMMARY_CACHE_TTL = 86400
+
+# Chat template overhead per message (role headers etc.)
+MESSAGE_OVERHEAD = 8
+
+PROMPT_TOKENS = Histogram(
+    "agent_prompt_tokens",
+    "Estimated prompt tokens per node",
+    ["node"],
+    buckets=(128, 256, 512, 1024, 2048, 3072, 4096, 8192)
+)
+PROMPT_TRUNCATIONS = Counter(
+    "agent_prompt_truncations_total",
+    "Prompts that had to drop context chunks or history turns",
+    ["node", "part"]
+)
+
+def estimate_tokens(text):
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN) + MESSAGE_OVERHEAD
+
+def fit_chunks(chunks, budget):
+    """Keeps chunks in rank order while they fit; the top chunk is cut rather than dropped."""
+    kept, used = [], 0
+    for chunk in chunks:
+        cost = estimate_tokens(chunk)
+        if used + cost > budget:
+            if not kept and budget > MESSAGE_OVERHEAD:
+                kept.append(chunk[:int((budget - MESSAGE_OVERHEAD) * CHARS_PER_TOKEN)])
+            break
+        kept.append(chunk)
+        used += cost
+    return kept
+
+def fit_text(text, tokens):
+    """Cuts `text` to about `tokens` tokens of content, keeping the start."""
+    return (text or "")[:max(int(tokens * CHARS_PER_TOKEN), 0)]
+
+def fit_history(history, budget):
+    """Keeps the most recent turns that fit. Returns (kept, dropped), both chronological."""
+    kept, used = [], 0
+    for i in range(len(history) - 1, -1, -1):
+        cost = estimate_tokens(history[i]["content"])
+        if used + cost > budget:
+            return list(reversed(kept)), history[:i + 1]
+        kept.append(history[i])
+        used += cost
+    return list(reversed(kept)), []
+
+def record_prompt(node, messages):
+    tokens = sum(estimate_tokens(m.content) for m in messages)
+    PROMPT_TOKENS.labels(node=node).observe(tokens)
+    return tokens
+
+def plan_prompt(node, system, question_block, chunks, history):
+    """Splits the node budget between history and context. Returns (chunks, history, dropped)."""
+    budget = NODE_BUDGETS.get(node, DEFAULT_BUDGET)
+    remaining = max(budget - estimate_tokens(system) - estimate_tokens(question_block), 0)
+
+    history_budget = int(remaining * HISTORY_SHARE)
+    if SUMMARIZE_HISTORY:
+        history_budget = max(history_budget - SUMMARY_TOKENS, 0)
+    kept_history, dropped = fit_history(history, history_budget)
+    history_used = sum(estimate_tokens(m["content"]) for m in kept_history)
+
+    kept_chunks = fit_chunks(chunks, remaining - history_used)
+
+    if dropped:
+        PROMPT_TRUNCATIONS.labels(node=node, part="history").inc()
+    if len(kept_chunks) < len(chunks) or (kept_chunks and kept_chunks[0] != chunks[0]):
+        PROMPT_TRUNCATIONS.labels(node=node, part="context").inc()
+    return kept_chunks, kept_history, dropped
+
+def assemble(system, summary, history, chunks, question_block):
+    """
+    Prefix order: instructions, then older turns, then the per-turn context and question.
+    Only the system prompt is a prefix shared by every call of a node. The history part
+    shifts as the window slides (history_loader keeps the last 6 messages, fit_history
+    drops the oldest turns), so Ollama's KV cache reuse beyond it is best effort.
+    """
+    messages = [SystemMessage(content=system)]
+    if summary:
+        messages.append(SystemMessage(content=f"Summary of earlier conversation:\n{summary}"))
+    for turn in history:
+        message_cls = HumanMessage if turn["role"] == "user" else AIMessage
+        messages.append(message_cls(content=turn["content"] or ""))
+    context = "\n\n".join(chunks)
+    messages.append(HumanMessage(content=f"Context:\n{context}\n\n{question_block}"))
+    return messages
+
+def _state_chunks(state):
+    # Ranked chunk list from the retriever; older cached entries only carry the joined context
+    return state.get("chunks") or ([state["context"]] if state.get("context") else [])
+
+def _summary_prompt(turns):
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+    return (
+        "Summarize this conversation in a few sentences, keeping names, code identifiers and decisions.\n\n"
+        f"{transcript}\n\nSummary:"
+    )
+
+def _summary_key(state, dropped):
+    digest = hashlib.sha256(json.dumps(dropped, sort_keys=True).encode()).hexdigest()
+    return f"history_summary:{state.get('conversation_id')}:{digest}"
+
+def summarize(state, dropped):
+    key = _summary_key(state, dropped)
+    try:
+        cached = redis_client.get(key)
+        if cached:
+            return cached.decode()
+    except Exception as e:
+        print(f"Redis Cache Error: {e}")
+    summary = summary_llm.invoke(_summary_prompt(dropped)).content.strip()
+    try:
+        redis_client.setex(key, SUMMARY_CACHE_TTL, summary)
+    except Exception as e:
+        print(f"Redis Save Error: {e}")
+    return summary
+
+async def asummarize(state, dropped):
+    key = _summary_key(state, dropped)
+    try:
+        cached = await async_redis_client.get(key)
+        if cached:
+            return cached.decode()
+    except Exception as e:
+        print(f"Redis Cache Error: {e}")
+    response = await summary_llm.ainvoke(_summary_prompt(dropped))
+    summary = response.content.strip()
+    try:
+        await async_redis_client.setex(key, SUMMARY_CACHE_TTL, summary)
+    except Exception as e:
+        print(f"Redis Save Error: {e}")
+    return summary
+
+def _state_history(node, state):
+    return state.get("history", []) if node in HISTORY_NODES else []
+
+def build_messages(node, state, system, question_block):
+    chunks, history, dropped = plan_prompt(node, system, question_block, _state_chunks(state), _state_history(node, state))
+    summary = summarize(state, dropped) if SUMMARIZE_HISTORY and dropped else None
+    messages = assemble(system, summary, history, chunks, question_block)
+    record_prompt(node, messages)
+    return messages
+
+async def abuild_messages(node, state, system, question_block):
+    chunks, history, dropped = plan_prompt(node, system, question_block, _state_chunks(state), _state_history(node, state))
+    summary = await asummarize(state, dropped) if SUMMARIZE_HISTORY and dropped else None
+    messages = assemble(system, summary, history, chunks, question_block)
+    record_prompt(node, messages)
+    return messages
+
+def bounded_messages(node, system, template, body):
+    """
+    Prompt of a node without context or history (coder, debugger): `body`, the plan
+    or the code, goes into `template` and is cut to what the node's budget leaves.
+    """
+    budget = NODE_BUDGETS.get(node, DEFAULT_BUDGET)
+    room = budget - estimate_tokens(system) - estimate_tokens(template.format(body=""))
+    kept = fit_text(body, room)
+    if len(kept) < len(body or ""):
+        PROMPT_TRUNCATIONS.labels(node=node, part="input").inc()
+    messages = [SystemMessage(content=system), HumanMessage(content=template.format(body=kept))]
+    record_prompt(node, messages)
+    return messages
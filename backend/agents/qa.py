@@ -1,13 +1,26 @@
 from backend.agents.llm import llm
+from backend.agents.prompt_budget import build_messages, abuild_messages
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant. Answer the user's question based ONLY on the provided context.\n"
+    "If the context doesn't contain the answer, say you don't know."
+)
+
+def _question(state):
+    return f"Question: {state['question']}"
+
+def qa_messages(state):
+    return build_messages("qa", state, SYSTEM_PROMPT, _question(state))
+
+async def aqa_messages(state):
+    return await abuild_messages("qa", state, SYSTEM_PROMPT, _question(state))
 
 def qa_agent(state):
-    prompt = (
-        "You are a helpful assistant. Answer the user's question based ONLY on the provided context.\n"
-        "If the context doesn't contain the answer, say you don't know.\n\n"
-        f"Context:\n{state.get('context', '')}\n\n"
-        f"Question: {state['question']}"
-    )
-    
-    response = llm.invoke(prompt)
+    response = llm.invoke(qa_messages(state))
     state["debug"] = response.content  # Stick to 'debug' for uniform saving in memory.py
     return state
+
+async def aqa_agent(state):
+    response = await llm.ainvoke(await aqa_messages(state))
+    state["debug"] = response.content
+    return state
@@ -1,56 +1,172 @@
+import os
 import hashlib
 import json
-import redis
-import os
-from sqlalchemy import or_
-from backend.agents.embeddings import embeddings
-from backend.database import SessionLocal
-from backend.models import Document
+from backend.agents.compaction import COMPACT_CONTEXT, compact, fetch_neighbours, afetch_neighbours
+from backend.agents.embeddings import client_for, active_model, aactive_model
+from backend.agents.search import (
+    use_lexical_fast_path,
+    lexical_documents,
+    alexical_documents,
+    retrieve_documents,
+    aretrieve_documents,
+)
+from backend.cache import redis_client, async_redis_client, corpus_version, acorpus_version
+from backend.database import SessionLocal, AsyncSessionLocal
+
+# Queries accepted by one retrieve_batch call / POST /retrieve/batch
+RETRIEVAL_BATCH_MAX = int(os.getenv("RETRIEVAL_BATCH_MAX", "1000"))
+
+# Entries stay valid until the scope's corpus version moves; the TTL only
+# reclaims keys of versions nobody asks for anymore
+RETRIEVAL_CACHE_TTL = int(os.getenv("RETRIEVAL_CACHE_TTL", "604800"))
+
+def _cache_key(query, user_id, version):
+    return f"retrieval:{user_id}:{version}:{hashlib.sha256(query.encode()).hexdigest()}"
+
+def _reusable_vector(state, model):
+    # A vector handed in with the state; only reuse it if it's in the space we search
+    if state.get("embedding_model") == model:
+        return state.get("query_embedding")
+    return None
+
+def _apply_results(state, docs, neighbours=()):
+    # Ranked chunk list lets the prompt builder drop the lowest-ranked chunks first
+    if COMPACT_CONTEXT:
+        state["chunks"], state["citations"] = compact(docs, neighbours)
+    else:
+        state["chunks"] = [doc.content for doc in docs]
+        state["citations"] = [{"source": doc.source, "page": doc.page} for doc in docs]
+    state["context"] = "\n\n".join(state["chunks"])
+    return state
+
+def _apply_cached(state, cached_data):
+    cached = json.loads(cached_data)
+    state["chunks"] = cached.get("chunks", [])
+    state["context"] = cached["context"]
+    state["citations"] = cached["citations"]
+    # The answer cache and the router's centroid tier need the vector even on a hit
+    if cached.get("query_embedding") is not None:
+        state["query_embedding"] = cached["query_embedding"]
+        state["embedding_model"] = cached["embedding_model"]
+    return state
 
-# Initialize Redis
-redis_client = redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"))
+def _cache_payload(state):
+    payload = {"chunks": state["chunks"], "context": state["context"], "citations": state["citations"]}
+    if state.get("query_embedding") is not None:
+        payload["query_embedding"] = list(state["query_embedding"])
+        payload["embedding_model"] = state["embedding_model"]
+    return json.dumps(payload)
+
+def _save_cache(cache_key, state):
+    if cache_key is None:
+        return
+    try:
+        redis_client.setex(cache_key, RETRIEVAL_CACHE_TTL, _cache_payload(state))
+    except Exception as e:
+        print(f"Redis Save Error: {e}")
+
+async def _asave_cache(cache_key, state):
+    if cache_key is None:
+        return
+    try:
+        await async_redis_client.setex(cache_key, RETRIEVAL_CACHE_TTL, _cache_payload(state))
+    except Exception as e:
+        print(f"Redis Save Error: {e}")
 
 def retriever_agent(state):
     query = state["question"]
     user_id = state.get("user_id")
 
-    # 1. Check Redis Cache
-    cache_key = f"retrieval:{user_id}:{hashlib.sha256(query.encode()).hexdigest()}"
+    # 1. Check Redis Cache (keyed by the scope's corpus version, bumped on upload/delete)
+    cache_key = None
     try:
+        cache_key = _cache_key(query, user_id, corpus_version(user_id))
         cached_data = redis_client.get(cache_key)
         if cached_data:
-            cached = json.loads(cached_data)
-            state["context"] = cached["context"]
-            state["citations"] = cached["citations"]
-            return state
+            return _apply_cached(state, cached_data)
     except Exception as e:
         print(f"Redis Cache Error: {e}")
 
-    # 2. Generate embedding for the query
-    query_vector = embeddings.embed_query(query)
+    # 2. Identifier lookups go to the full-text index alone and skip embedding
+    if use_lexical_fast_path(query):
+        with SessionLocal() as db:
+            docs = lexical_documents(db, query, user_id)
+            neighbours = fetch_neighbours(db, docs)
+        if docs:
+            _apply_results(state, docs, neighbours)
+            _save_cache(cache_key, state)
+            return state
+
+    # 3. Generate embedding for the query (unless the answer cache already did)
+    model = state.get("embedding_model") or active_model()
+    query_vector = _reusable_vector(state, model) or client_for(model).embed_query(query)
+    # Reused downstream by the router's nearest-centroid tier
+    state["query_embedding"] = query_vector
+    state["embedding_model"] = model
 
     with SessionLocal() as db:
-        # Scope: Public documents (user_id IS NULL) OR user's own documents
-        user_scope = or_(Document.user_id == None, Document.user_id == user_id) if user_id else Document.user_id == None
-        
-        docs = db.query(Document).filter(user_scope, Document.is_deleted == False).order_by(
-            Document.embedding.l2_distance(query_vector)
-        ).limit(3).all()
-
-        context = "\n\n".join([doc.content for doc in docs])
-        citations = [{"source": doc.source, "page": doc.page} for doc in docs]
-        
-        state["context"] = context
-        state["citations"] = citations
-
-        # 3. Save to Redis (expire in 5 minutes)
-        try:
-            redis_client.setex(
-                cache_key, 
-                300, 
-                json.dumps({"context": context, "citations": citations})
-            )
-        except Exception as e:
-            print(f"Redis Save Error: {e}")
+        docs = retrieve_documents(db, query, query_vector, user_id, model)
+        _apply_results(state, docs, fetch_neighbours(db, docs))
+
+    # 4. Save to Redis
+    _save_cache(cache_key, state)
+    return state
+
+async def aretriever_agent(state):
+    query = state["question"]
+    user_id = state.get("user_id")
+
+    cache_key = None
+    try:
+        cache_key = _cache_key(query, user_id, await acorpus_version(user_id))
+        cached_data = await async_redis_client.get(cache_key)
+        if cached_data:
+            return _apply_cached(state, cached_data)
+    except Exception as e:
+        print(f"Redis Cache Error: {e}")
+
+    if use_lexical_fast_path(query):
+        async with AsyncSessionLocal() as db:
+            docs = await alexical_documents(db, query, user_id)
+            neighbours = await afetch_neighbours(db, docs)
+        if docs:
+            _apply_results(state, docs, neighbours)
+            await _asave_cache(cache_key, state)
+            return state
+
+    model = state.get("embedding_model") or await aactive_model()
+    query_vector = _reusable_vector(state, model) or await client_for(model).aembed_query(query)
+    state["query_embedding"] = query_vector
+    state["embedding_model"] = model
 
+    async with AsyncSessionLocal() as db:
+        docs = await aretrieve_documents(db, query, query_vector, user_id, model)
+        _apply_results(state, docs, await afetch_neighbours(db, docs))
+
+    await _asave_cache(cache_key, state)
     return state
+
+def retrieve_batch(queries, user_id, model=None):
+    """
+    Retrieval only, no generation, for evals and pipelines. Same ranking and compaction
+    as retriever_agent, but all queries are embedded in one batched call and searched
+    over a single pooled session. Bypasses the retrieval cache so results are always fresh.
+    """
+    results = [{"question": query} for query in queries]
+    with SessionLocal() as db:
+        pending = []
+        for state in results:
+            # Identifier lookups take the same full-text fast path as the agent
+            docs = lexical_documents(db, state["question"], user_id) if use_lexical_fast_path(state["question"]) else []
+            if docs:
+                _apply_results(state, docs, fetch_neighbours(db, docs))
+            else:
+                pending.append(state)
+
+        if pending:
+            model = model or active_model()
+            vectors = client_for(model).embed_documents([state["question"] for state in pending])
+            for state, query_vector in zip(pending, vectors):
+                docs = retrieve_documents(db, state["question"], query_vector, user_id, model)
+                _apply_results(state, docs, fetch_neighbours(db, docs))
+    return results
@@ -1,18 +1,182 @@
-from backend.agents.llm import llm
+import os
+import re
+import math
+import threading
+import numpy as np
+from prometheus_client import Counter
+from backend.agents.llm import label_llm
+from backend.agents.embeddings import client_for, EMBEDDING_MODEL
 
-def router_agent(state):
-    question = state["question"]
-    
-    prompt = (
+# Local decisions below this confidence fall through to the LLM
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.8"))
+# Scales the cosine margin between the two centroids into a confidence
+ROUTER_CENTROID_SCALE = float(os.getenv("ROUTER_CENTROID_SCALE", "40"))
+
+ROUTER_DECISIONS = Counter(
+    "router_decisions_total",
+    "Intent routing decisions by tier",
+    ["tier", "intent"]
+)
+
+CODE_FENCE = re.compile(r"```|Traceback \(most recent call last\)|^\s*(def|class|import|from \S+ import)\s", re.MULTILINE)
+
+CODE_KEYWORDS = (
+    "write a", "write me", "implement", "function", "script", "refactor", "debug",
+    "fix", "bug", "error", "exception", "stack trace", "compile", "snippet",
+    "python", "javascript", "sql query", "regex", "unit test", "code",
+)
+# "why" is left out: "why does my script crash" is as often a debugging request as a question
+QA_KEYWORDS = (
+    "what is", "what are", "who", "when", "where", "summarize", "summary",
+    "according to", "document", "explain the", "tell me about", "overview",
+)
+
+def _keyword_pattern(keyword):
+    # Whole words only ("fix" is not in "prefix", "who" is not in "whole"), plurals allowed
+    return re.compile(rf"\b{re.escape(keyword)}(?:s|es)?\b")
+
+CODE_PATTERNS = [_keyword_pattern(k) for k in CODE_KEYWORDS]
+QA_PATTERNS = [_keyword_pattern(k) for k in QA_KEYWORDS]
+
+# Exemplars for the nearest-centroid tier, embedded once per process
+CODE_EXEMPLARS = [
+    "Write a python function that reverses a linked list.",
+    "Fix the bug in this code, it raises a KeyError.",
+    "Implement binary search in JavaScript.",
+    "Refactor this class to use dependency injection.",
+    "Why does my script crash with a segmentation fault?",
+]
+QA_EXEMPLARS = [
+    "What are the main goals of the project?",
+    "Summarize the uploaded document.",
+    "Who is responsible for deployment?",
+    "What does the report say about revenue?",
+    "Hello, how are you today?",
+]
+
+# One pair per embedding model: the query vector has to live in the same space
+_centroids = {}
+_centroids_lock = threading.Lock()
+
+def _build_centroids(code_vectors, qa_vectors):
+    code = np.array(code_vectors).mean(axis=0)
+    qa = np.array(qa_vectors).mean(axis=0)
+    return code / np.linalg.norm(code), qa / np.linalg.norm(qa)
+
+def _get_centroids(model=None):
+    model = model or EMBEDDING_MODEL
+    if model not in _centroids:
+        with _centroids_lock:
+            if model not in _centroids:
+                client = client_for(model)
+                _centroids[model] = _build_centroids(
+                    client.embed_documents(CODE_EXEMPLARS),
+                    client.embed_documents(QA_EXEMPLARS)
+                )
+    return _centroids[model]
+
+async def _aget_centroids(model=None):
+    model = model or EMBEDDING_MODEL
+    if model not in _centroids:
+        client = client_for(model)
+        # Worst case two coroutines both embed the exemplars once; the result is identical
+        _centroids[model] = _build_centroids(
+            await client.aembed_documents(CODE_EXEMPLARS),
+            await client.aembed_documents(QA_EXEMPLARS)
+        )
+    return _centroids[model]
+
+def classify_keywords(question):
+    """Returns (intent, confidence) from code fences and keyword hits."""
+    if CODE_FENCE.search(question):
+        return "code", 0.99
+
+    text = question.lower()
+    code_hits = sum(1 for p in CODE_PATTERNS if p.search(text))
+    qa_hits = sum(1 for p in QA_PATTERNS if p.search(text))
+
+    if code_hits == qa_hits:
+        return None, 0.0
+    intent = "code" if code_hits > qa_hits else "qa"
+    margin = abs(code_hits - qa_hits)
+    # One uncontested hit is 0.75, each extra hit adds confidence, mixed hits subtract
+    confidence = min(0.6 + 0.15 * margin - 0.1 * min(code_hits, qa_hits), 0.95)
+    return intent, confidence
+
+def classify_centroid(query_vector, centroids=None, model=None):
+    """Returns (intent, confidence) from the nearest of the code/qa centroids."""
+    code_c, qa_c = centroids or _get_centroids(model)
+    v = np.asarray(query_vector, dtype=float)
+    v = v / np.linalg.norm(v)
+    margin = float(v @ code_c - v @ qa_c)
+    confidence = 1 / (1 + math.exp(-abs(margin) * ROUTER_CENTROID_SCALE))
+    return ("code" if margin > 0 else "qa"), confidence
+
+def classify_local(question, query_vector=None, centroids=None, model=None):
+    """Cheap local tiers. Returns (intent, confidence, tier) or (None, confidence, None)."""
+    intent, confidence = classify_keywords(question)
+    if intent and confidence >= ROUTER_CONFIDENCE_THRESHOLD:
+        return intent, confidence, "keyword"
+
+    if query_vector is not None:
+        try:
+            intent, confidence = classify_centroid(query_vector, centroids, model)
+            if confidence >= ROUTER_CONFIDENCE_THRESHOLD:
+                return intent, confidence, "centroid"
+        except Exception as e:
+            print(f"Router Centroid Error: {e}")
+
+    return None, confidence, None
+
+def _llm_prompt(question):
+    return (
         "Classify the following user intent into one of two categories: 'code' or 'qa'.\n"
         "Criteria for 'code': The user wants code written, debugged, explained technically, or modified.\n"
         "Criteria for 'qa': The user is asking a general question, looking for an explanation from documents, or just chatting.\n\n"
         f"Input: {question}\n\n"
         "Classification (code/qa):"
     )
-    
-    response = llm.invoke(prompt)
-    classification = response.content.strip().lower()
-    
-    state["intent"] = "code" if "code" in classification else "qa"
+
+def _parse_label(content):
+    classification = content.strip().lower().strip("'\".")
+    return "code" if classification.startswith("code") else "qa"
+
+def classify_llm(question):
+    return _parse_label(label_llm.invoke(_llm_prompt(question)).content)
+
+async def aclassify_llm(question):
+    response = await label_llm.ainvoke(_llm_prompt(question))
+    return _parse_label(response.content)
+
+def decide_locally(state, query_vector, centroids=None):
+    intent, confidence, tier = classify_local(state["question"], query_vector, centroids, state.get("embedding_model"))
+    if intent is None and state.get("intent") in ("code", "qa"):
+        # Already decided by the combined safety + intent classifier
+        intent, tier = state["intent"], "classifier"
+    return intent, tier
+
+def apply_route(state, intent, tier):
+    ROUTER_DECISIONS.labels(tier=tier, intent=intent).inc()
+    state["intent"] = intent
+    state["route_tier"] = tier
     return state
+
+def router_agent(state):
+    intent, tier = decide_locally(state, state.get("query_embedding"))
+    if intent is None:
+        intent, tier = classify_llm(state["question"]), "llm"
+    return apply_route(state, intent, tier)
+
+async def arouter_agent(state):
+    query_vector, centroids = state.get("query_embedding"), None
+    if query_vector is not None:
+        try:
+            centroids = await _aget_centroids(state.get("embedding_model"))
+        except Exception as e:
+            # Never fall back to the blocking embed call on the event loop
+            print(f"Router Centroid Error: {e}")
+            query_vector = None
+    intent, tier = decide_locally(state, query_vector, centroids)
+    if intent is None:
+        intent, tier = await aclassify_llm(state["question"]), "llm"
+    return apply_route(state, intent, tier)
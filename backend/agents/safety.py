@@ -1,20 +1,29 @@
-from backend.agents.llm import llm
+from backend.agents.llm import label_llm
 
-def safety_agent(state):
-    question = state["question"]
-    
-    prompt = (
+UNSAFE_MESSAGE = "I cannot fulfill this request as it violates safety guidelines."
+
+def _prompt(question):
+    return (
         "Classify the following user input as 'safe' or 'unsafe'.\n"
         "Unsafe criteria: malware, hacking, violence, illegal acts, or harmful content.\n\n"
         f"Input: {question}\n\n"
         "Classification (safe/unsafe):"
     )
+
+def _apply_verdict(state, content):
+    classification = content.strip().lower().strip("'\".")
     
-    response = llm.invoke(prompt)
-    classification = response.content.strip().lower()
-    
-    state["is_safe"] = "safe" in classification
+    # "unsafe" contains "safe", so match on the leading word
+    state["is_safe"] = classification.startswith("safe")
     if not state["is_safe"]:
-        state["debug"] = "I cannot fulfill this request as it violates safety guidelines."
+        state["debug"] = UNSAFE_MESSAGE
         
     return state
+
+def safety_agent(state):
+    response = label_llm.invoke(_prompt(state["question"]))
+    return _apply_verdict(state, response.content)
+
+async def asafety_agent(state):
+    response = await label_llm.ainvoke(_prompt(state["question"]))
+    return _apply_verdict(state, response.content)
@@ -0,0 +1,201 @@
+import os
+import re
+import asyncio
+from sqlalchemy import select, text, func, union_all, and_
+from backend.agents import ann_index
+from backend.agents.embeddings import is_v2
+from backend.models import Document
+from backend.document_queries import retrieval_columns
+
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+# off | bit | halfvec: first pass over a compact copy of the legacy vectors, then an exact re-rank
+QUANTIZED_SEARCH = os.getenv("QUANTIZED_SEARCH", "off")
+# Candidates the first pass hands to the re-rank; pick it from evals/quantization_report.py
+QUANTIZED_CANDIDATES = int(os.getenv("QUANTIZED_CANDIDATES", "50"))
+# pgvector's default; the bit index has to return at least QUANTIZED_CANDIDATES rows
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+# vector | hybrid (vector and full-text rankings fused, identifier lookups go full-text only)
+RETRIEVAL_STRATEGY = os.getenv("RETRIEVAL_STRATEGY", "vector")
+# Rows each ranking contributes to the fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Usual reciprocal rank fusion damping constant
+RRF_K = 60
+
+# snake_case, camelCase/PascalCase, dotted.paths, calls(), FooError / FooException
+IDENTIFIER = re.compile(
+    r"\w+_\w+|[a-z]+[A-Z]\w*|[A-Z][a-z]+[A-Z]\w*|[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)+|\w+\(\)|\w*(?:Error|Exception)\b"
+)
+WORD = re.compile(r"\w+")
+
+def scope_tenants(user_id):
+    # Tenant 0 is the public partition; a user's own docs sit in one private sub-partition
+    return [0, user_id] if user_id else [0]
+
+def scope_filter(user_id):
+    # Scope: Public documents OR user's own documents, as a partition-prunable filter
+    return Document.tenant_id.in_(scope_tenants(user_id)), Document.is_deleted == False
+
+def _per_tenant(distance, user_id, limit):
+    """Nearest `limit` rows of each tenant partition in scope, searched separately then stacked."""
+    arms = [
+        select(Document.id, Document.tenant_id, distance.label("distance")).filter(
+            Document.tenant_id == tenant,
+            Document.is_deleted == False
+        ).order_by(distance).limit(limit).subquery()
+        for tenant in scope_tenants(user_id)
+    ]
+    return union_all(*[select(arm) for arm in arms]).subquery()
+
+def _join_ranked(ranked):
+    return select(Document).options(retrieval_columns()).join(
+        ranked, and_(Document.id == ranked.c.id, Document.tenant_id == ranked.c.tenant_id)
+    )
+
+def binary_quantize(vector):
+    """Same rule as pgvector's binary_quantize(): one bit per dimension, set when > 0."""
+    return "".join("1" if x > 0 else "0" for x in vector)
+
+def _first_pass_distance(query_vector, mode):
+    if mode == "bit":
+        return Document.embedding_bit.hamming_distance(binary_quantize(query_vector))
+    return Document.embedding_half.l2_distance(query_vector)
+
+def search_query(query_vector, user_id, model, k=RETRIEVAL_TOP_K, mode=None, candidates=None):
+    mode = mode or QUANTIZED_SEARCH
+
+    if is_v2(model):
+        # Cosine matches the HNSW opclass, so each partition answers from its index
+        top = _per_tenant(Document.embedding_v2.cosine_distance(query_vector), user_id, k)
+        return _join_ranked(top).order_by(top.c.distance).limit(k)
+
+    exact = Document.embedding.l2_distance(query_vector)
+    if mode == "off":
+        # Legacy column has no index: sequential scan, but only of the partitions in scope
+        top = _per_tenant(exact, user_id, k)
+        return _join_ranked(top).order_by(top.c.distance).limit(k)
+
+    shortlist = _per_tenant(_first_pass_distance(query_vector, mode), user_id, candidates or QUANTIZED_CANDIDATES)
+    # Only the shortlisted rows have their 16 KB vectors read back
+    return _join_ranked(shortlist).order_by(exact).limit(k)
+
+def looks_like_identifier(question):
+    """Short lookups of a function name, error string or stack-trace fragment."""
+    words = question.split()
+    return 0 < len(words) <= 4 and any(IDENTIFIER.search(word) for word in words)
+
+def use_lexical_fast_path(question):
+    return RETRIEVAL_STRATEGY == "hybrid" and looks_like_identifier(question)
+
+def _tsquery(question):
+    # Any term may match, ts_rank_cd favours chunks that match more of them close together
+    terms = [t for t in WORD.findall(question.lower()) if t != "or"]
+    return func.websearch_to_tsquery("simple", " or ".join(terms))
+
+def lexical_query(question, user_id, limit=RETRIEVAL_TOP_K):
+    tsquery = _tsquery(question)
+    return select(Document.id).filter(
+        *scope_filter(user_id),
+        Document.content_tsv.op("@@")(tsquery)
+    ).order_by(func.ts_rank_cd(Document.content_tsv, tsquery).desc(), Document.id).limit(limit)
+
+def reciprocal_rank_fusion(*rankings):
+    """Merges ranked id lists; ties keep the order of the first ranking."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0) + 1 / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def search_settings(model, mode=None, candidates=None):
+    """SET LOCAL statements the search query needs in its transaction."""
+    mode = mode or QUANTIZED_SEARCH
+    if is_v2(model) or mode != "bit":
+        return []
+    return [f"SET LOCAL hnsw.ef_search = {max(int(candidates or QUANTIZED_CANDIDATES), HNSW_EF_SEARCH)}"]
+
+def _by_ids_query(ids):
+    # Re-checks is_deleted in case the index missed a delete
+    return select(Document).options(retrieval_columns()).filter(Document.id.in_(ids), Document.is_deleted == False)
+
+def _in_rank_order(ids, docs):
+    by_id = {doc.id: doc for doc in docs}
+    return [by_id[i] for i in ids if i in by_id]
+
+def search_documents(db, query_vector, user_id, model, **options):
+    if ann_index.RETRIEVAL_ENGINE == "ann":
+        ids = ann_index.search(query_vector, user_id, model, options.get("k", RETRIEVAL_TOP_K))
+        if ids is not None:
+            return _in_rank_order(ids, db.execute(_by_ids_query(ids)).scalars().all())
+
+    for statement in search_settings(model, options.get("mode"), options.get("candidates")):
+        db.execute(text(statement))
+    return db.execute(search_query(query_vector, user_id, model, **options)).scalars().all()
+
+async def asearch_documents(db, query_vector, user_id, model, **options):
+    if ann_index.RETRIEVAL_ENGINE == "ann":
+        # numpy scan releases the GIL for most of its work, keep it off the event loop
+        ids = await asyncio.to_thread(ann_index.search, query_vector, user_id, model, options.get("k", RETRIEVAL_TOP_K))
+        if ids is not None:
+            result = await db.execute(_by_ids_query(ids))
+            return _in_rank_order(ids, result.scalars().all())
+
+    for statement in search_settings(model, options.get("mode"), options.get("candidates")):
+        await db.execute(text(statement))
+    result = await db.execute(search_query(query_vector, user_id, model, **options))
+    return result.scalars().all()
+
+def _vector_ids(db, query_vector, user_id, model, limit):
+    if ann_index.RETRIEVAL_ENGINE == "ann":
+        ids = ann_index.search(query_vector, user_id, model, limit)
+        if ids is not None:
+            return ids
+    for statement in search_settings(model):
+        db.execute(text(statement))
+    return db.execute(search_query(query_vector, user_id, model, k=limit).with_only_columns(Document.id)).scalars().all()
+
+async def _avector_ids(db, query_vector, user_id, model, limit):
+    if ann_index.RETRIEVAL_ENGINE == "ann":
+        ids = await asyncio.to_thread(ann_index.search, query_vector, user_id, model, limit)
+        if ids is not None:
+            return ids
+    for statement in search_settings(model):
+        await db.execute(text(statement))
+    result = await db.execute(search_query(query_vector, user_id, model, k=limit).with_only_columns(Document.id))
+    return result.scalars().all()
+
+def lexical_documents(db, question, user_id, k=RETRIEVAL_TOP_K):
+    ids = db.execute(lexical_query(question, user_id, k)).scalars().all()
+    return _in_rank_order(ids, db.execute(_by_ids_query(ids)).scalars().all()) if ids else []
+
+async def alexical_documents(db, question, user_id, k=RETRIEVAL_TOP_K):
+    result = await db.execute(lexical_query(question, user_id, k))
+    ids = result.scalars().all()
+    if not ids:
+        return []
+    result = await db.execute(_by_ids_query(ids))
+    return _in_rank_order(ids, result.scalars().all())
+
+def hybrid_documents(db, question, query_vector, user_id, model, k=RETRIEVAL_TOP_K):
+    lexical = db.execute(lexical_query(question, user_id, HYBRID_CANDIDATES)).scalars().all()
+    vector = _vector_ids(db, query_vector, user_id, model, HYBRID_CANDIDATES)
+    ids = reciprocal_rank_fusion(vector, lexical)[:k]
+    return _in_rank_order(ids, db.execute(_by_ids_query(ids)).scalars().all())
+
+async def ahybrid_documents(db, question, query_vector, user_id, model, k=RETRIEVAL_TOP_K):
+    result = await db.execute(lexical_query(question, user_id, HYBRID_CANDIDATES))
+    lexical = result.scalars().all()
+    vector = await _avector_ids(db, query_vector, user_id, model, HYBRID_CANDIDATES)
+    ids = reciprocal_rank_fusion(vector, lexical)[:k]
+    result = await db.execute(_by_ids_query(ids))
+    return _in_rank_order(ids, result.scalars().all())
+
+def retrieve_documents(db, question, query_vector, user_id, model):
+    """Ranking for the configured RETRIEVAL_STRATEGY."""
+    if RETRIEVAL_STRATEGY == "hybrid":
+        return hybrid_documents(db, question, query_vector, user_id, model)
+    return search_documents(db, query_vector, user_id, model)
+
+async def aretrieve_documents(db, question, query_vector, user_id, model):
+    if RETRIEVAL_STRATEGY == "hybrid":
+        return await ahybrid_documents(db, question, query_vector, user_id, model)
+    return await asearch_documents(db, query_vector, user_id, model)
@@ -0,0 +1,205 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+import contextvars
+from langgraph.config import get_stream_writer
+from langgraph.constants import TAG_NOSTREAM
+from prometheus_client import Counter, Histogram
+from backend.agents.llm import llm
+from backend.agents.qa import qa_messages, aqa_messages
+from backend.agents.planner import planner_messages, aplanner_messages
+from backend.agents.router import (
+    decide_locally,
+    apply_route,
+    classify_llm,
+    aclassify_llm,
+    classify_keywords,
+    classify_centroid,
+    _aget_centroids,
+)
+
+logger = logging.getLogger(__name__)
+
+# Run the likely branch while the router LLM decides; only used when the local tiers can't.
+# With CLASSIFIER_MODE=combined the classifier's intent decides most questions before the
+# router is reached, so the branch mostly runs in "separate" mode or when it gives no intent
+SPECULATIVE_ROUTING = os.getenv("SPECULATIVE_ROUTING", "1") == "1"
+# Branch to bet on when the local classifiers have no opinion at all (most traffic is QA)
+SPECULATIVE_PRIOR = os.getenv("SPECULATIVE_PRIOR", "qa")
+
+SPECULATION_TOTAL = Counter(
+    "router_speculation_total",
+    "Speculative branch executions by outcome",
+    ["branch", "result"]
+)
+SPECULATION_SAVED = Histogram(
+    "router_speculation_saved_seconds",
+    "Latency saved by a confirmed speculative branch"
+)
+
+# intent -> (node the branch replaces, state key it fills, tokens are user-facing)
+BRANCHES = {
+    "qa": ("qa", "debug", True),
+    "code": ("planner", "plan", False),
+}
+
+_DONE = object()
+
+def _branch_config(node):
+    # Tokens and throughput count under the node the branch stands in for, not the router.
+    # Kept off the messages stream: only a confirmed branch's tokens reach the user, via the custom stream
+    return {"metadata": {"langgraph_node": node}, "tags": [TAG_NOSTREAM]}
+
+def guess_intent(question, query_vector=None, centroids=None, model=None):
+    """Best guess from the local tiers even below the confidence threshold, else the prior."""
+    intent, _ = classify_keywords(question)
+    if intent:
+        return intent
+    if query_vector is not None:
+        try:
+            return classify_centroid(query_vector, centroids, model)[0]
+        except Exception as e:
+            print(f"Router Centroid Error: {e}")
+    return SPECULATIVE_PRIOR
+
+def _record(node, hit, router_elapsed, branch_elapsed):
+    SPECULATION_TOTAL.labels(branch=node, result="hit" if hit else "miss").inc()
+    if hit:
+        # Serial cost was router + branch, speculative cost is max(router, branch).
+        # branch_elapsed is the branch's own run time, not the wait for its last token
+        SPECULATION_SAVED.observe(min(router_elapsed, branch_elapsed))
+
+def speculative_router_agent(state):
+    intent, tier = decide_locally(state, state.get("query_embedding"))
+    if intent:
+        return apply_route(state, intent, tier)
+
+    guess = guess_intent(state["question"], state.get("query_embedding"), model=state.get("embedding_model"))
+    node, key, user_facing = BRANCHES[guess]
+    messages = qa_messages(state) if guess == "qa" else planner_messages(state)
+
+    tokens = queue.Queue()
+    cancel = threading.Event()
+    finished = {}
+
+    def run_branch():
+        # Tokens wait in the queue until the router confirms the guess
+        try:
+            # The router may have decided against us while this thread was starting
+            if cancel.is_set():
+                return
+            for chunk in llm.stream(messages, _branch_config(node), cancel=cancel):
+                if cancel.is_set():
+                    return
+                if chunk.content:
+                    tokens.put(chunk.content)
+        except Exception as e:
+            tokens.put(e)
+        finally:
+            finished["at"] = time.perf_counter()
+            tokens.put(_DONE)
+
+    start = time.perf_counter()
+    # Carry the run config over so the branch's LLM call reaches the graph's callbacks
+    threading.Thread(
+        target=contextvars.copy_context().run, args=(run_branch,), name=f"speculate-{node}", daemon=True
+    ).start()
+
+    try:
+        intent = classify_llm(state["question"])
+    except BaseException:
+        cancel.set()
+        raise
+    router_elapsed = time.perf_counter() - start
+    apply_route(state, intent, "llm")
+
+    if intent != guess:
+        cancel.set()
+        _record(node, False, router_elapsed, 0)
+        return state
+
+    # Confirmed: release buffered tokens, then keep forwarding until the branch finishes
+    writer = get_stream_writer()
+    parts = []
+    while True:
+        item = tokens.get()
+        if item is _DONE:
+            break
+        if isinstance(item, Exception):
+            raise item
+        parts.append(item)
+        if user_facing:
+            writer({"node": node, "token": item})
+
+    state[key] = "".join(parts)
+    state["speculated"] = node
+    _record(node, True, router_elapsed, finished["at"] - start)
+    return state
+
+async def aspeculative_router_agent(state):
+    query_vector, centroids = state.get("query_embedding"), None
+    if query_vector is not None:
+        try:
+            centroids = await _aget_centroids(state.get("embedding_model"))
+        except Exception as e:
+            print(f"Router Centroid Error: {e}")
+            query_vector = None
+    intent, tier = decide_locally(state, query_vector, centroids)
+    if intent:
+        return apply_route(state, intent, tier)
+
+    guess = guess_intent(state["question"], query_vector, centroids)
+    node, key, user_facing = BRANCHES[guess]
+    messages = await aqa_messages(state) if guess == "qa" else await aplanner_messages(state)
+
+    tokens = asyncio.Queue()
+    finished = {}
+
+    async def run_branch():
+        try:
+            async for chunk in llm.astream(messages, _branch_config(node)):
+                if chunk.content:
+                    tokens.put_nowait(chunk.content)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            tokens.put_nowait(e)
+        finally:
+            finished["at"] = time.perf_counter()
+            tokens.put_nowait(_DONE)
+
+    start = time.perf_counter()
+    branch = asyncio.create_task(run_branch())
+
+    try:
+        intent = await aclassify_llm(state["question"])
+    except BaseException:
+        branch.cancel()
+        raise
+    router_elapsed = time.perf_counter() - start
+    apply_route(state, intent, "llm")
+
+    if intent != guess:
+        branch.cancel()
+        _record(node, False, router_elapsed, 0)
+        return state
+
+    writer = get_stream_writer()
+    parts = []
+    while True:
+        item = await tokens.get()
+        if item is _DONE:
+            break
+        if isinstance(item, Exception):
+            raise item
+        parts.append(item)
+        if user_facing:
+            writer({"node": node, "token": item})
+
+    state[key] = "".join(parts)
+    state["speculated"] = node
+    _record(node, True, router_elapsed, finished["at"] - start)
+    return state
@@ -0,0 +1,34 @@
+"""add_document_embedding_models
+
+Revision ID: 4d9f1b62c8e3
+Revises: b5e2c7d94f18
+Create Date: 2026-10-18 21:14:52.903118
+
+Records which model produced each chunk's vectors, so the chunk_embeddings
+references are released under the key they were taken with after a model switch.
+Existing chunks stay NULL and are treated as embedded by the configured models.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d9f1b62c8e3'
+down_revision: Union[str, Sequence[str], None] = 'b5e2c7d94f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable without a default: a metadata-only change, even on the partitioned table
+    op.add_column('documents', sa.Column('embedding_model', sa.String(), nullable=True))
+    op.add_column('documents', sa.Column('embedding_v2_model', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('documents', 'embedding_v2_model')
+    op.drop_column('documents', 'embedding_model')
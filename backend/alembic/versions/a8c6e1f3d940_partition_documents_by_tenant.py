@@ -0,0 +1,142 @@
+"""partition_documents_by_tenant
+
+Revision ID: a8c6e1f3d940
+Revises: f7d2a86b4c05
+Create Date: 2026-10-18 15:48:33.290417
+
+Rebuilds `documents` as a partitioned table keyed on tenant_id (user_id, 0 for
+public documents):
+
+    documents
+      documents_public        LIST (0)
+      documents_private       DEFAULT, HASH (tenant_id) into N sub-partitions
+
+A retrieval query filtered on tenant_id = 0 / tenant_id = :uid only touches the
+public partition and one private sub-partition. Search and full-text indexes are
+partial on is_deleted = false, soft-deleted chunks never occupy them.
+Rows are copied inside the migration; plan for downtime on large tables.
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8c6e1f3d940'
+down_revision: Union[str, Sequence[str], None] = 'f7d2a86b4c05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EMBEDDING_V2_DIM = int(os.getenv("EMBEDDING_V2_DIM", "768"))
+TENANT_PARTITIONS = int(os.getenv("DOCUMENTS_TENANT_PARTITIONS", "8"))
+
+COPY_COLUMNS = (
+    "id, user_id, content, metadata, embedding, embedding_v2, source, page, "
+    "file_size, chunk_index, checksum, created_at, is_deleted"
+)
+
+
+def _columns():
+    return f"""
+        id integer NOT NULL DEFAULT nextval('documents_id_seq'),
+        user_id integer REFERENCES users (id),
+        content text,
+        metadata jsonb,
+        embedding vector(4096),
+        embedding_v2 vector({EMBEDDING_V2_DIM}),
+        embedding_bit bit(4096) GENERATED ALWAYS AS (binary_quantize(embedding)::bit(4096)) STORED,
+        embedding_half halfvec(4096) GENERATED ALWAYS AS (embedding::halfvec(4096)) STORED,
+        source varchar,
+        page integer,
+        content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED,
+        file_size integer,
+        chunk_index integer,
+        checksum varchar,
+        created_at timestamp without time zone,
+        is_deleted boolean
+    """
+
+
+def _swap_out_old_table():
+    op.execute("ALTER TABLE documents RENAME TO documents_old")
+    op.execute("ALTER TABLE documents_old RENAME CONSTRAINT documents_pkey TO documents_old_pkey")
+    op.execute("ALTER SEQUENCE documents_id_seq OWNED BY NONE")
+
+
+def _drop_old_table():
+    op.execute("DROP TABLE documents_old")
+    op.execute("ALTER SEQUENCE documents_id_seq OWNED BY documents.id")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _swap_out_old_table()
+
+    op.execute(f"""
+        CREATE TABLE documents (
+            {_columns()},
+            tenant_id integer NOT NULL DEFAULT 0,
+            PRIMARY KEY (id, tenant_id)
+        ) PARTITION BY LIST (tenant_id)
+    """)
+    op.execute("CREATE TABLE documents_public PARTITION OF documents FOR VALUES IN (0)")
+    op.execute("CREATE TABLE documents_private PARTITION OF documents DEFAULT PARTITION BY HASH (tenant_id)")
+    for remainder in range(TENANT_PARTITIONS):
+        op.execute(
+            f"CREATE TABLE documents_private_{remainder} PARTITION OF documents_private "
+            f"FOR VALUES WITH (MODULUS {TENANT_PARTITIONS}, REMAINDER {remainder})"
+        )
+
+    op.execute(f"""
+        INSERT INTO documents ({COPY_COLUMNS}, tenant_id)
+        SELECT {COPY_COLUMNS}, coalesce(user_id, 0) FROM documents_old
+    """)
+    _drop_old_table()
+
+    op.execute("CREATE INDEX ix_documents_id ON documents (id)")
+    op.execute("CREATE INDEX ix_documents_checksum ON documents (checksum)")
+    op.execute("CREATE INDEX ix_documents_is_deleted ON documents (is_deleted)")
+    # Listing, chunk viewer and delete-by-file
+    op.execute(
+        "CREATE INDEX ix_documents_live_source ON documents (tenant_id, source, chunk_index) "
+        "WHERE is_deleted = false"
+    )
+    op.execute(
+        "CREATE INDEX ix_documents_embedding_v2_hnsw ON documents "
+        "USING hnsw (embedding_v2 vector_cosine_ops) WITH (m = 16, ef_construction = 64) "
+        "WHERE is_deleted = false"
+    )
+    op.execute(
+        "CREATE INDEX ix_documents_embedding_v2_missing ON documents (id) "
+        "WHERE embedding_v2 IS NULL AND is_deleted = false"
+    )
+    op.execute(
+        "CREATE INDEX ix_documents_embedding_bit_hnsw ON documents "
+        "USING hnsw (embedding_bit bit_hamming_ops) WHERE is_deleted = false"
+    )
+    op.execute("CREATE INDEX ix_documents_content_tsv ON documents USING gin (content_tsv) WHERE is_deleted = false")
+    op.execute("ANALYZE documents")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _swap_out_old_table()
+
+    op.execute(f"CREATE TABLE documents ({_columns()}, PRIMARY KEY (id))")
+    op.execute(f"INSERT INTO documents ({COPY_COLUMNS}) SELECT {COPY_COLUMNS} FROM documents_old")
+    _drop_old_table()
+
+    op.execute("CREATE INDEX ix_documents_id ON documents (id)")
+    op.execute("CREATE INDEX ix_documents_checksum ON documents (checksum)")
+    op.execute("CREATE INDEX ix_documents_is_deleted ON documents (is_deleted)")
+    op.execute(
+        "CREATE INDEX ix_documents_embedding_v2_hnsw ON documents "
+        "USING hnsw (embedding_v2 vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+    )
+    op.execute(
+        "CREATE INDEX ix_documents_embedding_v2_missing ON documents (id) "
+        "WHERE embedding_v2 IS NULL AND is_deleted = false"
+    )
+    op.execute("CREATE INDEX ix_documents_embedding_bit_hnsw ON documents USING hnsw (embedding_bit bit_hamming_ops)")
+    op.execute("CREATE INDEX ix_documents_content_tsv ON documents USING gin (content_tsv)")
@@ -0,0 +1,40 @@
+"""add_chunk_embeddings
+
+Revision ID: b5e2c7d94f18
+Revises: a8c6e1f3d940
+Create Date: 2026-10-18 19:02:37.418206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import pgvector
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e2c7d94f18'
+down_revision: Union[str, Sequence[str], None] = 'a8c6e1f3d940'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('chunk_embeddings',
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('model', sa.String(), nullable=False),
+    sa.Column('embedding', pgvector.sqlalchemy.vector.VECTOR(), nullable=True),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_used_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('content_hash')
+    )
+    # The purge only ever looks at unreferenced rows
+    op.execute("CREATE INDEX ix_chunk_embeddings_unreferenced ON chunk_embeddings (last_used_at) WHERE refcount <= 0")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ix_chunk_embeddings_unreferenced")
+    op.drop_table('chunk_embeddings')
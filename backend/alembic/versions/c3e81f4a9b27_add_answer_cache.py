@@ -0,0 +1,50 @@
+"""add_answer_cache
+
+Revision ID: c3e81f4a9b27
+Revises: 4852e841611f
+Create Date: 2026-10-18 09:12:41.203518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import pgvector
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e81f4a9b27'
+down_revision: Union[str, Sequence[str], None] = '4852e841611f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('answer_cache',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('question', sa.Text(), nullable=True),
+    sa.Column('embedding', pgvector.sqlalchemy.vector.VECTOR(), nullable=True),
+    sa.Column('embedding_model', sa.String(), nullable=True),
+    sa.Column('corpus_version', sa.String(), nullable=True),
+    sa.Column('answer', sa.Text(), nullable=True),
+    sa.Column('citations', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('hits', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_used_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_answer_cache_id'), 'answer_cache', ['id'], unique=False)
+    op.create_index(op.f('ix_answer_cache_user_id'), 'answer_cache', ['user_id'], unique=False)
+    op.create_index(op.f('ix_answer_cache_last_used_at'), 'answer_cache', ['last_used_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_answer_cache_last_used_at'), table_name='answer_cache')
+    op.drop_index(op.f('ix_answer_cache_user_id'), table_name='answer_cache')
+    op.drop_index(op.f('ix_answer_cache_id'), table_name='answer_cache')
+    op.drop_table('answer_cache')
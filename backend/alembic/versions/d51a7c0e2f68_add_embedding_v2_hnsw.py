@@ -0,0 +1,45 @@
+"""add_embedding_v2_hnsw
+
+Revision ID: d51a7c0e2f68
+Revises: c3e81f4a9b27
+Create Date: 2026-10-18 11:40:05.118204
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import pgvector
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd51a7c0e2f68'
+down_revision: Union[str, Sequence[str], None] = 'c3e81f4a9b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match the model configured as EMBEDDING_V2_MODEL
+EMBEDDING_V2_DIM = int(os.getenv("EMBEDDING_V2_DIM", "768"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('documents', sa.Column('embedding_v2', pgvector.sqlalchemy.vector.VECTOR(dim=EMBEDDING_V2_DIM), nullable=True))
+    # Replaces the index 6f37a2dd767e had to leave out: 4096 dims is over the HNSW limit, this column isn't
+    op.execute(
+        "CREATE INDEX ix_documents_embedding_v2_hnsw ON documents "
+        "USING hnsw (embedding_v2 vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+    )
+    # Keeps the re-embed backlog and the retriever's coverage check off a full scan
+    op.execute(
+        "CREATE INDEX ix_documents_embedding_v2_missing ON documents (id) "
+        "WHERE embedding_v2 IS NULL AND is_deleted = false"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ix_documents_embedding_v2_missing")
+    op.execute("DROP INDEX IF EXISTS ix_documents_embedding_v2_hnsw")
+    op.drop_column('documents', 'embedding_v2')
@@ -0,0 +1,43 @@
+"""add_quantized_embeddings
+
+Revision ID: e0b4c9d27a13
+Revises: d51a7c0e2f68
+Create Date: 2026-10-18 13:02:47.551930
+
+Needs pgvector >= 0.7 (halfvec, bit and binary_quantize).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e0b4c9d27a13'
+down_revision: Union[str, Sequence[str], None] = 'd51a7c0e2f68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Generated columns: existing rows are filled by the table rewrite, ingestion needs no change
+    op.execute(
+        "ALTER TABLE documents ADD COLUMN embedding_bit bit(4096) "
+        "GENERATED ALWAYS AS (binary_quantize(embedding)::bit(4096)) STORED"
+    )
+    op.execute(
+        "ALTER TABLE documents ADD COLUMN embedding_half halfvec(4096) "
+        "GENERATED ALWAYS AS (embedding::halfvec(4096)) STORED"
+    )
+    # bit HNSW goes up to 64000 dims, unlike vector/halfvec (2000/4000)
+    op.execute(
+        "CREATE INDEX ix_documents_embedding_bit_hnsw ON documents "
+        "USING hnsw (embedding_bit bit_hamming_ops)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ix_documents_embedding_bit_hnsw")
+    op.drop_column('documents', 'embedding_half')
+    op.drop_column('documents', 'embedding_bit')
@@ -0,0 +1,33 @@
+"""add_content_fulltext_index
+
+Revision ID: f7d2a86b4c05
+Revises: e0b4c9d27a13
+Create Date: 2026-10-18 14:21:09.734662
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7d2a86b4c05'
+down_revision: Union[str, Sequence[str], None] = 'e0b4c9d27a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Generated on insert, so every ingestion path fills it without code changes
+    op.execute(
+        "ALTER TABLE documents ADD COLUMN content_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED"
+    )
+    op.execute("CREATE INDEX ix_documents_content_tsv ON documents USING gin (content_tsv)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ix_documents_content_tsv")
+    op.drop_column('documents', 'content_tsv')
@@ -0,0 +1,102 @@
+"""
+Rows/second of the chunk write paths ingestion can take: one ORM object per chunk
+(the old path), batched multi-row INSERT, and COPY on Postgres.
+
+With a Postgres BENCH_DATABASE_URL the rows go to a scratch `bench.documents`
+(same definition as the app's table, generated columns included); otherwise to a
+throwaway SQLite file, where COPY is skipped.
+
+    python -m backend.benchmarks.bulk_insert --rows 5000 --batch-size 500
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from backend.models import Document
+from backend.ingestion.writer import chunk_row, write_chunks
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL", "")
+RESULTS_PATH = "backend/benchmarks/results/bulk_insert.json"
+
+# Generated columns are plain here; the ORM still RETURNs them after every insert
+SQLITE_DOCUMENTS = """
+    CREATE TABLE documents (
+        id INTEGER PRIMARY KEY, user_id INTEGER, tenant_id INTEGER NOT NULL, content TEXT, metadata TEXT,
+        embedding TEXT, embedding_v2 TEXT, embedding_model TEXT, embedding_v2_model TEXT, embedding_bit TEXT, embedding_half TEXT, content_tsv TEXT,
+        source TEXT, page INTEGER, file_size INTEGER, chunk_index INTEGER, checksum TEXT,
+        created_at TIMESTAMP, is_deleted BOOLEAN
+    )
+"""
+
+def _engine():
+    if BENCH_DATABASE_URL.startswith("postgresql"):
+        return create_engine(BENCH_DATABASE_URL, connect_args={"options": "-csearch_path=bench,public"}), True
+    path = os.path.join(tempfile.mkdtemp(prefix="bulk-insert-"), "bench.db")
+    return create_engine(f"sqlite:///{path}"), False
+
+def _reset(engine, postgres):
+    with engine.begin() as conn:
+        if postgres:
+            conn.execute(text("CREATE SCHEMA IF NOT EXISTS bench"))
+            conn.execute(text("DROP TABLE IF EXISTS bench.documents CASCADE"))
+        else:
+            conn.execute(text("DROP TABLE IF EXISTS documents"))
+            conn.execute(text(SQLITE_DOCUMENTS))
+    if postgres:
+        Document.__table__.create(engine)
+
+def synthetic_rows(count, rng):
+    # Same shape as real chunks: ~500 characters of text and a full-width legacy vector
+    dim = Document.embedding.type.dim
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    return [
+        chunk_row("lorem ipsum " * 42, {"source": "bench.pdf", "page": i // 10}, vectors[i].tolist(), None, 1, i, 1_000_000, "bench")
+        for i in range(count)
+    ]
+
+def run(count, batch_size, modes):
+    engine, postgres = _engine()
+    if not postgres:
+        modes = [m for m in modes if m != "copy"]
+    Session = sessionmaker(bind=engine)
+    rows = synthetic_rows(count, np.random.default_rng(0))
+
+    results = []
+    for mode in modes:
+        _reset(engine, postgres)
+        with Session() as db:
+            start = time.perf_counter()
+            # The ORM baseline commits once at the end, as ingest_file used to
+            ids = write_chunks(db, rows, batch_size=count if mode == "orm" else batch_size, mode=mode)
+            elapsed = time.perf_counter() - start
+        row = {"mode": mode, "rows": len(ids), "seconds": round(elapsed, 3), "rows_per_second": round(len(ids) / elapsed, 1)}
+        results.append(row)
+        print(f"{mode:<7} {row['rows']} rows in {row['seconds']}s ({row['rows_per_second']} rows/s)")
+
+    if postgres:
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS bench.documents CASCADE"))
+
+    summary = {
+        "timestamp": time.time(),
+        "database": "postgresql" if postgres else "sqlite",
+        "config": {"rows": count, "batch_size": batch_size},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Results saved to {RESULTS_PATH}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--modes", default="orm,insert,copy")
+    args = parser.parse_args()
+    run(args.rows, args.batch_size, args.modes.split(","))
@@ -0,0 +1,321 @@
+"""
+Retrieval latency (p50/p99) and recall@k for every search mode the retriever
+supports, over synthetic corpora of configurable size and tenant count.
+
+Two backends:
+  memory    numpy stand-in of each mode (exact scan, bit/halfvec two-stage,
+            the mmap IVF index, full-text, hybrid); needs nothing running
+  postgres  loads the corpus into a scratch `bench.documents` table of
+            BENCH_DATABASE_URL and runs the real search.py queries against it
+
+Recall is measured against the exact scan of the same scope; `target_hit_rate`
+is the share of queries whose source chunk came back, the figure that matters
+for the full-text and hybrid modes. Results land in RESULTS_PATH, keyed by the
+current commit so runs can be diffed.
+
+    python -m backend.benchmarks.retrieval --backend memory --sizes 1000,20000 --tenants 1,50
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from sqlalchemy import create_engine, text, insert
+from sqlalchemy.orm import sessionmaker
+from backend.models import Document
+from backend.agents import ann_index, search
+from backend.agents.embeddings import EMBEDDING_MODEL
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL", os.getenv("DATABASE_URL", ""))
+RESULTS_PATH = "backend/benchmarks/results/retrieval.json"
+MODES = ("exact", "bit", "halfvec", "ann", "lexical", "hybrid")
+TOPICS = 32
+WORDS_PER_TOPIC = 12
+INSERT_BATCH = 500
+
+# ---- Synthetic corpus ----
+
+def generate_corpus(size, tenants, dim, seed=0):
+    """
+    Clustered vectors (one gaussian blob per topic) and chunk text built from the
+    topic's vocabulary plus a unique identifier, spread over tenant 0 (public) and
+    `tenants` private tenants.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(TOPICS, dim)).astype(np.float32)
+    vocabulary = [[f"t{t}w{w}" for w in range(WORDS_PER_TOPIC)] for t in range(TOPICS)]
+    topics = rng.integers(0, TOPICS, size=size)
+    vectors = centres[topics] + 0.6 * rng.normal(size=(size, dim)).astype(np.float32)
+    # A third of the corpus is public, the rest spread over the private tenants
+    tenant_ids = np.where(rng.random(size) < 1 / 3, 0, rng.integers(1, tenants + 1, size=size))
+    contents = [
+        " ".join(rng.choice(vocabulary[topic], size=8)) + f" handler_{i} raised ValueError."
+        for i, topic in enumerate(topics)
+    ]
+    return {
+        "ids": np.arange(1, size + 1, dtype=np.int64),
+        "tenant_ids": tenant_ids.astype(np.int64),
+        "vectors": vectors,
+        "contents": contents,
+        "topics": topics,
+        "vocabulary": vocabulary,
+    }
+
+def generate_queries(corpus, count, seed=1):
+    """Each query paraphrases one chunk: a perturbed copy of its vector, its identifier and two of its words."""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(corpus["ids"]), size=count)
+    queries = []
+    for row in rows:
+        # Private chunks are searched by their owner, public ones by a random tenant
+        user_id = int(corpus["tenant_ids"][row]) or int(rng.integers(1, corpus["tenant_ids"].max() + 1))
+        words = rng.choice(corpus["contents"][row].split()[:8], size=2, replace=False)
+        queries.append({
+            "vector": corpus["vectors"][row] + 0.3 * rng.normal(size=corpus["vectors"].shape[1]).astype(np.float32),
+            "text": f"handler_{int(corpus['ids'][row]) - 1} {words[0]} {words[1]}",
+            "user_id": user_id,
+            "target": int(corpus["ids"][row]),
+        })
+    return queries
+
+# ---- In-memory stand-in ----
+
+class MemoryBackend:
+    """Same rankings as search.py, computed with numpy over arrays in memory."""
+
+    def __init__(self, corpus, candidates):
+        self.ids = corpus["ids"]
+        self.tenant_ids = corpus["tenant_ids"]
+        self.vectors = corpus["vectors"]
+        self.half = self.vectors.astype(np.float16)
+        self.bits = np.packbits(self.vectors > 0, axis=1)
+        self.candidates = candidates
+        self.postings = {}
+        for row, content in enumerate(corpus["contents"]):
+            for term in set(search.WORD.findall(content.lower())):
+                self.postings.setdefault(term, []).append(row)
+        self.postings = {term: np.asarray(rows) for term, rows in self.postings.items()}
+        self.ann_root = None
+
+    def _scope(self, user_id):
+        return np.isin(self.tenant_ids, search.scope_tenants(user_id))
+
+    def _top(self, rows, distances, k):
+        order = np.lexsort((self.ids[rows], distances))[:k]
+        return rows[order]
+
+    def exact(self, query, k):
+        rows = np.flatnonzero(self._scope(query["user_id"]))
+        return self.ids[self._top(rows, ann_index._l2(self.vectors[rows], query["vector"]), k)].tolist()
+
+    def _two_stage(self, rows, first_pass, query, k):
+        shortlist = self._top(rows, first_pass, self.candidates)
+        return self.ids[self._top(shortlist, ann_index._l2(self.vectors[shortlist], query["vector"]), k)].tolist()
+
+    def bit(self, query, k):
+        rows = np.flatnonzero(self._scope(query["user_id"]))
+        packed = np.packbits(query["vector"] > 0)
+        hamming = np.unpackbits(self.bits[rows] ^ packed, axis=1).sum(axis=1)
+        return self._two_stage(rows, hamming, query, k)
+
+    def halfvec(self, query, k):
+        rows = np.flatnonzero(self._scope(query["user_id"]))
+        diff = self.half[rows].astype(np.float32) - query["vector"].astype(np.float16).astype(np.float32)
+        return self._two_stage(rows, np.einsum("ij,ij->i", diff, diff), query, k)
+
+    def build_ann(self):
+        """Writes one IVF generation per tenant in the index's on-disk layout."""
+        self.ann_root = tempfile.mkdtemp(prefix="ann-bench-")
+        for tenant in np.unique(self.tenant_ids):
+            scope = ann_index.scope_name(int(tenant) or None)
+            rows = np.flatnonzero(self.tenant_ids == tenant)
+            vectors, ids = self.vectors[rows], self.ids[rows]
+            path = os.path.join(self.ann_root, scope, "gen-0")
+            os.makedirs(path)
+            nlist = int(np.sqrt(len(rows))) if len(rows) >= ann_index.ANN_MIN_IVF_ROWS else 0
+            if nlist:
+                sample = vectors[:ann_index.ANN_KMEANS_SAMPLE]
+                centroids = ann_index._kmeans(sample, nlist)
+                assign = ann_index._nearest(vectors, centroids)
+                order = np.argsort(assign, kind="stable")
+                np.save(os.path.join(path, "centroids.npy"), centroids)
+                np.save(os.path.join(path, "offsets.npy"), np.searchsorted(assign[order], np.arange(nlist + 1)))
+            else:
+                order = np.arange(len(rows))
+            np.save(os.path.join(path, "vectors.npy"), vectors[order])
+            np.save(os.path.join(path, "ids.npy"), ids[order])
+            with open(os.path.join(path, "manifest.json"), "w") as f:
+                json.dump({"model": EMBEDDING_MODEL, "metric": "l2", "dim": vectors.shape[1], "count": len(rows),
+                           "nlist": nlist, "deltas": [], "built_at": time.time()}, f)
+            with open(os.path.join(self.ann_root, scope, "CURRENT"), "w") as f:
+                f.write("gen-0")
+        self.previous_ann_dir, ann_index.ANN_INDEX_DIR = ann_index.ANN_INDEX_DIR, self.ann_root
+        ann_index._partitions.clear()
+
+    def ann(self, query, k):
+        return ann_index.search(query["vector"], query["user_id"], EMBEDDING_MODEL, k) or []
+
+    def lexical(self, query, k):
+        # Matched-term count stands in for ts_rank_cd
+        scope = self._scope(query["user_id"])
+        scores = np.zeros(len(self.ids))
+        for term in set(search.WORD.findall(query["text"].lower())):
+            rows = self.postings.get(term)
+            if rows is not None:
+                scores[rows] += 1
+        rows = np.flatnonzero(scope & (scores > 0))
+        return self.ids[self._top(rows, -scores[rows], k)].tolist()
+
+    def hybrid(self, query, k):
+        vector = self.exact(query, search.HYBRID_CANDIDATES)
+        lexical = self.lexical(query, search.HYBRID_CANDIDATES)
+        return search.reciprocal_rank_fusion(vector, lexical)[:k]
+
+    def close(self):
+        if self.ann_root:
+            ann_index.ANN_INDEX_DIR = self.previous_ann_dir
+            ann_index._partitions.clear()
+            shutil.rmtree(self.ann_root, ignore_errors=True)
+
+# ---- Postgres ----
+
+class PostgresBackend:
+    """
+    Runs search.py's queries against `bench.documents`, a scratch copy of the
+    documents table resolved through search_path. The legacy column is fixed at
+    the model's width, so `dim` is ignored here.
+    """
+
+    def __init__(self, corpus, candidates):
+        if not BENCH_DATABASE_URL.startswith("postgresql"):
+            raise SystemExit("Set BENCH_DATABASE_URL to a Postgres database with the vector extension")
+        self.engine = create_engine(BENCH_DATABASE_URL, connect_args={"options": "-csearch_path=bench,public"})
+        self.candidates = candidates
+        self.Session = sessionmaker(bind=self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE SCHEMA IF NOT EXISTS bench"))
+            conn.execute(text("DROP TABLE IF EXISTS bench.documents CASCADE"))
+        Document.__table__.create(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE INDEX ON bench.documents (tenant_id)"))
+            conn.execute(text("CREATE INDEX ON bench.documents USING hnsw (embedding_bit bit_hamming_ops)"))
+            conn.execute(text("CREATE INDEX ON bench.documents USING gin (content_tsv)"))
+            rows = [
+                {"id": int(i), "tenant_id": int(t), "content": c, "source": f"bench-{int(i) // 50}.py",
+                 "chunk_index": int(i) % 50, "embedding": v.tolist(), "is_deleted": False}
+                for i, t, c, v in zip(corpus["ids"], corpus["tenant_ids"], corpus["contents"], corpus["vectors"])
+            ]
+            for start in range(0, len(rows), INSERT_BATCH):
+                conn.execute(insert(Document.__table__), rows[start:start + INSERT_BATCH])
+            conn.execute(text("ANALYZE bench.documents"))
+
+    def _run(self, find):
+        with self.Session() as db:
+            ids = [doc.id for doc in find(db)]
+            # SET LOCAL only lasts for the transaction
+            db.rollback()
+        return ids
+
+    def exact(self, query, k):
+        return self._run(lambda db: search.search_documents(db, query["vector"].tolist(), query["user_id"], EMBEDDING_MODEL, k=k, mode="off"))
+
+    def bit(self, query, k):
+        return self._run(lambda db: search.search_documents(
+            db, query["vector"].tolist(), query["user_id"], EMBEDDING_MODEL, k=k, mode="bit", candidates=self.candidates))
+
+    def halfvec(self, query, k):
+        return self._run(lambda db: search.search_documents(
+            db, query["vector"].tolist(), query["user_id"], EMBEDDING_MODEL, k=k, mode="halfvec", candidates=self.candidates))
+
+    def lexical(self, query, k):
+        return self._run(lambda db: search.lexical_documents(db, query["text"], query["user_id"], k))
+
+    def hybrid(self, query, k):
+        return self._run(lambda db: search.hybrid_documents(db, query["text"], query["vector"].tolist(), query["user_id"], EMBEDDING_MODEL, k))
+
+    def close(self):
+        with self.engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS bench.documents CASCADE"))
+        self.engine.dispose()
+
+BACKENDS = {"memory": MemoryBackend, "postgres": PostgresBackend}
+
+# ---- Measurement ----
+
+def measure(backend, mode, queries, truth, k):
+    find = getattr(backend, mode)
+    latencies, recalls, hits = [], [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        ids = find(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(expected & set(ids)) / max(len(expected), 1))
+        hits.append(query["target"] in ids)
+    return {
+        "mode": mode,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+        "target_hit_rate": round(float(np.mean(hits)), 4),
+    }
+
+def _commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def run(backend_name, sizes, tenant_counts, dim, queries, k, modes, candidates, results_path=RESULTS_PATH):
+    if backend_name == "postgres":
+        dim = Document.embedding.type.dim
+        # The IVF index is a file-based engine, the memory backend covers it
+        modes = [m for m in modes if m != "ann"]
+    results = []
+    for size in sizes:
+        for tenants in tenant_counts:
+            corpus = generate_corpus(size, tenants, dim)
+            sample = generate_queries(corpus, queries)
+            backend = BACKENDS[backend_name](corpus, candidates)
+            try:
+                if "ann" in modes:
+                    backend.build_ann()
+                truth = [set(backend.exact(query, k)) for query in sample]
+                for mode in modes:
+                    row = {"size": size, "tenants": tenants, **measure(backend, mode, sample, truth, k)}
+                    results.append(row)
+                    print(f"size={size:<8} tenants={tenants:<5} {mode:<8} p50={row['p50_ms']}ms p99={row['p99_ms']}ms "
+                          f"recall@{k}={row['recall_at_k']} hit={row['target_hit_rate']}")
+            finally:
+                backend.close()
+
+    summary = {
+        "timestamp": time.time(),
+        "commit": _commit(),
+        "backend": backend_name,
+        "config": {"dim": dim, "queries": queries, "k": k, "candidates": candidates,
+                   "ann_nprobe": ann_index.ANN_NPROBE, "hybrid_candidates": search.HYBRID_CANDIDATES},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    with open(results_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Results saved to {results_path}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="memory")
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--tenants", default="1,50")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=search.RETRIEVAL_TOP_K)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--candidates", type=int, default=search.QUANTIZED_CANDIDATES)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+    run(args.backend, [int(s) for s in args.sizes.split(",")], [int(t) for t in args.tenants.split(",")],
+        args.dim, args.queries, args.k, args.modes.split(","), args.candidates, args.output)
@@ -0,0 +1,148 @@
+"""
+Retrieval latency as the number of tenants grows: one flat table filtered with
+(user_id IS NULL OR user_id = :uid) against the tenant-partitioned layout that
+searches the public and the user's partition separately and merges the top-k.
+
+Runs against scratch tables in the `bench` schema of BENCH_DATABASE_URL
+(needs the vector extension), never the application's documents table. Both
+tables get the partial `is_deleted = false` indexes of migration a8c6e1f3d940.
+
+    python -m backend.benchmarks.tenant_partitioning --tenants 1,10,100,500
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+from sqlalchemy import create_engine, text
+
+# Postgres with pgvector. Deliberately no DATABASE_URL fallback: the scratch schema
+# has no business in the application database
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL", "")
+RESULTS_PATH = "backend/benchmarks/results/tenant_partitioning.json"
+HASH_PARTITIONS = 8
+INSERT_BATCH = 2000
+
+FLAT_QUERY = text("""
+    SELECT id FROM bench.docs_flat
+    WHERE (user_id IS NULL OR user_id = :uid) AND is_deleted = false
+    ORDER BY embedding <=> CAST(:q AS vector) LIMIT :k
+""")
+
+PARTITIONED_QUERY = text("""
+    SELECT id FROM (
+        (SELECT id, embedding <=> CAST(:q AS vector) AS distance FROM bench.docs_part
+         WHERE tenant_id = 0 AND is_deleted = false ORDER BY distance LIMIT :k)
+        UNION ALL
+        (SELECT id, embedding <=> CAST(:q AS vector) AS distance FROM bench.docs_part
+         WHERE tenant_id = :uid AND is_deleted = false ORDER BY distance LIMIT :k)
+    ) ranked ORDER BY distance LIMIT :k
+""")
+
+def _vector_literal(vector):
+    return "[" + ",".join(f"{x:.5f}" for x in vector) + "]"
+
+def create_tables(conn, dim):
+    conn.execute(text("CREATE SCHEMA IF NOT EXISTS bench"))
+    conn.execute(text("DROP TABLE IF EXISTS bench.docs_flat, bench.docs_part CASCADE"))
+    conn.execute(text(f"""
+        CREATE TABLE bench.docs_flat (
+            id serial PRIMARY KEY, user_id integer, is_deleted boolean NOT NULL DEFAULT false,
+            embedding vector({dim})
+        )
+    """))
+    conn.execute(text(f"""
+        CREATE TABLE bench.docs_part (
+            id integer NOT NULL, tenant_id integer NOT NULL, is_deleted boolean NOT NULL DEFAULT false,
+            embedding vector({dim}), PRIMARY KEY (id, tenant_id)
+        ) PARTITION BY LIST (tenant_id)
+    """))
+    conn.execute(text("CREATE TABLE bench.docs_part_public PARTITION OF bench.docs_part FOR VALUES IN (0)"))
+    conn.execute(text("CREATE TABLE bench.docs_part_private PARTITION OF bench.docs_part DEFAULT PARTITION BY HASH (tenant_id)"))
+    for remainder in range(HASH_PARTITIONS):
+        conn.execute(text(
+            f"CREATE TABLE bench.docs_part_private_{remainder} PARTITION OF bench.docs_part_private "
+            f"FOR VALUES WITH (MODULUS {HASH_PARTITIONS}, REMAINDER {remainder})"
+        ))
+
+def create_indexes(conn):
+    """Same indexes as the migration builds on documents, on both layouts, after the load."""
+    for table, owner in (("docs_flat", "user_id"), ("docs_part", "tenant_id")):
+        conn.execute(text(f"CREATE INDEX ix_{table}_is_deleted ON bench.{table} (is_deleted)"))
+        conn.execute(text(f"CREATE INDEX ix_{table}_live_owner ON bench.{table} ({owner}) WHERE is_deleted = false"))
+        conn.execute(text(
+            f"CREATE INDEX ix_{table}_embedding_hnsw ON bench.{table} "
+            "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64) "
+            "WHERE is_deleted = false"
+        ))
+
+def load(conn, tenants, rows_per_tenant, public_rows, dim, rng):
+    owners = [None] * public_rows + [t for t in range(1, tenants + 1) for _ in range(rows_per_tenant)]
+    for start in range(0, len(owners), INSERT_BATCH):
+        batch = owners[start:start + INSERT_BATCH]
+        vectors = rng.normal(size=(len(batch), dim))
+        rows = [
+            {"id": start + i + 1, "uid": owner, "tenant": owner or 0, "e": _vector_literal(v)}
+            for i, (owner, v) in enumerate(zip(batch, vectors))
+        ]
+        conn.execute(text("INSERT INTO bench.docs_flat (id, user_id, embedding) VALUES (:id, :uid, CAST(:e AS vector))"), rows)
+        conn.execute(text("INSERT INTO bench.docs_part (id, tenant_id, embedding) VALUES (:id, :tenant, CAST(:e AS vector))"), rows)
+    create_indexes(conn)
+    conn.execute(text("ANALYZE bench.docs_flat"))
+    conn.execute(text("ANALYZE bench.docs_part"))
+    return len(owners)
+
+def measure(conn, query, tenants, dim, queries, k, rng):
+    latencies = []
+    for _ in range(queries):
+        params = {"uid": int(rng.integers(1, tenants + 1)), "q": _vector_literal(rng.normal(size=dim)), "k": k}
+        start = time.perf_counter()
+        conn.execute(query, params).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+def run(tenant_counts, rows_per_tenant, public_rows, dim, queries, k):
+    if not BENCH_DATABASE_URL.startswith("postgresql"):
+        raise SystemExit("Set BENCH_DATABASE_URL to a Postgres database with the vector extension")
+    engine = create_engine(BENCH_DATABASE_URL)
+    rng = np.random.default_rng(0)
+    results = []
+    for tenants in tenant_counts:
+        with engine.begin() as conn:
+            create_tables(conn, dim)
+            total = load(conn, tenants, rows_per_tenant, public_rows, dim, rng)
+        with engine.connect() as conn:
+            flat = measure(conn, FLAT_QUERY, tenants, dim, queries, k, rng)
+            partitioned = measure(conn, PARTITIONED_QUERY, tenants, dim, queries, k, rng)
+        row = {"tenants": tenants, "rows": total, "flat": flat, "partitioned": partitioned}
+        results.append(row)
+        print(f"tenants={tenants:<6} rows={total:<8} flat p50={flat['p50_ms']}ms p99={flat['p99_ms']}ms | "
+              f"partitioned p50={partitioned['p50_ms']}ms p99={partitioned['p99_ms']}ms")
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bench.docs_flat, bench.docs_part CASCADE"))
+
+    summary = {
+        "timestamp": time.time(),
+        "config": {"rows_per_tenant": rows_per_tenant, "public_rows": public_rows, "dim": dim, "queries": queries, "k": k},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Results saved to {RESULTS_PATH}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tenants", default="1,10,100,500")
+    parser.add_argument("--rows-per-tenant", type=int, default=100)
+    parser.add_argument("--public-rows", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+    run([int(t) for t in args.tenants.split(",")], args.rows_per_tenant, args.public_rows, args.dim, args.queries, args.k)
@@ -0,0 +1,32 @@
+import os
+import redis
+import redis.asyncio
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+# Shared Redis clients for agent-level caches (sync nodes and async nodes)
+redis_client = redis.from_url(REDIS_URL)
+async_redis_client = redis.asyncio.from_url(REDIS_URL)
+
+# Corpus version counters: a user's retrieval scope is public docs + their own,
+# so anything cached against that scope is tagged "<public>.<user>" and goes
+# stale as soon as either counter is bumped by an upload or delete.
+PUBLIC_SCOPE_KEY = "corpus_version:public"
+
+def _user_scope_key(user_id):
+    return f"corpus_version:user:{user_id}"
+
+def _format_version(public, own):
+    return f"{int(public or 0)}.{int(own or 0)}"
+
+def corpus_version(user_id):
+    public, own = redis_client.mget(PUBLIC_SCOPE_KEY, _user_scope_key(user_id))
+    return _format_version(public, own)
+
+async def acorpus_version(user_id):
+    public, own = await async_redis_client.mget(PUBLIC_SCOPE_KEY, _user_scope_key(user_id))
+    return _format_version(public, own)
+
+def bump_corpus_version(user_id):
+    """Call after documents are added or removed; user_id None means public docs."""
+    redis_client.incr(PUBLIC_SCOPE_KEY if user_id is None else _user_scope_key(user_id))
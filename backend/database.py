@@ -1,5 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
@@ -7,8 +8,31 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
+def _async_url(url):
+    """Maps the sync DATABASE_URL onto its asyncio driver."""
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+
+# Async engine for the async /agent path; sized for many short-lived node sessions
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **({} if "sqlite" in ASYNC_DATABASE_URL else {
+        "pool_size": int(os.getenv("ASYNC_DB_POOL_SIZE", "20")),
+        "max_overflow": int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20")),
+    })
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
-# Export Chat here so memory.py can import it from database
-# Import at bottom to avoid circular dependency (Base must be defined first)
-from backend.models import Chat
+if "asyncpg" in ASYNC_DATABASE_URL:
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _register_vector(dbapi_connection, connection_record):
+        # asyncpg needs the pgvector codec registered on every new connection
+        from pgvector.asyncpg import register_vector
+        dbapi_connection.run_async(register_vector)
+
+Base = declarative_base()
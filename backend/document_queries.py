@@ -0,0 +1,35 @@
+from sqlalchemy import select, func
+from sqlalchemy.orm import load_only
+from backend.models import Document
+
+# All the retriever, context compaction and the prompt builder read off a chunk
+RETRIEVAL_COLUMNS = (
+    Document.id, Document.content, Document.source, Document.page,
+    Document.chunk_index, Document.tenant_id,
+)
+
+def retrieval_columns():
+    return load_only(*RETRIEVAL_COLUMNS)
+
+def document_listing_query(user_id):
+    """One row per uploaded file, aggregated in SQL instead of loading every chunk."""
+    filename = func.coalesce(Document.source, "unknown").label("filename")
+    return select(
+        func.max(Document.id).label("id"),
+        filename,
+        func.max(Document.file_size).label("size"),
+        func.count(Document.id).label("chunks"),
+        func.max(Document.created_at).label("date"),
+    ).filter(
+        Document.tenant_id == user_id,
+        Document.user_id == user_id,
+        Document.is_deleted == False
+    ).group_by(filename).order_by(func.max(Document.created_at).desc())
+
+def document_chunks_query(source, user_id):
+    return select(Document.chunk_index, Document.content).filter(
+        Document.tenant_id == user_id,
+        Document.source == source,
+        Document.user_id == user_id,
+        Document.is_deleted == False
+    ).order_by(Document.chunk_index)
@@ -0,0 +1,79 @@
+"""
+Recall@k vs latency of the two-stage (quantized first pass + exact re-rank) search,
+measured against the exact sequential scan on the live documents table.
+
+    python -m backend.evals.quantization_report --queries 50 --k 3
+"""
+import json
+import time
+import argparse
+import numpy as np
+from sqlalchemy import select, func
+from backend.database import SessionLocal
+from backend.models import Document
+from backend.agents.embeddings import EMBEDDING_MODEL
+from backend.agents.search import search_documents
+
+RESULTS_PATH = "backend/evals/quantization_results.json"
+MODES = ("bit", "halfvec")
+CANDIDATES = (10, 20, 50, 100, 200, 400)
+
+def sample_queries(db, count):
+    # Stored chunk vectors stand in for query embeddings, no Ollama needed
+    rows = db.execute(
+        select(Document.embedding, Document.user_id).filter(Document.is_deleted == False).order_by(func.random()).limit(count)
+    ).all()
+    return [(list(row.embedding), row.user_id) for row in rows]
+
+def timed_search(db, query_vector, user_id, k, **options):
+    start = time.perf_counter()
+    docs = search_documents(db, query_vector, user_id, EMBEDDING_MODEL, k=k, **options)
+    elapsed = time.perf_counter() - start
+    # SET LOCAL only lasts for the transaction
+    db.rollback()
+    return [doc.id for doc in docs], elapsed
+
+def run_report(queries, k):
+    with SessionLocal() as db:
+        samples = sample_queries(db, queries)
+        if not samples:
+            print("No documents to sample queries from.")
+            return None
+
+        exact, exact_latency = [], []
+        for query_vector, user_id in samples:
+            ids, elapsed = timed_search(db, query_vector, user_id, k, mode="off")
+            exact.append(set(ids))
+            exact_latency.append(elapsed)
+
+        rows = [{"mode": "exact", "candidates": None, "recall": 1.0,
+                 "p50_ms": round(np.percentile(exact_latency, 50) * 1000, 2),
+                 "p95_ms": round(np.percentile(exact_latency, 95) * 1000, 2)}]
+
+        for mode in MODES:
+            for n in CANDIDATES:
+                recalls, latencies = [], []
+                for (query_vector, user_id), truth in zip(samples, exact):
+                    ids, elapsed = timed_search(db, query_vector, user_id, k, mode=mode, candidates=n)
+                    recalls.append(len(truth & set(ids)) / max(len(truth), 1))
+                    latencies.append(elapsed)
+                rows.append({"mode": mode, "candidates": n, "recall": round(float(np.mean(recalls)), 4),
+                             "p50_ms": round(np.percentile(latencies, 50) * 1000, 2),
+                             "p95_ms": round(np.percentile(latencies, 95) * 1000, 2)})
+
+    print(f"{'mode':<8} {'N':>5} {'recall@' + str(k):>10} {'p50 ms':>9} {'p95 ms':>9}")
+    for row in rows:
+        print(f"{row['mode']:<8} {str(row['candidates'] or '-'):>5} {row['recall']:>10} {row['p50_ms']:>9} {row['p95_ms']:>9}")
+
+    summary = {"timestamp": time.time(), "queries": len(samples), "k": k, "results": rows}
+    with open(RESULTS_PATH, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Results saved to {RESULTS_PATH}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+    run_report(args.queries, args.k)
@@ -1,57 +1,84 @@
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 
-from backend.agents.safety import safety_agent
-from backend.agents.history_loader import history_loader
-from backend.agents.retriever import retriever_agent
-from backend.agents.router import router_agent
-from backend.agents.qa import qa_agent
-from backend.agents.planner import planner_agent
-from backend.agents.coder import coder_agent
-from backend.agents.debugger import debug_agent
-from backend.agents.memory import save_memory
+from backend.agents.prefetch import prefetch_agent, aprefetch_agent
+from backend.agents.router import router_agent, arouter_agent
+from backend.agents.speculation import speculative_router_agent, aspeculative_router_agent, SPECULATIVE_ROUTING
+from backend.agents.qa import qa_agent, aqa_agent
+from backend.agents.planner import planner_agent, aplanner_agent
+from backend.agents.coder import coder_agent, acoder_agent
+from backend.agents.debugger import debug_agent, adebug_agent
+from backend.agents.memory import save_memory, asave_memory
+from backend.agents.answer_cache import answer_cache_agent, aanswer_cache_agent
+from backend.instrumentation import instrument, ainstrument
+
+# Nodes whose LLM tokens are forwarded to the user as they are generated,
+# mapped to the state key holding their full output
+STREAMED_NODES = {"qa": "debug", "coder": "code", "debugger": "debug"}
+
+def node(name, func, afunc):
+    """Sync implementation for graph.stream, async one for graph.astream, both timed per node."""
+    return RunnableLambda(instrument(name, func), afunc=ainstrument(name, afunc), name=name)
 
 builder = StateGraph(dict)
 
-builder.add_node("safety", safety_agent)
-builder.add_node("history", history_loader)
-builder.add_node("retriever", retriever_agent)
-builder.add_node("router", router_agent)
-builder.add_node("qa", qa_agent)
-builder.add_node("planner", planner_agent)
-builder.add_node("coder", coder_agent)
-builder.add_node("debugger", debug_agent)
-builder.add_node("memory", save_memory)
+# Safety, history and retrieval are independent, so they run as one parallel stage
+builder.add_node("prefetch", node("prefetch", prefetch_agent, aprefetch_agent))
+# Semantic answer cache, consulted only once the question is known to be safe
+builder.add_node("answer_cache", node("answer_cache", answer_cache_agent, aanswer_cache_agent))
+# Speculative mode starts the likely answer branch while the router LLM is still deciding
+if SPECULATIVE_ROUTING:
+    builder.add_node("router", node("router", speculative_router_agent, aspeculative_router_agent))
+else:
+    builder.add_node("router", node("router", router_agent, arouter_agent))
+builder.add_node("qa", node("qa", qa_agent, aqa_agent))
+builder.add_node("planner", node("planner", planner_agent, aplanner_agent))
+builder.add_node("coder", node("coder", coder_agent, acoder_agent))
+builder.add_node("debugger", node("debugger", debug_agent, adebug_agent))
+builder.add_node("memory", node("memory", save_memory, asave_memory))
 
-builder.set_entry_point("safety")
+builder.set_entry_point("prefetch")
 
 def route_safety(state):
     if state.get("is_safe"):
-        return "history"
+        return "answer_cache"
     return "memory"
 
 builder.add_conditional_edges(
-    "safety",
+    "prefetch",
     route_safety,
     {
-        "history": "history",
+        "answer_cache": "answer_cache",
         "memory": "memory"
     }
 )
 
-builder.add_edge("history", "retriever")
-builder.add_edge("retriever", "router")
+def route_cache(state):
+    return "memory" if state.get("cached") else "router"
+
+builder.add_conditional_edges(
+    "answer_cache",
+    route_cache,
+    {
+        "router": "router",
+        "memory": "memory"
+    }
+)
 
 def route_intent(state):
+    # A confirmed speculative branch already produced that node's output
     if state.get("intent") == "code":
-        return "planner"
-    return "qa"
+        return "coder" if state.get("speculated") == "planner" else "planner"
+    return "memory" if state.get("speculated") == "qa" else "qa"
 
 builder.add_conditional_edges(
     "router",
     route_intent,
     {
         "planner": "planner",
-        "qa": "qa"
+        "coder": "coder",
+        "qa": "qa",
+        "memory": "memory"
     }
 )
 
@@ -1,9 +1,46 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-def chunk_docs(docs):
-    """Splits documents into smaller chunks for embedding."""
-    splitter = RecursiveCharacterTextSplitter(
+def _splitter(**kwargs):
+    return RecursiveCharacterTextSplitter(
         chunk_size=500,
-        chunk_overlap=100
+        chunk_overlap=100,
+        **kwargs
     )
-    return splitter.split_documents(docs)
+
+def chunk_docs(docs):
+    """Splits documents into smaller chunks for embedding."""
+    return _splitter().split_documents(docs)
+
+def _split_block(splitter, text, metadata, final):
+    chunks = splitter.create_documents([text], [metadata])
+    carry = ""
+    if chunks and not final:
+        # The last chunk may be cut off by the block boundary: it is re-split with the
+        # next block, raw text included, so its start (and overlap) stay where they were
+        carry = text[chunks.pop().metadata["start_index"]:]
+    for chunk in chunks:
+        del chunk.metadata["start_index"]
+    return chunks, carry
+
+def iter_chunks(docs):
+    """
+    Incremental chunk_docs: splits each document as it arrives. Pages and rows split
+    exactly as chunk_docs would. Blocks of a streamed text file (metadata "block")
+    are split as one stream, holding back only the last chunk of each block, so at
+    most a block plus one chunk of text is buffered. Chunks at a block boundary can
+    differ slightly from splitting the whole file at once.
+    """
+    splitter, stream_splitter = _splitter(), _splitter(add_start_index=True)
+    carry, metadata = "", None
+    for doc in docs:
+        if "block" not in doc.metadata:
+            if carry:
+                yield from _split_block(stream_splitter, carry, metadata, final=True)[0]
+                carry = ""
+            yield from splitter.split_documents([doc])
+            continue
+        metadata = {key: value for key, value in doc.metadata.items() if key != "block"}
+        chunks, carry = _split_block(stream_splitter, carry + doc.page_content, metadata, final=False)
+        yield from chunks
+    if carry:
+        yield from _split_block(stream_splitter, carry, metadata, final=True)[0]
@@ -0,0 +1,77 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+# Texts per embed_documents call; Ollama embeds a batch in one request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# Batches in flight at once; keep at or below OLLAMA_NUM_PARALLEL
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+# Seconds before the first retry, doubled on each further attempt
+EMBED_RETRY_BACKOFF = float(os.getenv("EMBED_RETRY_BACKOFF", "1.0"))
+
+EMBEDDED_CHUNKS = Counter("ingestion_embedded_chunks_total", "Chunks embedded during ingestion", ["model"])
+EMBED_RETRIES = Counter("ingestion_embed_retries_total", "Embedding batches retried during ingestion", ["model"])
+
+def _model_name(client):
+    return getattr(client, "model", "unknown")
+
+def _embed_batch(client, texts, max_retries):
+    for attempt in range(max_retries + 1):
+        try:
+            return client.embed_documents(texts)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            EMBED_RETRIES.labels(model=_model_name(client)).inc()
+            delay = EMBED_RETRY_BACKOFF * 2 ** attempt
+            logger.warning(f"Embedding batch of {len(texts)} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def embed_texts(client, texts, batch_size=None, concurrency=None, max_retries=None, on_progress=None):
+    """
+    Embeds `texts` in batches of `batch_size`, at most `concurrency` batches in flight,
+    retrying a failed batch with exponential backoff. Vectors come back in input order.
+    Raises if a batch still fails after `max_retries` retries.
+    """
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    concurrency = concurrency or EMBED_CONCURRENCY
+    max_retries = EMBED_MAX_RETRIES if max_retries is None else max_retries
+    texts = list(texts)
+    vectors = [None] * len(texts)
+    if not texts:
+        return vectors
+
+    start = time.perf_counter()
+    done = 0
+    batches = iter(range(0, len(texts), batch_size))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = {}
+
+        def submit_next():
+            offset = next(batches, None)
+            if offset is not None:
+                future = pool.submit(_embed_batch, client, texts[offset:offset + batch_size], max_retries)
+                in_flight[future] = offset
+
+        for _ in range(concurrency):
+            submit_next()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                offset = in_flight.pop(future)
+                batch = future.result()
+                vectors[offset:offset + len(batch)] = batch
+                done += len(batch)
+                if on_progress:
+                    on_progress(done, len(texts))
+                submit_next()
+
+    elapsed = time.perf_counter() - start
+    EMBEDDED_CHUNKS.labels(model=_model_name(client)).inc(len(texts))
+    logger.info(f"Embedded {len(texts)} chunks with {_model_name(client)} in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):.1f} chunks/s)")
+    return vectors
@@ -0,0 +1,146 @@
+import os
+import hashlib
+import logging
+from collections import Counter as Tally
+from datetime import datetime, timedelta
+from prometheus_client import Counter
+from sqlalchemy import select, update, delete, case
+from sqlalchemy.dialects import postgresql, sqlite
+from backend.ingestion.embedder import embed_texts
+from backend.agents.embeddings import EMBEDDING_MODEL, EMBEDDING_V2_MODEL
+from backend.agents.embedding_cache import uncached
+from backend.database import SessionLocal
+from backend.models import ChunkEmbedding, Document
+
+logger = logging.getLogger(__name__)
+
+CHUNK_EMBEDDING_STORE = os.getenv("CHUNK_EMBEDDING_STORE", "1") == "1"
+# Unreferenced vectors are kept this long in case the same text comes back (re-upload after delete)
+CHUNK_EMBEDDING_GRACE_DAYS = int(os.getenv("CHUNK_EMBEDDING_GRACE_DAYS", "7"))
+LOOKUP_BATCH = 1000
+UPSERT_BATCH = 500
+
+CHUNK_EMBEDDING_LOOKUPS = Counter(
+    "chunk_embedding_store_lookups_total",
+    "Ingested chunks whose vector was found in the content-addressed store",
+    ["model", "result"]
+)
+
+def content_hash(model, text):
+    return hashlib.sha256(f"{model}\0{text or ''}".encode()).hexdigest()
+
+def _lookup(keys):
+    found = {}
+    unique = list(set(keys))
+    with SessionLocal() as db:
+        for start in range(0, len(unique), LOOKUP_BATCH):
+            found.update(db.execute(
+                select(ChunkEmbedding.content_hash, ChunkEmbedding.embedding).filter(
+                    ChunkEmbedding.content_hash.in_(unique[start:start + LOOKUP_BATCH])
+                )
+            ).all())
+    return found
+
+def stored_key(content, model, configured):
+    """
+    Store key of a chunk's vector, from the model recorded on the chunk. Chunks from
+    before models were recorded count as embedded by the configured one.
+    """
+    model = model or configured
+    return content_hash(model, content) if model else None
+
+def embed_chunks(client, model, texts, reuse=True):
+    """
+    Vectors for `texts`, taken from the store where this model already embedded the
+    exact same text (any document, any user); only the rest goes to the model.
+    reuse=False sends every text to the model (an explicit re-embed).
+    Returns (vectors, keys); pass both to retain() once the chunks are stored.
+    """
+    # Straight to the model, never through the query-side Redis cache
+    client = uncached(client)
+    keys = [content_hash(model, text) for text in texts]
+    if not CHUNK_EMBEDDING_STORE or not reuse:
+        return embed_texts(client, texts), keys
+
+    found = _lookup(keys) if keys else {}
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            # Repeats inside one file are embedded once
+            missing.setdefault(key, text)
+    hits = sum(key in found for key in keys)
+    CHUNK_EMBEDDING_LOOKUPS.labels(model=model, result="hit").inc(hits)
+    CHUNK_EMBEDDING_LOOKUPS.labels(model=model, result="miss").inc(len(keys) - hits)
+
+    if missing:
+        found.update(zip(missing, embed_texts(client, list(missing.values()))))
+    return [found[key] for key in keys], keys
+
+def _insert(db):
+    return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+def retain(db, model, keys, vectors, refresh=False):
+    """
+    Adds one reference per stored chunk, inserting vectors the store doesn't have yet.
+    With `refresh` the stored vectors are replaced by `vectors` (freshly re-embedded).
+    """
+    if not CHUNK_EMBEDDING_STORE or not keys:
+        return
+    counts = Tally(keys)
+    vector_of = dict(zip(keys, vectors))
+    now = datetime.utcnow()
+    # Sorted so concurrent ingests lock shared rows in the same order
+    entries = sorted(counts.items())
+    for start in range(0, len(entries), UPSERT_BATCH):
+        stmt = _insert(db)(ChunkEmbedding).values([
+            {"content_hash": key, "model": model, "embedding": vector_of[key], "refcount": n, "created_at": now, "last_used_at": now}
+            for key, n in entries[start:start + UPSERT_BATCH]
+        ])
+        changes = {"refcount": ChunkEmbedding.refcount + stmt.excluded.refcount, "last_used_at": now}
+        if refresh:
+            changes["embedding"] = stmt.excluded.embedding
+        # Always carries the vector, so a row purged since embed_chunks read it just comes back
+        db.execute(stmt.on_conflict_do_update(index_elements=[ChunkEmbedding.content_hash], set_=changes))
+
+def release_documents(db, ids):
+    """
+    Drops the references of chunks about to be soft-deleted, in the caller's
+    transaction, under the keys of the models that embedded each chunk.
+    """
+    if not CHUNK_EMBEDDING_STORE or not ids:
+        return
+    rows = db.execute(select(
+        Document.content, Document.embedding_model, Document.embedding_v2_model, Document.embedding_v2 != None
+    ).filter(Document.id.in_(ids), Document.is_deleted == False)).all()
+    keys = []
+    for content, model, model_v2, has_v2 in rows:
+        keys.append(stored_key(content, model, EMBEDDING_MODEL))
+        if has_v2:
+            keys.append(stored_key(content, model_v2, EMBEDDING_V2_MODEL))
+    release(db, [key for key in keys if key])
+
+def release(db, keys):
+    """Drops one reference per key, in the caller's transaction."""
+    if not CHUNK_EMBEDDING_STORE or not keys:
+        return
+    counts = Tally(keys)
+    now = datetime.utcnow()
+    for key, n in sorted(counts.items()):
+        db.execute(update(ChunkEmbedding).where(ChunkEmbedding.content_hash == key).values(
+            # Floored at 0: chunks ingested before the store existed were never counted
+            refcount=case((ChunkEmbedding.refcount > n, ChunkEmbedding.refcount - n), else_=0),
+            # The purge grace period runs from the last release
+            last_used_at=now
+        ))
+
+def purge_chunk_embeddings(grace_days=CHUNK_EMBEDDING_GRACE_DAYS):
+    """Deletes vectors no live chunk references and nobody reused within the grace period."""
+    cutoff = datetime.utcnow() - timedelta(days=grace_days)
+    with SessionLocal() as db:
+        purged = db.execute(delete(ChunkEmbedding).where(
+            ChunkEmbedding.refcount <= 0,
+            ChunkEmbedding.last_used_at < cutoff
+        )).rowcount
+        db.commit()
+    logger.info(f"Purged {purged} unreferenced chunk embeddings")
+    return purged
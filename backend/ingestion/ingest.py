@@ -1,30 +1,230 @@
 import os
+import hashlib
+import logging
+from itertools import islice
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, update, func
+from backend.ingestion.loader import load_file, lazy_load_file
+from backend.ingestion.chunker import chunk_docs, iter_chunks
+from backend.ingestion.embedding_store import embed_chunks, retain, release_documents
+from backend.ingestion.writer import chunk_row, write_chunks
+from backend.agents import ann_index
+from backend.agents.embeddings import embeddings, embeddings_v2, EMBEDDING_MODEL, EMBEDDING_V2_MODEL
+from backend.database import SessionLocal
+from backend.models import Document
+
+logger = logging.getLogger(__name__)
+
+# Files at least this large are streamed: loaded, chunked, embedded and written batch by batch
+INGEST_STREAMING_MIN_BYTES = int(os.getenv("INGEST_STREAMING_MIN_BYTES", str(10 * 1024 * 1024)))
+# Chunks per pipeline batch; peak memory is about two batches of chunks and vectors
+INGEST_STREAM_BATCH_SIZE = int(os.getenv("INGEST_STREAM_BATCH_SIZE", "256"))
+
+def _embed_rows(indexed_chunks, user_id, file_size, checksum):
+    """Rows ready for write_chunks plus (store keys, vectors) per model."""
+    texts = [chunk.page_content for _, chunk in indexed_chunks]
+    # Text any document already embedded is reused; the rest is embedded in concurrent batches
+    chunk_vectors, keys = embed_chunks(embeddings, EMBEDDING_MODEL, texts)
+    vectors = {EMBEDDING_MODEL: (keys, chunk_vectors)}
+    # New chunks carry both vectors so v2 coverage never regresses
+    chunk_vectors_v2, model_v2 = [None] * len(texts), None
+    if embeddings_v2 is not None:
+        chunk_vectors_v2, keys_v2 = embed_chunks(embeddings_v2, EMBEDDING_V2_MODEL, texts)
+        vectors[EMBEDDING_V2_MODEL] = (keys_v2, chunk_vectors_v2)
+        model_v2 = EMBEDDING_V2_MODEL
+
+    rows = [
+        chunk_row(chunk.page_content, chunk.metadata, vector, vector_v2, user_id, idx, file_size, checksum,
+                  embedding_model=EMBEDDING_MODEL, embedding_v2_model=model_v2)
+        for (idx, chunk), vector, vector_v2 in zip(indexed_chunks, chunk_vectors, chunk_vectors_v2)
+    ]
+    return rows, vectors
+
+def _store(rows, vectors, user_id):
+    """Writes rows and references their vectors; returns the new ids."""
+    with SessionLocal() as db:
+        # Batched Core INSERT / COPY instead of one ORM object per chunk
+        ids = write_chunks(db, rows)
+        # Counted after the rows commit: a crash in between under-counts, which only
+        # lets a vector be purged early, the chunks keep their own copy
+        for model, (keys, model_vectors) in vectors.items():
+            retain(db, model, keys, model_vectors)
+        db.commit()
+
+    # The local index only takes the space it was built for; the others are ignored
+    for model, (_, model_vectors) in vectors.items():
+        ann_index.add_documents(user_id, ids, model_vectors, model)
+    return ids
+
+def _named(chunks, source):
+    # A replacement's chunks are filed under the source of the document it replaces
+    for chunk in chunks:
+        if source:
+            chunk.metadata["source"] = source
+        yield chunk
+
+def _source_filter(source, user_id):
+    return (
+        Document.tenant_id == (user_id or 0),
+        Document.user_id == user_id,
+        Document.source == source,
+        Document.is_deleted == False,
+    )
+
+def stored_versions(source, user_id):
+    """Checksums of the live chunks already filed under `source`."""
+    with SessionLocal() as db:
+        return set(db.execute(select(Document.checksum).filter(*_source_filter(source, user_id)).distinct()).scalars().all())
+
+def ingest_file(path: str, user_id: int = None, checksum: str = None, source: str = None, replace: bool = False):
+    """
+    Full pipeline: Load -> Chunk -> Embed -> Store (bulk insert).
+    With `replace`, the file is a new version of the document filed under `source`.
+    """
+    source = source or path
+    # Only an explicit replacement is diffed against what is stored; names alone never match documents
+    if replace and stored_versions(source, user_id) - {checksum}:
+        return reingest_file(path, source, user_id=user_id, checksum=checksum)
 
-def ingest_file(path: str, user_id: int = None, checksum: str = None):
-    """Full pipeline: Load -> Chunk -> Embed -> Store (ORM based)."""
-    docs = load_file(path)
-    chunks = chunk_docs(docs)
-    
     file_size = os.path.getsize(path) if os.path.exists(path) else 0
+    if file_size >= INGEST_STREAMING_MIN_BYTES:
+        return ingest_file_streaming(path, user_id=user_id, checksum=checksum, source=source)
+
+    docs = load_file(path)
+    chunks = list(_named(chunk_docs(docs), source))
+    # A redelivered task skips whatever its crashed predecessor already committed
+    resume_from = committed_chunks(source, user_id, checksum)
+    rows, vectors = _embed_rows(list(enumerate(chunks))[resume_from:], user_id, file_size, checksum)
+    return len(_store(rows, vectors, user_id)) if rows else 0
+
+def _upload_filter(source, user_id, checksum):
+    # One upload: the file's chunks of this exact version
+    return (*_source_filter(source, user_id), Document.checksum == checksum)
 
+def committed_chunks(source, user_id, checksum):
+    """
+    Checkpoint of an interrupted run: how many leading chunks of this upload are
+    already stored. Chunking is deterministic, so the run resumes right after them.
+    """
+    if checksum is None:
+        return 0
     with SessionLocal() as db:
-        for idx, chunk in enumerate(chunks):
-            # Generate embedding using the centralized client
-            vector = embeddings.embed_query(chunk.page_content)
-
-            doc = Document(
-                content=chunk.page_content,
-                metadata_=chunk.metadata,
-                embedding=vector,
-                source=chunk.metadata.get("source"),
-                page=chunk.metadata.get("page", 0),
-                user_id=user_id,
-                # Stage 8 metadata
-                chunk_index=idx,
-                file_size=file_size,
-                checksum=checksum,
-                is_deleted=False
-            )
-            db.add(doc)
-        
+        last = db.execute(select(func.max(Document.chunk_index)).filter(*_upload_filter(source, user_id, checksum))).scalar()
+    return 0 if last is None else last + 1
+
+def _discard(user_id, ids):
+    if not ids:
+        return
+    with SessionLocal() as db:
+        release_documents(db, ids)
+        db.execute(update(Document).where(Document.id.in_(ids)).values(is_deleted=True))
         db.commit()
+    ann_index.remove_documents(user_id, ids)
+
+def _discard_upload(source, user_id, checksum):
+    with SessionLocal() as db:
+        ids = db.execute(select(Document.id).filter(*_upload_filter(source, user_id, checksum))).scalars().all()
+    _discard(user_id, ids)
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def ingest_file_streaming(path: str, user_id: int = None, checksum: str = None, source: str = None):
+    """
+    Bounded-memory ingestion: pages come out of the loader lazily and are chunked as
+    they arrive. Each batch is embedded while the previous one is being written, and
+    every write commits, so a crashed worker's retry resumes from the last stored chunk.
+    Returns the number of chunks stored by this run.
+    """
+    source = source or path
+    file_size = os.path.getsize(path) if os.path.exists(path) else 0
+    resume_from = committed_chunks(source, user_id, checksum)
+    if resume_from:
+        logger.info(f"Resuming ingestion of {source} after {resume_from} committed chunks")
+
+    stored = 0
+    try:
+        # One writer thread: at most one batch being written while the next is embedded
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            pending = None
+            for batch in _batches(enumerate(_named(iter_chunks(lazy_load_file(path)), source)), INGEST_STREAM_BATCH_SIZE):
+                # Chunks before the checkpoint are re-split to keep indexes aligned, never re-embedded
+                batch = [(idx, chunk) for idx, chunk in batch if idx >= resume_from]
+                if not batch:
+                    continue
+                rows, vectors = _embed_rows(batch, user_id, file_size, checksum)
+                if pending is not None:
+                    stored += len(pending.result())
+                pending = writer.submit(_store, rows, vectors, user_id)
+                logger.info(f"Ingesting {source}: chunk {batch[-1][0] + 1} embedded, {resume_from + stored} stored")
+            if pending is not None:
+                stored += len(pending.result())
+    except Exception:
+        # A failed upload shouldn't stay half searchable; a crash keeps its rows to resume from
+        _discard_upload(source, user_id, checksum)
+        raise
+
+    logger.info(f"Ingested {source}: {resume_from + stored} chunks ({stored} in this run)")
+    return stored
+
+def chunk_hash(text):
+    return hashlib.sha256((text or "").encode()).hexdigest()
+
+def reingest_file(path: str, source: str, user_id: int = None, checksum: str = None):
+    """
+    Incremental re-ingestion of a new version of `source`. Chunks are matched to the
+    stored ones by content hash: matches keep their row and vectors (only position and
+    version fields are updated), new or changed chunks are embedded and inserted, and
+    stored chunks the new version no longer has are soft-deleted.
+    Re-running after a crash is safe, chunks inserted by the first run simply match.
+    """
+    file_size = os.path.getsize(path) if os.path.exists(path) else 0
+    with SessionLocal() as db:
+        stored = db.execute(
+            select(Document.id, Document.content, Document.chunk_index, Document.page)
+            .filter(*_source_filter(source, user_id)).order_by(Document.chunk_index, Document.id)
+        ).all()
+    unmatched = defaultdict(deque)
+    for row in stored:
+        unmatched[chunk_hash(row.content)].append(row)
+
+    kept, moved, added = [], [], []
+    try:
+        for batch in _batches(enumerate(_named(iter_chunks(lazy_load_file(path)), source)), INGEST_STREAM_BATCH_SIZE):
+            new = []
+            for idx, chunk in batch:
+                matches = unmatched.get(chunk_hash(chunk.page_content))
+                if not matches:
+                    new.append((idx, chunk))
+                    continue
+                row = matches.popleft()
+                kept.append(row.id)
+                page = chunk.metadata.get("page", 0)
+                if row.chunk_index != idx or row.page != page:
+                    moved.append({"id": row.id, "chunk_index": idx, "page": page, "metadata_": chunk.metadata})
+            if new:
+                rows, vectors = _embed_rows(new, user_id, file_size, checksum)
+                added.extend(_store(rows, vectors, user_id))
+
+        removed = [row.id for rows in unmatched.values() for row in rows]
+        with SessionLocal() as db:
+            if kept:
+                db.execute(update(Document).where(Document.id.in_(kept)).values(checksum=checksum, file_size=file_size))
+            if moved:
+                # Bulk UPDATE by primary key
+                db.execute(update(Document), moved)
+            if removed:
+                release_documents(db, removed)
+                db.execute(update(Document).where(Document.id.in_(removed)).values(is_deleted=True))
+            db.commit()
+        ann_index.remove_documents(user_id, removed)
+    except Exception:
+        # The previous version stays whole; only this run's inserts are rolled back
+        _discard(user_id, added)
+        raise
+
+    logger.info(f"Re-ingested {source}: {len(added)} chunks embedded, {len(kept)} reused, {len(removed)} removed")
+    return len(added)
@@ -1,20 +1,54 @@
+import os
+from langchain_core.documents import Document
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, CSVLoader
 
-def load_file(path: str):
-    """Loads PDF, TXT, MD, CSV, or DOCX files into LangChain documents."""
+# Characters per block when a text file is streamed; the chunker carries overlap across blocks
+TEXT_BLOCK_CHARS = int(os.getenv("TEXT_BLOCK_CHARS", str(1024 * 1024)))
+
+def _is_text(path: str):
+    return not path.lower().endswith((".pdf", ".csv", ".docx"))
+
+def _loader(path: str):
     lower = path.lower()
 
     if lower.endswith(".pdf"):
-        return PyPDFLoader(path).load()
+        return PyPDFLoader(path)
     elif lower.endswith(".csv"):
-        return CSVLoader(path).load()
+        return CSVLoader(path)
     elif lower.endswith(".docx"):
         try:
             from langchain_community.document_loaders import UnstructuredWordDocumentLoader
-            return UnstructuredWordDocumentLoader(path).load()
+            return UnstructuredWordDocumentLoader(path)
         except ImportError:
             # Fallback: read as raw text
-            return TextLoader(path).load()
+            return TextLoader(path)
     else:
         # TXT, MD, and any other text-based format
-        return TextLoader(path).load()
+        return TextLoader(path)
+
+def load_file(path: str):
+    """Loads PDF, TXT, MD, CSV, or DOCX files into LangChain documents."""
+    return _loader(path).load()
+
+def _text_blocks(path: str):
+    # TextLoader would read the whole file into one document. Blocks end at a blank
+    # line where possible so paragraphs, the splitter's first separator, stay whole
+    with open(path) as f:
+        block, lines, size = 0, [], 0
+        while line := f.readline(TEXT_BLOCK_CHARS):
+            lines.append(line)
+            size += len(line)
+            if size >= 2 * TEXT_BLOCK_CHARS or (size >= TEXT_BLOCK_CHARS and not line.strip()):
+                yield Document(page_content="".join(lines), metadata={"source": path, "block": block})
+                block, lines, size = block + 1, [], 0
+        if lines:
+            yield Document(page_content="".join(lines), metadata={"source": path, "block": block})
+
+def lazy_load_file(path: str):
+    """
+    Same content as load_file, yielded one page / row at a time. Text files come as
+    blocks of TEXT_BLOCK_CHARS (metadata "block"), which iter_chunks splits as one stream.
+    """
+    if _is_text(path):
+        return _text_blocks(path)
+    return _loader(path).lazy_load()
@@ -0,0 +1,113 @@
+import logging
+from sqlalchemy import select, update
+from backend.agents import ann_index
+from backend.agents.embeddings import embeddings_v2, client_for, is_v2, EMBEDDING_MODEL, EMBEDDING_V2_MODEL
+from backend.ingestion.embedding_store import embed_chunks, retain, release, stored_key
+from backend.database import SessionLocal
+from backend.models import Document
+
+logger = logging.getLogger(__name__)
+
+REEMBED_BATCH_SIZE = 64
+
+def _backlog_query(batch_size):
+    # SKIP LOCKED lets several workers drain the backlog without embedding a row twice
+    return select(Document.id, Document.content).filter(
+        Document.embedding_v2 == None,
+        Document.is_deleted == False
+    ).order_by(Document.id).limit(batch_size).with_for_update(skip_locked=True)
+
+def backfill_embeddings_v2(batch_size=REEMBED_BATCH_SIZE, on_progress=None):
+    """
+    Fills documents.embedding_v2 for every live chunk that doesn't have one yet.
+    Each batch commits on its own, so an interrupted run resumes where it stopped.
+    Returns the number of chunks embedded.
+    """
+    if embeddings_v2 is None:
+        raise RuntimeError("EMBEDDING_V2_MODEL is not configured")
+
+    done = 0
+    while True:
+        with SessionLocal() as db:
+            rows = db.execute(_backlog_query(batch_size)).all()
+            if not rows:
+                return done
+
+            vectors, keys = embed_chunks(embeddings_v2, EMBEDDING_V2_MODEL, [row.content or "" for row in rows])
+            for row, vector in zip(rows, vectors):
+                db.execute(update(Document).where(Document.id == row.id).values(
+                    embedding_v2=vector, embedding_v2_model=EMBEDDING_V2_MODEL
+                ))
+            # These chunks carry a v2 vector from now on
+            retain(db, EMBEDDING_V2_MODEL, keys, vectors)
+            db.commit()
+
+        done += len(rows)
+        logger.info(f"Re-embedded {done} chunks with the v2 model")
+        if on_progress:
+            on_progress(done)
+
+def configured_models():
+    return [model for model in (EMBEDDING_MODEL, EMBEDDING_V2_MODEL) if model]
+
+def _source_chunk_ids(source, user_id):
+    with SessionLocal() as db:
+        return db.execute(select(Document.id).filter(
+            Document.tenant_id == (user_id or 0),
+            Document.user_id == user_id,
+            Document.source == source,
+            Document.is_deleted == False
+        ).order_by(Document.chunk_index, Document.id)).scalars().all()
+
+def _previous_key(row, v2):
+    # The reference the chunk's current vector holds, if it has one in that column
+    if v2:
+        return stored_key(row.content or "", row.embedding_v2_model, EMBEDDING_V2_MODEL) if row.has_v2 else None
+    return stored_key(row.content or "", row.embedding_model, EMBEDDING_MODEL)
+
+def reembed_source(source, user_id, models=None, batch_size=REEMBED_BATCH_SIZE, on_progress=None):
+    """
+    Recomputes the vectors of every live chunk filed under `source`, for each of
+    `models` (default: every configured one). Every chunk goes to the model, also when
+    the store already has a vector for it, and the store's copy is replaced. Each chunk
+    moves its reference from the key of the model that embedded it before to the new
+    one, so switching models neither leaks nor double-releases references.
+    Each batch commits on its own. Returns the number of chunks processed.
+    """
+    models = models or configured_models()
+    ids = _source_chunk_ids(source, user_id)
+    done = 0
+    for start in range(0, len(ids), batch_size):
+        with SessionLocal() as db:
+            rows = db.execute(select(
+                Document.id, Document.content, Document.embedding_model, Document.embedding_v2_model,
+                (Document.embedding_v2 != None).label("has_v2")
+            ).filter(
+                Document.id.in_(ids[start:start + batch_size]),
+                Document.is_deleted == False
+            )).all()
+            if not rows:
+                continue
+            texts = [row.content or "" for row in rows]
+            for model in models:
+                v2 = is_v2(model)
+                vectors, keys = embed_chunks(client_for(model), model, texts, reuse=False)
+                column, model_column = ("embedding_v2", "embedding_v2_model") if v2 else ("embedding", "embedding_model")
+                # Bulk UPDATE by primary key
+                db.execute(update(Document), [
+                    {"id": row.id, column: vector, model_column: model} for row, vector in zip(rows, vectors)
+                ])
+                # Same key when the model didn't change: the count stays, the vector is refreshed
+                release(db, [key for key in (_previous_key(row, v2) for row in rows) if key])
+                retain(db, model, keys, vectors, refresh=True)
+            db.commit()
+
+        done += len(rows)
+        logger.info(f"Re-embedded {done}/{len(ids)} chunks of {source}")
+        if on_progress:
+            on_progress(done, len(ids))
+
+    # The scope's vectors changed under the index; rebuild rather than stack deltas
+    if ann_index.RETRIEVAL_ENGINE == "ann" and done:
+        ann_index.build_partition(ann_index.scope_name(user_id))
+    return done
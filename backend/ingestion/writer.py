@@ -0,0 +1,114 @@
+import io
+import os
+import csv
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import insert, update, text
+from backend.models import Document
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT / COPY statement, each batch commits on its own
+INSERT_BATCH_SIZE = int(os.getenv("INSERT_BATCH_SIZE", "500"))
+# auto | copy | insert | orm; auto picks COPY on psycopg2 and multi-row INSERT elsewhere (SQLite in tests)
+INGEST_WRITE_MODE = os.getenv("INGEST_WRITE_MODE", "auto")
+
+# Everything ingestion sets; generated columns (embedding_bit/half, content_tsv) are left to Postgres
+COPY_COLUMNS = (
+    "id", "user_id", "tenant_id", "content", "metadata", "embedding", "embedding_v2", "embedding_model",
+    "embedding_v2_model", "source", "page", "file_size", "chunk_index", "checksum", "created_at", "is_deleted",
+)
+
+def chunk_row(content, metadata, embedding, embedding_v2, user_id, chunk_index, file_size, checksum,
+              embedding_model=None, embedding_v2_model=None):
+    """Column values of one chunk, keyed by attribute name as insert(Document) expects."""
+    return {
+        "content": content,
+        "metadata_": metadata,
+        "embedding": embedding,
+        "embedding_v2": embedding_v2,
+        "embedding_model": embedding_model,
+        "embedding_v2_model": embedding_v2_model,
+        "source": metadata.get("source"),
+        "page": metadata.get("page", 0),
+        "user_id": user_id,
+        # Set here rather than by the column default so COPY gets it too
+        "tenant_id": user_id or 0,
+        "chunk_index": chunk_index,
+        "file_size": file_size,
+        "checksum": checksum,
+        "created_at": datetime.utcnow(),
+        "is_deleted": False,
+    }
+
+def _write_mode(db):
+    if INGEST_WRITE_MODE != "auto":
+        return INGEST_WRITE_MODE
+    return "copy" if db.get_bind().dialect.driver == "psycopg2" else "insert"
+
+def _vector_text(vector):
+    return None if vector is None else "[" + ",".join(repr(float(x)) for x in vector) + "]"
+
+def _copy_value(value):
+    # csv writes None as an empty unquoted field, which COPY reads as NULL
+    return "" if value is None else value
+
+def _insert_batch(db, rows):
+    result = db.execute(insert(Document).returning(Document.id, sort_by_parameter_order=True), rows)
+    return list(result.scalars())
+
+def _copy_batch(db, rows):
+    # COPY can't return ids, so they are drawn from the sequence up front
+    ids = list(db.execute(
+        text("SELECT nextval(pg_get_serial_sequence('documents', 'id')) FROM generate_series(1, :n)"),
+        {"n": len(rows)}
+    ).scalars())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for doc_id, row in zip(ids, rows):
+        writer.writerow([_copy_value(v) for v in (
+            doc_id, row["user_id"], row["tenant_id"], row["content"],
+            json.dumps(row["metadata_"]) if row["metadata_"] is not None else None,
+            _vector_text(row["embedding"]), _vector_text(row["embedding_v2"]),
+            row["embedding_model"], row["embedding_v2_model"], row["source"],
+            row["page"], row["file_size"], row["chunk_index"], row["checksum"],
+            row["created_at"].isoformat(), row["is_deleted"],
+        )])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY documents ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    return ids
+
+def _orm_batch(db, rows):
+    docs = [Document(**row) for row in rows]
+    db.add_all(docs)
+    db.flush()
+    return [doc.id for doc in docs]
+
+WRITERS = {"copy": _copy_batch, "insert": _insert_batch, "orm": _orm_batch}
+
+def write_chunks(db, rows, batch_size=None, mode=None):
+    """
+    Stores chunk rows in batches of `batch_size`, committing after each one, and
+    returns their ids in input order. Rows already committed are soft-deleted if a
+    later batch fails, so a half-written file never stays searchable.
+    """
+    batch_size = batch_size or INSERT_BATCH_SIZE
+    write = WRITERS[mode or _write_mode(db)]
+    ids = []
+    try:
+        for start in range(0, len(rows), batch_size):
+            ids.extend(write(db, rows[start:start + batch_size]))
+            db.commit()
+    except Exception:
+        db.rollback()
+        if ids:
+            logger.warning(f"Chunk write failed after {len(ids)} rows, soft-deleting them")
+            db.execute(update(Document).where(Document.id.in_(ids)).values(is_deleted=True))
+            db.commit()
+        raise
+    return ids
@@ -0,0 +1,101 @@
+import time
+import threading
+import functools
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import Counter, Histogram
+
+NODE_DURATION = Histogram(
+    "agent_node_duration_seconds",
+    "Duration of each agent graph node",
+    ["node"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 40, 80)
+)
+LLM_TOKENS = Counter(
+    "agent_llm_tokens_total",
+    "Prompt and completion tokens reported by Ollama, per node",
+    ["node", "kind"]
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "agent_llm_tokens_per_second",
+    "Ollama generation throughput per call",
+    ["node"],
+    buckets=(1, 5, 10, 20, 30, 50, 75, 100, 200)
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "agent_time_to_first_token_seconds",
+    "Time from /agent request to the first answer token",
+    ["path"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 40)
+)
+ROUTE_TOTAL = Counter("agent_route_total", "Route taken through the agent graph", ["route"])
+TOKEN_COUNT = Counter("token_count_total", "Total tokens generated")
+
+def instrument(name, func):
+    """Wraps a sync node so its duration is recorded under `name`."""
+    @functools.wraps(func)
+    def wrapper(state):
+        start = time.perf_counter()
+        try:
+            return func(state)
+        finally:
+            NODE_DURATION.labels(node=name).observe(time.perf_counter() - start)
+    return wrapper
+
+def ainstrument(name, afunc):
+    @functools.wraps(afunc)
+    async def wrapper(state):
+        start = time.perf_counter()
+        try:
+            return await afunc(state)
+        finally:
+            NODE_DURATION.labels(node=name).observe(time.perf_counter() - start)
+    return wrapper
+
+def route_label(state):
+    if not state.get("is_safe"):
+        return "unsafe"
+    if state.get("cached"):
+        return "cache"
+    return "code" if state.get("intent") == "code" else "qa"
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Reads Ollama's eval counters off every chat model run and attributes them to the graph node."""
+
+    # Counters only, safe to run on the event loop instead of an executor
+    run_inline = True
+
+    def __init__(self):
+        self.nodes = {}
+        self.lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        with self.lock:
+            self.nodes[run_id] = (metadata or {}).get("langgraph_node", "unknown")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self.lock:
+            self.nodes.pop(run_id, None)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self.lock:
+            node = self.nodes.pop(run_id, "unknown")
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if message is None:
+                    continue
+                meta = getattr(message, "response_metadata", None) or {}
+                usage = getattr(message, "usage_metadata", None) or {}
+                prompt_tokens = usage.get("input_tokens", meta.get("prompt_eval_count", 0)) or 0
+                completion_tokens = usage.get("output_tokens", meta.get("eval_count", 0)) or 0
+
+                LLM_TOKENS.labels(node=node, kind="prompt").inc(prompt_tokens)
+                LLM_TOKENS.labels(node=node, kind="completion").inc(completion_tokens)
+                TOKEN_COUNT.inc(completion_tokens)
+
+                # eval_duration is reported in nanoseconds
+                eval_duration = meta.get("eval_duration") or 0
+                if completion_tokens and eval_duration:
+                    LLM_TOKENS_PER_SECOND.labels(node=node).observe(completion_tokens / (eval_duration / 1e9))
+
+token_usage_callback = TokenUsageCallback()
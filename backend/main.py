@@ -3,7 +3,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
-from backend.graph import graph
+from backend.graph import graph, STREAMED_NODES
 from backend.auth import (
     get_db, 
     get_current_user, 
@@ -13,9 +13,28 @@ from backend.auth import (
     verify_google_token,
     get_or_create_google_user
 )
-from .tasks import ingest_document_task
+from .tasks import ingest_document_task, backfill_embeddings_v2_task, purge_chunk_embeddings_task, reembed_document_task
 from backend.models import User, Conversation as ChatSession, Message, Feedback, Document
 from backend.dependencies import require_role
+from backend.database import AsyncSessionLocal
+from backend.document_queries import document_listing_query, document_chunks_query
+from backend.instrumentation import (
+    TIME_TO_FIRST_TOKEN,
+    ROUTE_TOTAL,
+    route_label,
+    token_usage_callback
+)
+from backend.agents.ann_index import remove_documents
+from backend.ingestion.embedding_store import release_documents
+from backend.ingestion.reembed import configured_models
+from backend.agents.retriever import retrieve_batch, RETRIEVAL_BATCH_MAX
+from backend.agents.answer_cache import (
+    cache_applies,
+    store_answer,
+    astore_answer,
+    invalidate_answers,
+    replay_chunks
+)
 import os
 import shutil
 import uuid
@@ -51,7 +70,6 @@ app.add_middleware(
 # Metrics
 REQUEST_COUNT = Counter("http_requests_total", "Total HTTP Requests", ["method", "endpoint", "status"])
 AGENT_LATENCY = Histogram("agent_execution_latency_seconds", "Latency of agent execution")
-TOKEN_COUNT = Counter("token_count_total", "Total tokens generated")
 
 # Rate Limiting
 limiter = Limiter(key_func=get_remote_address)
@@ -120,6 +138,7 @@ import hashlib
 @app.post("/upload")
 async def upload_document(
     file: UploadFile = File(...), 
+    replace: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -142,6 +161,14 @@ async def upload_document(
     if existing:
         raise HTTPException(status_code=400, detail="This file has already been uploaded.")
 
+    # ?replace={document id} uploads a new version of that document; anything else is a new document
+    source = None
+    if replace is not None:
+        target = db.query(Document).filter(Document.id == replace, Document.user_id == current_user.id, Document.is_deleted == False).first()
+        if not target:
+            raise HTTPException(status_code=404, detail="Document not found")
+        source = target.source
+
     # Create temp file
     temp_dir = "temp_uploads"
     os.makedirs(temp_dir, exist_ok=True)
@@ -151,7 +178,8 @@ async def upload_document(
         buffer.write(content)
 
     # Offload to Celery with checksum
-    ingest_document_task.delay(file_path, current_user.id, checksum=checksum)
+    # A new document is filed under its unique temp path; a replacement keeps the source it replaces
+    ingest_document_task.delay(file_path, current_user.id, checksum=checksum, source=source, replace=replace is not None)
     
     return {"status": "upload successful", "message": "Processing offloaded to Celery worker", "filename": file.filename}
 
@@ -196,6 +224,64 @@ def update_conversation(
     db.commit()
     return {"status": "updated", "title": conv.title}
 
+# Run /agent on the event loop (graph.astream + async nodes) instead of a threadpool thread
+AGENT_ASYNC = os.getenv("AGENT_ASYNC", "1") == "1"
+
+def cacheable_answer(progress):
+    final = progress.get("final") or {}
+    # A replayed hit is already stored; follow-ups and unsafe questions never are
+    if final.get("cached") or not cache_applies(final) or not progress["answer"]:
+        return None
+    return "".join(progress["answer"])
+
+def render_event(mode, chunk, progress, conversation_id):
+    """Turns one (mode, chunk) pair from the graph stream into text for the client."""
+    if mode == "messages":
+        message, metadata = chunk
+        node = metadata.get("langgraph_node")
+        if node in STREAMED_NODES and message.content:
+            yield from emit(node, message.content, progress)
+        return
+
+    if mode == "custom":
+        # Tokens of a confirmed speculative branch, released by the router node
+        if chunk.get("token"):
+            yield from emit(chunk["node"], chunk["token"], progress)
+        return
+
+    for node, content in chunk.items():
+        if node in STREAMED_NODES and node not in progress["streamed_nodes"] and content.get(STREAMED_NODES[node]):
+            # Output arrived without tokens (e.g. a coalesced LLM call): send it in one piece
+            yield from emit(node, content[STREAMED_NODES[node]], progress)
+        elif node == "memory":
+            progress["final"] = content
+            ROUTE_TOTAL.labels(route=route_label(content)).inc()
+            # Nothing streamed (e.g. safety refusal): send the final answer in one piece
+            if not progress["streamed_nodes"] and content.get("debug"):
+                progress["answer"].append(content["debug"])
+                if content.get("cached"):
+                    TIME_TO_FIRST_TOKEN.labels(path="cache").observe(time.time() - progress["start"])
+                    # Word by word, like a live answer
+                    yield from replay_chunks(content["debug"])
+                else:
+                    yield content["debug"]
+            if content.get("citations"):
+                yield "\n\nSOURCES:\n"
+                yield json.dumps(content["citations"], indent=2)
+            yield f"\n\nCONVERSATION_ID: {conversation_id}"
+
+def emit(node, text, progress):
+    if progress["first_token_at"] is None:
+        progress["first_token_at"] = time.time()
+        TIME_TO_FIRST_TOKEN.labels(path="graph").observe(progress["first_token_at"] - progress["start"])
+    if progress["last_node"] and node != progress["last_node"]:
+        progress["answer"].append("\n\n")
+        yield "\n\n"
+    progress["last_node"] = node
+    progress["streamed_nodes"].add(node)
+    progress["answer"].append(text)
+    yield text
+
 @app.post("/agent")
 @limiter.limit("5/minute")
 async def run_agent(
@@ -212,9 +298,14 @@ async def run_agent(
     if not conversation_id:
         # Create new conversation if none provided
         new_conv = ChatSession(user_id=current_user.id, title=payload["question"][:30] + "...")
-        db.add(new_conv)
-        db.commit()
-        db.refresh(new_conv)
+        if AGENT_ASYNC:
+            async with AsyncSessionLocal() as adb:
+                adb.add(new_conv)
+                await adb.commit()
+        else:
+            db.add(new_conv)
+            db.commit()
+            db.refresh(new_conv)
         conversation_id = new_conv.id
     
     state = {
@@ -222,24 +313,43 @@ async def run_agent(
         "user_id": current_user.id,
         "conversation_id": conversation_id
     }
+    stream_mode = ["messages", "updates", "custom"]
+    progress = {"streamed_nodes": set(), "last_node": None, "answer": [], "final": None, "start": start_time, "first_token_at": None}
+    # Attributes Ollama token counts and throughput to the node that made the call
+    config = {"callbacks": [token_usage_callback]}
+
+    def record_latency():
+        latency = time.time() - start_time
+        AGENT_LATENCY.observe(latency)
+        logger.info(f"Agent Execution Latency: {latency:.4f}s")
     
+    # The semantic cache is a graph node after the safety verdict; answers are stored here
     def stream_tokens():
         try:
-            for event in graph.stream(state, stream_mode="updates"):
-                for node, content in event.items():
-                    if node == "debugger" and "debug" in content:
-                        yield content["debug"]
-                    elif node == "memory":
-                        if "citations" in state:
-                            yield "\n\nSOURCES:\n"
-                            yield json.dumps(state["citations"], indent=2)
-                        yield f"\n\nCONVERSATION_ID: {conversation_id}"
+            for mode, chunk in graph.stream(state, config, stream_mode=stream_mode):
+                yield from render_event(mode, chunk, progress, conversation_id)
+
+            answer = cacheable_answer(progress)
+            if answer:
+                final = progress["final"]
+                store_answer(state["question"], state["user_id"], final["query_embedding"], final["embedding_model"], answer, final.get("citations"))
         finally:
-            latency = time.time() - start_time
-            AGENT_LATENCY.observe(latency)
-            logger.info(f"Agent Execution Latency: {latency:.4f}s")
+            record_latency()
+
+    async def astream_tokens():
+        try:
+            async for mode, chunk in graph.astream(state, config, stream_mode=stream_mode):
+                for text in render_event(mode, chunk, progress, conversation_id):
+                    yield text
+
+            answer = cacheable_answer(progress)
+            if answer:
+                final = progress["final"]
+                await astore_answer(state["question"], state["user_id"], final["query_embedding"], final["embedding_model"], answer, final.get("citations"))
+        finally:
+            record_latency()
                     
-    return StreamingResponse(stream_tokens(), media_type="text/plain")
+    return StreamingResponse(astream_tokens() if AGENT_ASYNC else stream_tokens(), media_type="text/plain")
 
 from .schemas import FeedbackRequest
 
@@ -264,26 +374,38 @@ async def add_feedback(
     db.commit()
     return {"status": "feedback received"}
 
+from .schemas import BatchRetrievalRequest
+
+@app.post("/retrieve/batch")
+def batch_retrieve(request: BatchRetrievalRequest, current_user: User = Depends(get_current_user)):
+    if len(request.queries) > RETRIEVAL_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {RETRIEVAL_BATCH_MAX} queries per batch")
+    start_time = time.time()
+    results = retrieve_batch(request.queries, current_user.id)
+    # Counted once the batch succeeded; a failure surfaces as a 500 instead
+    REQUEST_COUNT.labels(method="POST", endpoint="/retrieve/batch", status="200").inc()
+    logger.info(f"Batch retrieval of {len(results)} queries: {time.time() - start_time:.4f}s")
+    return {"results": [{
+        "question": r["question"],
+        "chunks": r["chunks"],
+        "context": r["context"],
+        "citations": r["citations"],
+    } for r in results]}
+
 @app.get("/documents")
 def get_user_documents(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     from backend.models import Document
-    docs = db.query(Document).filter(Document.user_id == current_user.id, Document.is_deleted == False).order_by(Document.created_at.desc()).all()
-    
-    seen = {}
-    for d in docs:
-        src = d.source or "unknown"
-        if src not in seen:
-            seen[src] = {
-                "id": d.id, 
-                "filename": src, 
-                "size": d.file_size, 
-                "chunks": 1, 
-                "date": d.created_at.strftime("%Y-%m-%d %H:%M")
-            }
-        else:
-            seen[src]["chunks"] += 1
-            
-    return list(seen.values())
+    files = db.execute(document_listing_query(current_user.id)).all()
+    return [
+        {
+            "id": f.id,
+            "filename": f.filename,
+            "size": f.size,
+            "chunks": f.chunks,
+            "date": f.date.strftime("%Y-%m-%d %H:%M")
+        }
+        for f in files
+    ]
 
 @app.delete("/documents/{id}")
 def delete_document(id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -292,8 +414,13 @@ def delete_document(id: int, current_user: User = Depends(get_current_user), db:
     if not target:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    db.query(Document).filter(Document.source == target.source, Document.user_id == current_user.id).update({"is_deleted": True})
+    chunks = db.query(Document.id).filter(Document.source == target.source, Document.user_id == current_user.id, Document.is_deleted == False)
+    chunk_ids = [row.id for row in chunks]
+    release_documents(db, chunk_ids)
+    db.query(Document).filter(Document.tenant_id == current_user.id, Document.source == target.source, Document.user_id == current_user.id).update({"is_deleted": True})
     db.commit()
+    remove_documents(current_user.id, chunk_ids)
+    invalidate_answers(current_user.id)
     return {"status": "success", "message": f"Deleted {target.source}"}
 
 @app.get("/documents/{id}/chunks")
@@ -303,19 +430,33 @@ def get_document_chunks(id: int, current_user: User = Depends(get_current_user),
     if not target:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    chunks = db.query(Document).filter(Document.source == target.source, Document.user_id == current_user.id, Document.is_deleted == False).order_by(Document.chunk_index).all()
+    chunks = db.execute(document_chunks_query(target.source, current_user.id)).all()
     return {
         "filename": target.source,
         "chunks": [{"index": c.chunk_index, "content": c.content} for c in chunks]
     }
 
 @app.post("/documents/{id}/reembed")
-def reembed_document(id: int, current_user: User = Depends(require_role("admin")), db: Session = Depends(get_db)):
+def reembed_document(id: int, model: Optional[str] = None, current_user: User = Depends(require_role("admin")), db: Session = Depends(get_db)):
     target = db.query(Document).filter(Document.id == id, Document.user_id == current_user.id).first()
     if not target:
         raise HTTPException(status_code=404, detail="Document not found")
-    
-    return {"status": "success", "message": f"Re-embedding triggered for {target.source}"}
+    if model is not None and model not in configured_models():
+        raise HTTPException(status_code=400, detail=f"Model must be one of: {', '.join(configured_models())}")
+
+    task = reembed_document_task.delay(target.source, current_user.id, model=model)
+    return {"status": "queued", "task_id": task.id, "message": f"Re-embedding triggered for {target.source}"}
+
+@app.post("/admin/embeddings/backfill")
+def backfill_embeddings(current_user = Depends(require_role("admin")), db: Session = Depends(get_db)):
+    missing = db.query(Document).filter(Document.embedding_v2 == None, Document.is_deleted == False).count()
+    task = backfill_embeddings_v2_task.delay()
+    return {"status": "queued", "task_id": task.id, "missing": missing}
+
+@app.post("/admin/embeddings/purge")
+def purge_embeddings(current_user = Depends(require_role("admin"))):
+    task = purge_chunk_embeddings_task.delay()
+    return {"status": "queued", "task_id": task.id}
 
 @app.get("/admin/stats")
 def admin_stats(current_user = Depends(require_role("admin")), db: Session = Depends(get_db)):
@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, Text, String, ForeignKey, DateTime, Boolean
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import JSONB
-from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, Integer, Text, String, ForeignKey, DateTime, Boolean, Computed
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from pgvector.sqlalchemy import Vector, HALFVEC, BIT
 from backend.database import Base
 from datetime import datetime
+import os
+
+# Width of the dedicated embedding model's vectors (documents.embedding_v2)
+EMBEDDING_V2_DIM = int(os.getenv("EMBEDDING_V2_DIM", "768"))
 
 class User(Base):
     __tablename__ = "users"
@@ -59,16 +63,33 @@ class Chat(Base):
 
     conversation = relationship("Conversation", back_populates="chats")
 
+def _tenant_id(context):
+    return context.get_current_parameters().get("user_id") or 0
+
 class Document(Base):
     __tablename__ = "documents"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True) # Nullable for public docs
+    # Partition key: user_id, 0 for public docs. Filter on it so Postgres prunes partitions.
+    tenant_id = Column(Integer, nullable=False, default=_tenant_id)
     content = Column(Text)
     metadata_ = Column("metadata", JSONB)
-    embedding = Column(Vector(4096))  # 4096 for llama3
+    # Vector and search columns are deferred: only explicit column selects read
+    # them, loading a Document for its content never pulls ~16 KB of vector
+    embedding = deferred(Column(Vector(4096)))  # 4096 for llama3
+    # Compact copies of `embedding` maintained by Postgres, used for the first search stage
+    embedding_bit = deferred(Column(BIT(4096), Computed("binary_quantize(embedding)::bit(4096)", persisted=True)))
+    embedding_half = deferred(Column(HALFVEC(4096), Computed("embedding::halfvec(4096)", persisted=True)))
+    # Dedicated embedding model, narrow enough for the HNSW index
+    embedding_v2 = deferred(Column(Vector(EMBEDDING_V2_DIM), nullable=True))
+    # Models that produced the two vectors; their chunk_embeddings references are keyed by them
+    embedding_model = Column(String, nullable=True)
+    embedding_v2_model = Column(String, nullable=True)
     source = Column(String)
     page = Column(Integer)
+    # Full-text index input; 'simple' keeps identifiers and error names unstemmed
+    content_tsv = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', coalesce(content, ''))", persisted=True)))
     
     # Stage 8 Governance Fields
     file_size = Column(Integer, nullable=True)
@@ -91,3 +112,34 @@ class Feedback(Base):
 
     message = relationship("Message", back_populates="feedbacks")
     user = relationship("User", back_populates="feedbacks")
+
+class AnswerCache(Base):
+    __tablename__ = "answer_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    question = Column(Text)
+    # Unsized so the cache follows whichever embedding model is configured
+    embedding = Column(Vector())
+    embedding_model = Column(String)
+    # Scope version (public + user's own documents) the answer was generated against
+    corpus_version = Column(String)
+    answer = Column(Text)
+    citations = Column(JSONB)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class ChunkEmbedding(Base):
+    __tablename__ = "chunk_embeddings"
+
+    # sha256 of model + chunk text: one row per distinct chunk per embedding model
+    content_hash = Column(String(64), primary_key=True)
+    model = Column(String, nullable=False)
+    # Unsized so every configured embedding model fits
+    embedding = Column(Vector())
+    # Live (not soft-deleted) document chunks using this vector; 0 makes it purgeable
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Partial index ix_chunk_embeddings_unreferenced (migration) serves the purge
+    last_used_at = Column(DateTime, default=datetime.utcnow)
@@ -28,3 +28,6 @@ class FeedbackRequest(BaseModel):
     message_id: int
     rating: int = Field(description="1 for thumbs up, -1 for thumbs down")
     comment: Optional[str] = None
+
+class BatchRetrievalRequest(BaseModel):
+    queries: List[str] = Field(description="Questions to retrieve context for")
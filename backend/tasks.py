@@ -1,17 +1,55 @@
 from .celery_app import celery_app
 from .ingestion.ingest import ingest_file
+from .ingestion.reembed import backfill_embeddings_v2, reembed_source, REEMBED_BATCH_SIZE
+from .ingestion.embedding_store import purge_chunk_embeddings
+from .agents.answer_cache import invalidate_answers
 import os
 
-@celery_app.task(name="tasks.ingest_document")
-def ingest_document_task(file_path: str, user_id: int, checksum: str = None):
+# Acked only once done: if the worker dies mid-file the task is redelivered and
+# ingestion resumes from the last committed chunk (the temp file is still there)
+@celery_app.task(name="tasks.ingest_document", acks_late=True, reject_on_worker_lost=True)
+def ingest_document_task(file_path: str, user_id: int, checksum: str = None, source: str = None, replace: bool = False):
     """
     Background task to ingest a document and clean up the temp file.
+    With `replace`, the file is a new version of `source` and is re-ingested incrementally.
     """
     try:
         # Perform the actual ingestion
-        ingest_file(file_path, user_id=user_id, checksum=checksum)
+        ingest_file(file_path, user_id=user_id, checksum=checksum, source=source, replace=replace)
+        # New chunks are visible to retrieval now, cached answers for this scope are stale
+        invalidate_answers(user_id)
     finally:
         # Always clean up the temp file
         if os.path.exists(file_path):
             os.remove(file_path)
     return {"status": "success", "file": file_path}
+
+@celery_app.task(name="tasks.backfill_embeddings_v2", bind=True)
+def backfill_embeddings_v2_task(self, batch_size: int = REEMBED_BATCH_SIZE):
+    """
+    Fills the dedicated embedding column for existing chunks.
+    Retrieval switches to the indexed column once nothing is left to fill.
+    """
+    def report(done):
+        self.update_state(state="PROGRESS", meta={"embedded": done})
+
+    done = backfill_embeddings_v2(batch_size=batch_size, on_progress=report)
+    return {"status": "success", "embedded": done}
+
+@celery_app.task(name="tasks.purge_chunk_embeddings")
+def purge_chunk_embeddings_task():
+    """Drops stored chunk vectors no live document references anymore."""
+    return {"status": "success", "purged": purge_chunk_embeddings()}
+
+@celery_app.task(name="tasks.reembed_document", bind=True, acks_late=True)
+def reembed_document_task(self, source: str, user_id: int, model: str = None, batch_size: int = REEMBED_BATCH_SIZE):
+    """
+    Re-embeds every chunk of one uploaded file, with `model` or every configured model.
+    """
+    def report(done, total):
+        self.update_state(state="PROGRESS", meta={"embedded": done, "total": total})
+
+    done = reembed_source(source, user_id, models=[model] if model else None, batch_size=batch_size, on_progress=report)
+    # Rankings within the scope may have moved, cached answers are stale
+    invalidate_answers(user_id)
+    return {"status": "success", "source": source, "embedded": done}
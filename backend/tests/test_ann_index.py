@@ -0,0 +1,69 @@
+import os
+import json
+import numpy as np
+from unittest.mock import patch
+from backend.agents import ann_index
+
+MODEL = "test-embed"
+
+def write_flat_partition(root, scope, ids, vectors):
+    path = os.path.join(root, scope, "gen-1")
+    os.makedirs(path)
+    np.save(os.path.join(path, "vectors.npy"), np.asarray(vectors, dtype=np.float32))
+    np.save(os.path.join(path, "ids.npy"), np.asarray(ids, dtype=np.int64))
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump({"model": MODEL, "metric": "l2", "dim": 2, "count": len(ids), "nlist": 0, "deltas": []}, f)
+    with open(os.path.join(root, scope, "CURRENT"), "w") as f:
+        f.write("gen-1")
+
+def test_search_merges_public_and_user_partitions(tmp_path):
+    write_flat_partition(tmp_path, "public", [1, 2], [[0, 0], [10, 10]])
+    write_flat_partition(tmp_path, "user-7", [3], [[1, 1]])
+    with patch.object(ann_index, "ANN_INDEX_DIR", str(tmp_path)):
+        assert ann_index.search([0.1, 0.1], 7, MODEL, 2) == [1, 3]
+        # Other users only see the public partition
+        assert ann_index.search([0.1, 0.1], 8, MODEL, 2) == [1, 2]
+
+def test_deltas_and_tombstones_are_visible_to_readers(tmp_path):
+    write_flat_partition(tmp_path, "public", [1, 2], [[0, 0], [10, 10]])
+    with patch.object(ann_index, "ANN_INDEX_DIR", str(tmp_path)), \
+         patch.object(ann_index, "RETRIEVAL_ENGINE", "ann"):
+        assert ann_index.search([0, 0], None, MODEL, 1) == [1]
+        ann_index.add_documents(None, [5], [[0.5, 0.5]], MODEL)
+        ann_index.remove_documents(None, [1])
+        assert ann_index.search([0, 0], None, MODEL, 2) == [5, 2]
+
+def test_unbuilt_index_or_other_model_falls_back(tmp_path):
+    with patch.object(ann_index, "ANN_INDEX_DIR", str(tmp_path)):
+        assert ann_index.search([0, 0], 1, MODEL, 3) is None
+        write_flat_partition(tmp_path, "public", [1], [[0, 0]])
+        assert ann_index.search([0, 0], 1, "other-model", 3) is None
+
+def test_many_deltas_are_merged_into_one_segment(tmp_path):
+    write_flat_partition(tmp_path, "public", [1, 2], [[0, 0], [10, 10]])
+    with patch.object(ann_index, "ANN_INDEX_DIR", str(tmp_path)), \
+         patch.object(ann_index, "RETRIEVAL_ENGINE", "ann"), \
+         patch.object(ann_index, "ANN_MAX_DELTAS", 3):
+        for doc_id in range(10, 13):
+            ann_index.add_documents(None, [doc_id], [[doc_id, doc_id]], MODEL)
+        ann_index.remove_documents(None, [11])
+        ann_index.add_documents(None, [13], [[0.5, 0.5]], MODEL)
+
+        path = tmp_path / "public" / "gen-1"
+        manifest = json.loads((path / "manifest.json").read_text())
+        assert len(manifest["deltas"]) == 1
+        assert np.load(path / f"{manifest['deltas'][0]}.ids.npy").tolist() == [10, 12, 13]
+        assert len(list(path.glob("delta-*.npy"))) == 2
+        assert ann_index.search([0, 0], None, MODEL, 3) == [1, 13, 2]
+
+def test_large_delta_tail_triggers_a_rebuild(tmp_path):
+    write_flat_partition(tmp_path, "public", [1, 2], [[0, 0], [10, 10]])
+    with patch.object(ann_index, "ANN_INDEX_DIR", str(tmp_path)), \
+         patch.object(ann_index, "RETRIEVAL_ENGINE", "ann"), \
+         patch.object(ann_index, "ANN_MIN_IVF_ROWS", 10), \
+         patch.object(ann_index, "_build") as build:
+        ann_index.add_documents(None, [3], [[1, 1]], MODEL)
+        build.assert_not_called()
+        ann_index.add_documents(None, [4, 5], [[2, 2], [3, 3]], MODEL)
+
+    build.assert_called_once_with("public", MODEL)
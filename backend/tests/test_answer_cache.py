@@ -0,0 +1,78 @@
+import asyncio
+from unittest.mock import patch, MagicMock
+from backend.agents.answer_cache import answer_cache_agent, aanswer_cache_agent
+from backend.agents.retriever import retriever_agent
+
+HIT = {"id": 7, "answer": "Use the --force flag.", "citations": [{"source": "cli.md", "page": 0}]}
+
+def question(**extra):
+    return {"question": "How do I skip the prompt?", "user_id": 1, "is_safe": True, "history": [],
+            "query_embedding": [0.1, 0.2], "embedding_model": "nomic-embed-text", **extra}
+
+def test_hit_answers_with_the_retrievers_vector():
+    with patch("backend.agents.answer_cache.lookup_answer", return_value=HIT) as lookup:
+        state = answer_cache_agent(question())
+
+    lookup.assert_called_once_with(1, [0.1, 0.2], "nomic-embed-text")
+    assert state["cached"] is True
+    assert state["debug"] == HIT["answer"]
+    assert state["citations"] == HIT["citations"]
+
+def test_follow_up_questions_skip_the_cache():
+    history = [{"role": "user", "content": "List the CLI flags"}, {"role": "assistant", "content": "--force, --quiet"}]
+    with patch("backend.agents.answer_cache.lookup_answer", return_value=HIT) as lookup, \
+         patch("backend.agents.answer_cache.alookup_answer", return_value=HIT) as alookup:
+        state = answer_cache_agent(question(question="and the second one?", history=history))
+        astate = asyncio.run(aanswer_cache_agent(question(question="and the second one?", history=history)))
+
+    lookup.assert_not_called()
+    alookup.assert_not_called()
+    assert "cached" not in state and "cached" not in astate
+
+def test_unsafe_questions_skip_the_cache():
+    with patch("backend.agents.answer_cache.lookup_answer", return_value=HIT) as lookup:
+        state = answer_cache_agent(question(is_safe=False))
+
+    lookup.assert_not_called()
+    assert "cached" not in state
+
+def test_retrieval_cache_hit_still_reaches_the_answer_cache():
+    redis = MagicMock()
+    redis.get.return_value = None
+    client = MagicMock()
+    client.embed_query.return_value = [0.1, 0.2]
+    hit = MagicMock(content="Pass --force.", source="cli.md", page=0)
+    with patch("backend.agents.retriever.redis_client", redis), \
+         patch("backend.agents.retriever.corpus_version", return_value=3), \
+         patch("backend.agents.retriever.SessionLocal", MagicMock()), \
+         patch("backend.agents.retriever.client_for", return_value=client), \
+         patch("backend.agents.retriever.use_lexical_fast_path", return_value=False), \
+         patch("backend.agents.retriever.fetch_neighbours", return_value=[]), \
+         patch("backend.agents.retriever.COMPACT_CONTEXT", False), \
+         patch("backend.agents.retriever.retrieve_documents", return_value=[hit]):
+        retriever_agent({"question": "How do I skip the prompt?", "user_id": 1, "embedding_model": "nomic-embed-text"})
+        # The repeat is served from the retrieval cache, without embedding again
+        redis.get.return_value = redis.setex.call_args.args[2]
+        state = retriever_agent({"question": "How do I skip the prompt?", "user_id": 1})
+
+    assert client.embed_query.call_count == 1
+    assert state["query_embedding"] == [0.1, 0.2]
+    with patch("backend.agents.answer_cache.lookup_answer", return_value=HIT) as lookup:
+        state = answer_cache_agent({**state, "is_safe": True, "history": []})
+
+    lookup.assert_called_once_with(1, [0.1, 0.2], "nomic-embed-text")
+    assert state["cached"] is True
+
+def test_question_without_a_vector_is_embedded_for_the_lookup():
+    # The lexical fast path answers retrieval without embedding the question
+    client = MagicMock()
+    client.embed_query.return_value = [0.3, 0.4]
+    with patch("backend.agents.answer_cache.client_for", return_value=client), \
+         patch("backend.agents.answer_cache.active_model", return_value="nomic-embed-text"), \
+         patch("backend.agents.answer_cache.lookup_answer", return_value=None) as lookup:
+        state = answer_cache_agent(question(query_embedding=None, embedding_model=None))
+
+    lookup.assert_called_once_with(1, [0.3, 0.4], "nomic-embed-text")
+    # Kept so the answer can be stored under the same vector afterwards
+    assert state["query_embedding"] == [0.3, 0.4]
+    assert "cached" not in state
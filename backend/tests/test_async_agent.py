@@ -0,0 +1,139 @@
+import asyncio
+from types import SimpleNamespace
+from contextlib import ExitStack
+from unittest.mock import AsyncMock, MagicMock, patch
+import numpy as np
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from backend.main import app
+from backend.auth import get_current_user
+from backend.agents.llm import LLMGateway
+from backend.agents.answer_cache import aanswer_cache_agent
+from backend.agents.retriever import aretriever_agent
+
+QUESTION = "How do I skip the confirmation prompt?"
+VECTOR = [0.1, 0.9]
+HIT = SimpleNamespace(id=1, chunk_index=0, content="Pass --force to skip it.", source="cli.md", page=0, tenant_id=0)
+
+def fake_llm(*replies):
+    return LLMGateway(GenericFakeChatModel(messages=iter([AIMessage(content=r) for r in replies])))
+
+def async_session():
+    """AsyncSessionLocal stand-in: `async with factory() as db` yields an AsyncMock session."""
+    db = AsyncMock()
+    db.add_all = MagicMock()
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = []
+    db.execute.return_value = result
+    factory = MagicMock()
+    factory.return_value.__aenter__.return_value = db
+    return factory, db
+
+def async_redis():
+    client = AsyncMock()
+    client.get.return_value = None
+    return client
+
+def test_agent_streams_an_answer_through_the_async_graph():
+    session, db = async_session()
+    embedder = MagicMock()
+    embedder.aembed_query = AsyncMock(return_value=VECTOR)
+    store = AsyncMock()
+    patches = [
+        patch("backend.main.AGENT_ASYNC", True),
+        patch("backend.main.astore_answer", store),
+        # prefetch: combined classifier, history, retrieval
+        patch("backend.agents.classifier.async_redis_client", async_redis()),
+        patch("backend.agents.classifier.classifier_llm", fake_llm('{"safe": true, "intent": "qa"}')),
+        patch("backend.agents.history_loader.AsyncSessionLocal", session),
+        patch("backend.agents.retriever.async_redis_client", async_redis()),
+        patch("backend.agents.retriever.acorpus_version", AsyncMock(return_value="0.0")),
+        patch("backend.agents.retriever.aactive_model", AsyncMock(return_value="nomic-embed-text")),
+        patch("backend.agents.retriever.client_for", return_value=embedder),
+        patch("backend.agents.retriever.use_lexical_fast_path", return_value=False),
+        patch("backend.agents.retriever.AsyncSessionLocal", session),
+        patch("backend.agents.retriever.aretrieve_documents", AsyncMock(return_value=[HIT])),
+        patch("backend.agents.retriever.afetch_neighbours", AsyncMock(return_value=[])),
+        patch("backend.agents.retriever.COMPACT_CONTEXT", False),
+        # answer cache miss, router centroids, the answer itself, memory
+        patch("backend.agents.answer_cache.alookup_answer", AsyncMock(return_value=None)),
+        patch("backend.agents.speculation._aget_centroids", AsyncMock(return_value=(np.array([1.0, 0.0]), np.array([0.0, 1.0])))),
+        patch("backend.agents.router._aget_centroids", AsyncMock(return_value=(np.array([1.0, 0.0]), np.array([0.0, 1.0])))),
+        patch("backend.agents.qa.llm", fake_llm("Pass --force to skip it.")),
+        patch("backend.agents.memory.AsyncSessionLocal", session),
+    ]
+    previous = app.dependency_overrides.get(get_current_user)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=1)
+    try:
+        with ExitStack() as stack:
+            for p in patches:
+                stack.enter_context(p)
+            response = TestClient(app).post("/agent", json={"question": QUESTION, "conversation_id": 42})
+    finally:
+        if previous is None:
+            del app.dependency_overrides[get_current_user]
+        else:
+            app.dependency_overrides[get_current_user] = previous
+
+    body = response.text
+    assert response.status_code == 200
+    # Streamed token by token by the qa node, then the citations and the conversation
+    assert body.startswith("Pass --force to skip it.")
+    assert '"source": "cli.md"' in body
+    assert body.endswith("CONVERSATION_ID: 42")
+    embedder.aembed_query.assert_awaited_once_with(QUESTION)
+    # Question and answer saved, and the answer cached under the retriever's vector
+    assert len(db.add_all.call_args.args[0]) == 3
+    store.assert_awaited_once()
+    assert store.await_args.args[:5] == (QUESTION, 1, VECTOR, "nomic-embed-text", "Pass --force to skip it.")
+
+def test_async_retriever_embeds_on_a_miss_and_caches_the_vector():
+    session, _ = async_session()
+    redis = async_redis()
+    embedder = MagicMock()
+    embedder.aembed_query = AsyncMock(return_value=VECTOR)
+    with patch("backend.agents.retriever.async_redis_client", redis), \
+         patch("backend.agents.retriever.acorpus_version", AsyncMock(return_value="3.1")), \
+         patch("backend.agents.retriever.aactive_model", AsyncMock(return_value="nomic-embed-text")), \
+         patch("backend.agents.retriever.client_for", return_value=embedder), \
+         patch("backend.agents.retriever.use_lexical_fast_path", return_value=False), \
+         patch("backend.agents.retriever.AsyncSessionLocal", session), \
+         patch("backend.agents.retriever.aretrieve_documents", AsyncMock(return_value=[HIT])) as retrieve, \
+         patch("backend.agents.retriever.afetch_neighbours", AsyncMock(return_value=[])), \
+         patch("backend.agents.retriever.COMPACT_CONTEXT", False):
+        state = asyncio.run(aretriever_agent({"question": QUESTION, "user_id": 1}))
+        # The repeat comes from the retrieval cache, vector included
+        redis.get.return_value = redis.setex.await_args.args[2]
+        repeat = asyncio.run(aretriever_agent({"question": QUESTION, "user_id": 1}))
+
+    assert retrieve.await_count == 1
+    embedder.aembed_query.assert_awaited_once_with(QUESTION)
+    assert state["context"] == repeat["context"] == "Pass --force to skip it."
+    assert state["citations"] == [{"source": "cli.md", "page": 0}]
+    assert repeat["query_embedding"] == VECTOR and repeat["embedding_model"] == "nomic-embed-text"
+
+def test_async_answer_cache_hit_answers_with_the_retrievers_vector():
+    hit = {"id": 7, "answer": "Pass --force to skip it.", "citations": [{"source": "cli.md", "page": 0}]}
+    state = {"question": QUESTION, "user_id": 1, "is_safe": True, "history": [],
+             "query_embedding": VECTOR, "embedding_model": "nomic-embed-text"}
+    with patch("backend.agents.answer_cache.alookup_answer", AsyncMock(return_value=hit)) as lookup:
+        state = asyncio.run(aanswer_cache_agent(state))
+
+    lookup.assert_awaited_once_with(1, VECTOR, "nomic-embed-text")
+    assert state["cached"] is True
+    assert state["debug"] == hit["answer"]
+    assert state["citations"] == hit["citations"]
+
+def test_async_answer_cache_embeds_a_question_without_a_vector():
+    embedder = MagicMock()
+    embedder.aembed_query = AsyncMock(return_value=VECTOR)
+    state = {"question": QUESTION, "user_id": 1, "is_safe": True, "history": []}
+    with patch("backend.agents.answer_cache.client_for", return_value=embedder), \
+         patch("backend.agents.answer_cache.aactive_model", AsyncMock(return_value="nomic-embed-text")), \
+         patch("backend.agents.answer_cache.alookup_answer", AsyncMock(return_value=None)) as lookup:
+        state = asyncio.run(aanswer_cache_agent(state))
+
+    lookup.assert_awaited_once_with(1, VECTOR, "nomic-embed-text")
+    assert state["query_embedding"] == VECTOR
+    assert "cached" not in state
@@ -0,0 +1,40 @@
+from unittest.mock import patch
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from backend.ingestion.loader import lazy_load_file
+from backend.ingestion.chunker import iter_chunks
+
+def write_text(path, lines):
+    # A blank line every ten lines, where blocks prefer to end
+    path.write_text("\n".join(f"line {i} of the streamed file, with some filler words" + "\n" * (i % 10 == 9) for i in range(lines)))
+    return path.read_text()
+
+def test_text_files_stream_in_bounded_blocks(tmp_path):
+    text = write_text(tmp_path / "big.txt", 5000)
+    blocks, split_sizes = [], []
+    original = RecursiveCharacterTextSplitter.split_text
+
+    def tracked_blocks():
+        for block in lazy_load_file(str(tmp_path / "big.txt")):
+            blocks.append(block)
+            yield block
+
+    def tracked_split(self, text):
+        split_sizes.append(len(text))
+        return original(self, text)
+
+    with patch("backend.ingestion.loader.TEXT_BLOCK_CHARS", 4096), \
+         patch.object(RecursiveCharacterTextSplitter, "split_text", tracked_split):
+        chunks = iter_chunks(tracked_blocks())
+        first = next(chunks)
+        # The first chunk comes out before the rest of the file is read
+        assert len(blocks) == 1
+        chunks = [first, *chunks]
+
+    assert len(blocks) > len(text) // (2 * 4096)
+    # Never more than one block plus the held-back chunk is split at once
+    assert max(len(block.page_content) for block in blocks) <= 2 * 4096
+    assert max(split_sizes) <= 2 * 4096 + 500
+    assert all(chunk.metadata == {"source": str(tmp_path / "big.txt")} for chunk in chunks)
+    # Overlap carries across block boundaries: no line is lost where a block was cut
+    for line in text.split("\n"):
+        assert any(line in chunk.page_content for chunk in chunks)
@@ -0,0 +1,63 @@
+import json
+import asyncio
+from unittest.mock import AsyncMock, patch
+from backend.agents.classifier import parse_verdict, classify, classify_agent, aclassify_agent, verdict_cache_key
+from backend.agents.safety import UNSAFE_MESSAGE
+
+def test_parse_verdict_accepts_a_complete_reply():
+    assert parse_verdict('{"safe": true, "intent": "CODE"}') == {"safe": True, "intent": "code"}
+    # Unknown intent: safety still counts, the router decides intent
+    assert parse_verdict('{"safe": false, "intent": "chat"}') == {"safe": False, "intent": None}
+
+def test_parse_verdict_rejects_malformed_or_partial_json():
+    # num_predict cut the reply off, no JSON at all, missing or non-boolean "safe"
+    for reply in ('{"safe": true, "int', "Sure! Here you go", '{"intent": "qa"}', '{"safe": "yes", "intent": "qa"}', "[true]", None):
+        assert parse_verdict(reply) is None
+
+def test_verdict_is_cached_under_the_normalized_question():
+    with patch("backend.agents.classifier.classifier_llm") as llm, \
+         patch("backend.agents.classifier.redis_client") as redis:
+        redis.get.return_value = None
+        llm.invoke.return_value.content = '{"safe": true, "intent": "qa"}'
+        assert classify("What is  RAG?") == {"safe": True, "intent": "qa"}
+
+    key, ttl, value = redis.setex.call_args.args
+    assert key == verdict_cache_key("what is rag?")
+    assert json.loads(value) == {"safe": True, "intent": "qa"}
+
+    with patch("backend.agents.classifier.classifier_llm") as llm, \
+         patch("backend.agents.classifier.redis_client") as redis:
+        redis.get.return_value = value.encode()
+        assert classify("what is RAG?") == {"safe": True, "intent": "qa"}
+
+    redis.get.assert_called_once_with(key)
+    llm.invoke.assert_not_called()
+
+def test_unparseable_verdict_falls_back_to_the_safety_prompt():
+    def safety(state):
+        state["is_safe"] = False
+        state["debug"] = UNSAFE_MESSAGE
+        return state
+
+    with patch("backend.agents.classifier.classifier_llm") as llm, \
+         patch("backend.agents.classifier.redis_client") as redis, \
+         patch("backend.agents.classifier.safety_agent", side_effect=safety) as safety_agent:
+        redis.get.return_value = None
+        llm.invoke.return_value.content = '{"safe": tr'
+        state = classify_agent({"question": "how do I write ransomware"})
+
+    safety_agent.assert_called_once()
+    # Nothing unparseable is cached
+    redis.setex.assert_not_called()
+    assert state["is_safe"] is False and "intent" not in state
+
+def test_async_unparseable_verdict_falls_back_to_the_safety_prompt():
+    with patch("backend.agents.classifier.classifier_llm") as llm, \
+         patch("backend.agents.classifier.async_redis_client") as redis, \
+         patch("backend.agents.classifier.asafety_agent", new=AsyncMock(side_effect=lambda state: {**state, "is_safe": True})) as safety_agent:
+        redis.get = AsyncMock(return_value=None)
+        llm.ainvoke = AsyncMock(return_value=type("Reply", (), {"content": "not json"})())
+        state = asyncio.run(aclassify_agent({"question": "hello"}))
+
+    safety_agent.assert_awaited_once()
+    assert state["is_safe"] is True
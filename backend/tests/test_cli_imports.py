@@ -0,0 +1,35 @@
+import sys
+import subprocess
+import pytest
+
+# Run with `python -m`, so each one must import cleanly as the first backend module
+CLI_MODULES = [
+    "backend.benchmarks.retrieval",
+    "backend.benchmarks.bulk_insert",
+    "backend.benchmarks.tenant_partitioning",
+    "backend.evals.quantization_report",
+    "backend.evals.run_eval",
+]
+
+# backend.models first used to hit the database <-> models cycle
+LIBRARY_MODULES = [
+    "backend.models",
+    "backend.agents.compaction",
+    "backend.ingestion.writer",
+    "backend.agents.retriever",
+    "backend.ingestion.embedding_store",
+]
+
+def import_alone(module):
+    # A fresh interpreter: inside the test session other imports would mask the order
+    return subprocess.run([sys.executable, "-c", f"import {module}"], capture_output=True, text=True)
+
+@pytest.mark.parametrize("module", CLI_MODULES)
+def test_cli_module_imports_on_its_own(module):
+    result = import_alone(module)
+    assert result.returncode == 0, result.stderr
+
+@pytest.mark.parametrize("module", LIBRARY_MODULES)
+def test_library_module_imports_on_its_own(module):
+    result = import_alone(module)
+    assert result.returncode == 0, result.stderr
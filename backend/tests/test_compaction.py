@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+from backend.agents.compaction import compact, next_chunk_keys
+
+def chunk(id, index, content, source="app.py", page=None, tenant_id=0):
+    return SimpleNamespace(id=id, chunk_index=index, content=content, source=source, page=page, tenant_id=tenant_id)
+
+def test_adjacent_chunks_merge_without_repeating_the_overlap():
+    first = chunk(1, 4, "def load(path):\n    with open(path) as f:\n        return json.load(f)")
+    second = chunk(2, 5, "        return json.load(f)\n\ndef save(path, data):\n    pass", page=2)
+    chunks, citations = compact([second, first])
+    assert chunks == ["def load(path):\n    with open(path) as f:\n        return json.load(f)\n\ndef save(path, data):\n    pass"]
+    assert citations == [{"source": "app.py", "page": None}, {"source": "app.py", "page": 2}]
+
+def test_unrelated_hits_keep_rank_order_and_citations():
+    hits = [chunk(1, 9, "Raised on timeout."), chunk(2, 2, "Config is read once."), chunk(3, 2, "Other file.", source="b.py")]
+    chunks, citations = compact(hits)
+    assert chunks == ["Raised on timeout.", "Config is read once.", "Other file."]
+    assert citations == [{"source": "app.py", "page": None}, {"source": "b.py", "page": None}]
+
+def test_cut_off_hit_is_completed_up_to_the_sentence_end():
+    hit = chunk(1, 0, "The worker retries the task three")
+    assert next_chunk_keys([hit]) == [(0, "app.py", 1)]
+    pulled = chunk(2, 1, "times before giving up. Then it logs the error.")
+    chunks, _ = compact([hit], [pulled])
+    assert chunks == ["The worker retries the task three times before giving up."]
@@ -0,0 +1,30 @@
+from unittest.mock import patch
+from backend.ingestion.embedder import embed_texts
+
+class FlakyClient:
+    model = "test"
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("ollama unavailable")
+        return [[float(text)] for text in texts]
+
+def test_batches_come_back_in_input_order():
+    client = FlakyClient()
+    texts = [str(i) for i in range(10)]
+    vectors = embed_texts(client, texts, batch_size=3, concurrency=2)
+    assert vectors == [[float(i)] for i in range(10)]
+    assert sorted(len(call) for call in client.calls) == [1, 3, 3, 3]
+
+def test_failed_batch_is_retried():
+    client = FlakyClient(failures=2)
+    with patch("backend.ingestion.embedder.EMBED_RETRY_BACKOFF", 0):
+        vectors = embed_texts(client, ["1", "2"], batch_size=2, concurrency=1, max_retries=2)
+    assert vectors == [[1.0], [2.0]]
+    assert len(client.calls) == 3
@@ -0,0 +1,63 @@
+import numpy as np
+from unittest.mock import MagicMock, patch
+from backend.agents.embedding_cache import CachedEmbeddings
+
+def test_repeated_text_is_embedded_once():
+    client = MagicMock()
+    client.embed_documents.side_effect = lambda texts: [[float(len(t)), 0.5] for t in texts]
+    cached = CachedEmbeddings(client, "test-model")
+
+    with patch("backend.agents.embedding_cache.redis_client") as redis:
+        redis.mget.return_value = [None]
+        redis.pipeline.return_value.execute.return_value = [True, 1, 1]
+
+        first = cached.embed_query("what is  the plan")
+        # Whitespace-only differences share the cache entry
+        second = cached.embed_query("what is the plan ")
+
+    assert first == second == [17.0, 0.5]
+    client.embed_documents.assert_called_once_with(["what is  the plan"])
+
+def test_redis_hit_skips_the_model():
+    client = MagicMock()
+    cached = CachedEmbeddings(client, "test-model")
+
+    with patch("backend.agents.embedding_cache.redis_client") as redis:
+        redis.mget.return_value = [np.asarray([0.25, 1.0], dtype=np.float32).tobytes()]
+        redis.pipeline.return_value.execute.return_value = [1, 1]
+
+        assert cached.embed_query("hello") == [0.25, 1.0]
+
+    client.embed_documents.assert_not_called()
+
+def test_miss_and_hit_return_the_same_vector():
+    client = MagicMock()
+    client.embed_documents.return_value = [[0.1, 1 / 3]]
+    cached = CachedEmbeddings(client, "test-model")
+
+    with patch("backend.agents.embedding_cache.redis_client") as redis:
+        redis.mget.return_value = [None]
+        redis.pipeline.return_value.execute.return_value = [True, 1, 1]
+        miss = cached.embed_query("hello")
+        stored = redis.pipeline.return_value.set.call_args.args[1]
+
+    with patch("backend.agents.embedding_cache.redis_client") as redis:
+        redis.mget.return_value = [stored]
+        redis.pipeline.return_value.execute.return_value = [1, 1]
+        hit = CachedEmbeddings(client, "test-model").embed_query("hello")
+
+    assert miss == hit
+
+def test_ingestion_bypasses_the_redis_tier():
+    client = MagicMock()
+    client.embed_documents.side_effect = lambda texts: [[0.5, 0.5] for _ in texts]
+    cached = CachedEmbeddings(client, "test-model")
+
+    with patch("backend.agents.embedding_cache.redis_client") as redis, \
+         patch("backend.ingestion.embedding_store.CHUNK_EMBEDDING_STORE", False):
+        from backend.ingestion.embedding_store import embed_chunks
+        vectors, _ = embed_chunks(cached, "test-model", ["chunk one", "chunk two"])
+
+    assert vectors == [[0.5, 0.5], [0.5, 0.5]]
+    redis.mget.assert_not_called()
+    redis.pipeline.assert_not_called()
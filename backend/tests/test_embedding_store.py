@@ -0,0 +1,73 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+from backend.models import ChunkEmbedding, Document
+from backend.ingestion.embedding_store import content_hash, embed_chunks, retain, release_documents
+from backend.ingestion.reembed import reembed_source
+
+@pytest.fixture
+def Session():
+    engine = create_engine("sqlite://")
+    ChunkEmbedding.__table__.create(engine)
+    factory = sessionmaker(bind=engine)
+    with patch("backend.ingestion.embedding_store.SessionLocal", factory):
+        yield factory
+
+def test_only_unseen_chunks_are_embedded(Session):
+    with Session() as db:
+        retain(db, "m", [content_hash("m", "MIT License")], [[1.0, 0.0]])
+        db.commit()
+
+    client = MagicMock()
+    client.embed_documents.return_value = [[0.0, 1.0]]
+    vectors, keys = embed_chunks(client, "m", ["MIT License", "install guide", "install guide"])
+
+    client.embed_documents.assert_called_once_with(["install guide"])
+    assert [list(v) for v in vectors] == [[1.0, 0.0], [0.0, 1.0], [0.0, 1.0]]
+
+    with Session() as db:
+        retain(db, "m", keys, vectors)
+        db.commit()
+        refcounts = dict(db.execute(select(ChunkEmbedding.content_hash, ChunkEmbedding.refcount)).all())
+    assert refcounts == {content_hash("m", "MIT License"): 2, content_hash("m", "install guide"): 2}
+
+def test_model_switch_moves_references_to_the_new_model(Session):
+    with Session() as db:
+        db.execute(text(
+            "CREATE TABLE documents (id INTEGER PRIMARY KEY, user_id INTEGER, tenant_id INTEGER NOT NULL, content TEXT, "
+            "embedding TEXT, embedding_v2 TEXT, embedding_model TEXT, embedding_v2_model TEXT, source TEXT, "
+            "chunk_index INTEGER, is_deleted BOOLEAN)"
+        ))
+        for i, content in enumerate(["MIT License", "install guide"], 1):
+            db.execute(text(
+                "INSERT INTO documents VALUES (:id, 7, 7, :content, '[1.0,0.0]', NULL, 'old', NULL, 'notes.txt', :id, 0)"
+            ), {"id": i, "content": content})
+        retain(db, "old", [content_hash("old", "MIT License"), content_hash("old", "install guide")], [[1.0, 0.0]] * 2)
+        db.commit()
+
+    def refcounts():
+        with Session() as db:
+            return dict(db.execute(select(ChunkEmbedding.content_hash, ChunkEmbedding.refcount)).all())
+
+    client = MagicMock()
+    # documents.embedding is Vector(4096)
+    client.embed_documents.side_effect = lambda texts: [[0.1] * 4096] * len(texts)
+    with patch("backend.ingestion.reembed.SessionLocal", Session), \
+         patch("backend.ingestion.reembed.client_for", return_value=client):
+        assert reembed_source("notes.txt", 7, models=["new"]) == 2
+        # Same model again: embedded afresh, references unchanged
+        reembed_source("notes.txt", 7, models=["new"])
+
+    assert client.embed_documents.call_count == 2
+    assert refcounts() == {
+        content_hash("old", "MIT License"): 0, content_hash("old", "install guide"): 0,
+        content_hash("new", "MIT License"): 1, content_hash("new", "install guide"): 1,
+    }
+    with Session() as db:
+        assert db.execute(select(Document.embedding_model).distinct()).scalars().all() == ["new"]
+        # Deleting the chunks releases the keys they hold now, not the configured model's
+        with patch("backend.ingestion.embedding_store.EMBEDDING_MODEL", "old"):
+            release_documents(db, [1, 2])
+        db.commit()
+    assert set(refcounts().values()) == {0}
@@ -0,0 +1,66 @@
+import asyncio
+from contextlib import ExitStack
+from unittest.mock import AsyncMock, MagicMock, patch
+from backend.agents import embeddings
+from backend.agents.embeddings import active_model, aactive_model, EMBEDDING_MODEL
+
+V2 = "nomic-embed-text"
+
+def coverage_session(*missing):
+    """SessionLocal stand-in: each coverage query reports the next count of chunks without a v2 vector."""
+    db = MagicMock()
+    db.execute.return_value.scalar.side_effect = list(missing)
+    factory = MagicMock()
+    factory.return_value.__enter__.return_value = db
+    return factory, db
+
+def auto_mode(interval, **session):
+    """RETRIEVAL_EMBEDDING=auto with a v2 model configured and no coverage check made yet."""
+    stack = ExitStack()
+    stack.enter_context(patch("backend.agents.embeddings.embeddings_v2", MagicMock()))
+    stack.enter_context(patch("backend.agents.embeddings.EMBEDDING_V2_MODEL", V2))
+    stack.enter_context(patch("backend.agents.embeddings.RETRIEVAL_EMBEDDING", "auto"))
+    stack.enter_context(patch("backend.agents.embeddings.COVERAGE_CHECK_INTERVAL", interval))
+    stack.enter_context(patch.dict(embeddings._coverage, {"complete": False, "checked_at": None}))
+    for name, factory in session.items():
+        stack.enter_context(patch(f"backend.agents.embeddings.{name}", factory))
+    return stack
+
+def test_auto_switches_to_v2_once_every_chunk_is_covered():
+    session, db = coverage_session(12, 0)
+    # Interval of -1: every call is due for a re-check
+    with auto_mode(-1, SessionLocal=session):
+        models = [active_model() for _ in range(3)]
+
+    # Re-embed still running on the first call: stay on the legacy column
+    assert models == [EMBEDDING_MODEL, V2, V2]
+    # Complete coverage is final: no more counting once switched
+    assert db.execute.call_count == 2
+
+def test_coverage_is_not_rechecked_within_the_interval():
+    session, db = coverage_session(12, 0)
+    with auto_mode(60, SessionLocal=session):
+        models = [active_model() for _ in range(2)]
+
+    assert models == [EMBEDDING_MODEL, EMBEDDING_MODEL]
+    assert db.execute.call_count == 1
+
+def test_failed_coverage_check_stays_on_legacy_until_the_next_interval():
+    session, db = coverage_session()
+    db.execute.side_effect = RuntimeError("connection refused")
+    with auto_mode(60, SessionLocal=session):
+        models = [active_model() for _ in range(2)]
+
+    assert models == [EMBEDDING_MODEL, EMBEDDING_MODEL]
+    assert db.execute.call_count == 1
+
+def test_async_auto_switches_to_v2_once_every_chunk_is_covered():
+    db = AsyncMock()
+    db.execute.return_value = MagicMock(scalar=MagicMock(return_value=0))
+    session = MagicMock()
+    session.return_value.__aenter__.return_value = db
+    with auto_mode(60, AsyncSessionLocal=session):
+        model = asyncio.run(aactive_model())
+
+    assert model == V2
+    db.execute.assert_awaited_once()
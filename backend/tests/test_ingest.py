@@ -0,0 +1,98 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from backend.ingestion.ingest import ingest_file, ingest_file_streaming, reingest_file
+
+def fake_chunks(docs):
+    return (SimpleNamespace(page_content=f"chunk {i}", metadata={"source": "big.pdf"}) for i in range(5))
+
+def fake_embed(indexed_chunks, user_id, file_size, checksum):
+    return [{"chunk_index": idx} for idx, _ in indexed_chunks], {}
+
+def test_streaming_resumes_after_committed_chunks():
+    stored = []
+    with patch("backend.ingestion.ingest.INGEST_STREAM_BATCH_SIZE", 2), \
+         patch("backend.ingestion.ingest.committed_chunks", return_value=3), \
+         patch("backend.ingestion.ingest.lazy_load_file", return_value=iter([])), \
+         patch("backend.ingestion.ingest.iter_chunks", fake_chunks), \
+         patch("backend.ingestion.ingest._embed_rows", side_effect=fake_embed) as embed, \
+         patch("backend.ingestion.ingest._store", side_effect=lambda rows, vectors, user_id: stored.extend(rows) or rows):
+
+        assert ingest_file_streaming("big.pdf", user_id=1, checksum="abc") == 2
+
+    assert [row["chunk_index"] for row in stored] == [3, 4]
+    # Chunks before the checkpoint are never re-embedded
+    assert [idx for call in embed.call_args_list for idx, _ in call.args[0]] == [3, 4]
+
+def test_failed_streaming_ingest_discards_the_upload():
+    with patch("backend.ingestion.ingest.committed_chunks", return_value=0), \
+         patch("backend.ingestion.ingest.lazy_load_file", return_value=iter([])), \
+         patch("backend.ingestion.ingest.iter_chunks", fake_chunks), \
+         patch("backend.ingestion.ingest._embed_rows", side_effect=fake_embed), \
+         patch("backend.ingestion.ingest._store", side_effect=RuntimeError("db down")), \
+         patch("backend.ingestion.ingest._discard_upload") as discard:
+
+        with pytest.raises(RuntimeError):
+            ingest_file_streaming("big.pdf", user_id=1, checksum="abc")
+
+    discard.assert_called_once_with("big.pdf", 1, "abc")
+
+def test_reingest_embeds_only_changed_chunks_and_drops_removed_ones():
+    stored = [
+        SimpleNamespace(id=10, content="chunk 0", chunk_index=0, page=None),
+        SimpleNamespace(id=11, content="old text", chunk_index=1, page=None),
+        SimpleNamespace(id=12, content="chunk 1", chunk_index=2, page=None),
+    ]
+    db = MagicMock()
+    db.execute.return_value.all.return_value = stored
+    session = MagicMock()
+    session.return_value.__enter__.return_value = db
+
+    with patch("backend.ingestion.ingest.SessionLocal", session), \
+         patch("backend.ingestion.ingest.lazy_load_file", return_value=iter([])), \
+         patch("backend.ingestion.ingest.iter_chunks", fake_chunks), \
+         patch("backend.ingestion.ingest._embed_rows", side_effect=fake_embed) as embed, \
+         patch("backend.ingestion.ingest._store", return_value=[20, 21, 22]), \
+         patch("backend.ingestion.ingest.release_documents") as release, \
+         patch("backend.ingestion.ingest.ann_index") as index:
+
+        assert reingest_file("v2.pdf", "notes.pdf", user_id=1, checksum="v2") == 3
+
+    # chunk 0 and chunk 1 are reused, chunks 2-4 are new
+    assert [idx for call in embed.call_args_list for idx, _ in call.args[0]] == [2, 3, 4]
+    release.assert_called_once_with(db, [11])
+    index.remove_documents.assert_called_once_with(1, [11])
+
+def test_same_named_uploads_are_separate_documents(tmp_path):
+    stored = []
+    first, second = tmp_path / "1_a_notes.txt", tmp_path / "1_b_notes.txt"
+    first.write_text("meeting notes")
+    second.write_text("shopping list")
+
+    def embed(indexed_chunks, user_id, file_size, checksum):
+        return [{"source": chunk.metadata["source"], "checksum": checksum} for _, chunk in indexed_chunks], {}
+
+    with patch("backend.ingestion.ingest.load_file", side_effect=lambda path: [path]), \
+         patch("backend.ingestion.ingest.chunk_docs", side_effect=lambda docs: [SimpleNamespace(page_content="text", metadata={"source": docs[0]})]), \
+         patch("backend.ingestion.ingest.committed_chunks", return_value=0), \
+         patch("backend.ingestion.ingest.stored_versions", return_value={"v1"}), \
+         patch("backend.ingestion.ingest._embed_rows", side_effect=embed), \
+         patch("backend.ingestion.ingest._store", side_effect=lambda rows, vectors, user_id: stored.extend(rows) or rows), \
+         patch("backend.ingestion.ingest.reingest_file") as reingest, \
+         patch("backend.ingestion.ingest._discard") as discard:
+
+        ingest_file(str(first), user_id=1, checksum="v1")
+        ingest_file(str(second), user_id=1, checksum="v2")
+
+    # Sharing a file name doesn't make the second upload a new version of the first
+    reingest.assert_not_called()
+    discard.assert_not_called()
+    assert [(row["source"], row["checksum"]) for row in stored] == [(str(first), "v1"), (str(second), "v2")]
+
+def test_replacement_upload_is_reingested():
+    with patch("backend.ingestion.ingest.stored_versions", return_value={"v1"}), \
+         patch("backend.ingestion.ingest.reingest_file", return_value=2) as reingest:
+
+        assert ingest_file("tmp/1_c_notes.txt", user_id=1, checksum="v2", source="tmp/1_a_notes.txt", replace=True) == 2
+
+    reingest.assert_called_once_with("tmp/1_c_notes.txt", "tmp/1_a_notes.txt", user_id=1, checksum="v2")
@@ -0,0 +1,69 @@
+import time
+from unittest.mock import MagicMock, patch
+from prometheus_client import REGISTRY
+from langchain_core.runnables import RunnableLambda
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from backend.instrumentation import TokenUsageCallback
+from backend.agents.llm import LLMGateway
+from backend.agents.prefetch import prefetch_agent
+from backend.agents.speculation import speculative_router_agent
+
+USAGE = {"input_tokens": 7, "output_tokens": 3, "total_tokens": 10}
+
+class UsageModel(BaseChatModel):
+    """Chat model that reports Ollama-style token usage on every call."""
+
+    @property
+    def _llm_type(self):
+        return "usage-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="yes", usage_metadata=USAGE))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        yield ChatGenerationChunk(message=AIMessageChunk(content="all green", usage_metadata=USAGE))
+
+def tokens(node, kind):
+    return REGISTRY.get_sample_value("agent_llm_tokens_total", {"node": node, "kind": kind}) or 0
+
+def run_node(name, func, state):
+    # What the graph does for a node: the run config is only passed to the node itself
+    config = {"callbacks": [TokenUsageCallback()], "metadata": {"langgraph_node": name}}
+    return RunnableLambda(func).invoke(state, config)
+
+def test_prefetch_branch_llm_calls_reach_the_graph_callbacks():
+    model = UsageModel()
+
+    def safety(state):
+        model.invoke(state["question"])
+        return {"is_safe": True}
+
+    before = tokens("prefetch", "completion"), tokens("prefetch", "prompt")
+    with patch("backend.agents.prefetch.CLASSIFIER_MODE", "separate"), \
+         patch("backend.agents.prefetch.safety_agent", side_effect=safety), \
+         patch("backend.agents.prefetch.history_loader", return_value={"history": []}), \
+         patch("backend.agents.prefetch.retriever_agent", return_value={"context": ""}):
+        state = run_node("prefetch", prefetch_agent, {"question": "Is the staging cluster healthy", "user_id": 1})
+
+    assert state["is_safe"] is True
+    assert tokens("prefetch", "completion") - before[0] == 3
+    assert tokens("prefetch", "prompt") - before[1] == 7
+
+def test_speculative_branch_llm_call_reaches_the_graph_callbacks():
+    def classify(question):
+        time.sleep(0.05)
+        return "qa"
+
+    before = tokens("qa", "completion"), tokens("router", "completion")
+    with patch("backend.agents.speculation.llm", LLMGateway(UsageModel())), \
+         patch("backend.agents.speculation.qa_messages", return_value=[("user", "prompt")]), \
+         patch("backend.agents.speculation.classify_llm", side_effect=classify), \
+         patch("backend.agents.speculation.get_stream_writer", return_value=MagicMock()):
+        state = run_node("router", speculative_router_agent, {"question": "Is the staging cluster healthy", "history": []})
+
+    assert state["debug"] == "all green"
+    # Counted under the node it was speculated for, not the router running it
+    assert tokens("qa", "completion") - before[0] == 3
+    assert tokens("router", "completion") - before[1] == 0
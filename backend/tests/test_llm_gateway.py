@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock
+from backend.agents.llm import LLMGateway, PriorityGate
+
+def test_priority_gate_wakes_highest_priority_first():
+    gate = PriorityGate(1)
+    gate.acquire(1)  # hold the only slot
+    order = []
+
+    def waiter(priority):
+        gate.acquire(priority)
+        order.append(priority)
+        gate.release()
+
+    threads = [threading.Thread(target=waiter, args=(p,)) for p in (2, 0, 1)]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)  # make sure each one is queued before the next
+
+    gate.release()
+    for t in threads:
+        t.join(timeout=2)
+
+    assert order == [0, 1, 2]
+
+def test_identical_inflight_prompts_are_coalesced():
+    started = threading.Event()
+    release = threading.Event()
+    model = MagicMock()
+
+    def slow_invoke(input, config=None, **kwargs):
+        started.set()
+        release.wait(timeout=2)
+        return "answer"
+
+    model.invoke.side_effect = slow_invoke
+    gateway = LLMGateway(model)
+    results = []
+
+    leader = threading.Thread(target=lambda: results.append(gateway.invoke("same prompt")))
+    leader.start()
+    started.wait(timeout=2)
+    follower = threading.Thread(target=lambda: results.append(gateway.invoke("same prompt")))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(timeout=2)
+    follower.join(timeout=2)
+
+    assert results == ["answer", "answer"]
+    assert model.invoke.call_count == 1
+
+def test_cancelled_leader_hands_the_call_to_a_follower():
+    calls = []
+
+    async def slow_ainvoke(input, config=None, **kwargs):
+        calls.append(input)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    model = MagicMock()
+    model.ainvoke.side_effect = slow_ainvoke
+    gateway = LLMGateway(model)
+
+    async def scenario():
+        leader = asyncio.create_task(gateway.ainvoke("same prompt"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(gateway.ainvoke("same prompt"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    # The follower wasn't cancelled, so it gets an answer by issuing the call itself
+    assert asyncio.run(scenario()) == "answer"
+    assert calls == ["same prompt", "same prompt"]
+
+def test_cancelled_follower_leaves_the_leader_running():
+    model = MagicMock()
+
+    async def slow_ainvoke(input, config=None, **kwargs):
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    model.ainvoke.side_effect = slow_ainvoke
+    gateway = LLMGateway(model)
+
+    async def scenario():
+        leader = asyncio.create_task(gateway.ainvoke("same prompt"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(gateway.ainvoke("same prompt"))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(scenario()) == "answer"
+    assert model.ainvoke.call_count == 1
+
+def test_stream_cancelled_while_queued_never_starts_a_generation():
+    model = MagicMock()
+    gateway = LLMGateway(model)
+    cancel = threading.Event()
+    cancel.set()
+
+    assert list(gateway.stream("prompt", cancel=cancel)) == []
+    model.stream.assert_not_called()
+    # The slot went back to the gate
+    assert gateway._gate.active == 0
+
+def test_threads_and_coroutines_share_one_budget():
+    gate = PriorityGate(1)
+    gate.acquire(1)  # a thread holds the only slot
+    order = []
+
+    async def coroutine():
+        await gate.aacquire(1)
+        order.append("coroutine")
+        gate.release()
+
+    def thread():
+        gate.acquire(1)
+        order.append("thread")
+        gate.release()
+
+    async def scenario():
+        task = asyncio.create_task(coroutine())
+        await asyncio.sleep(0.05)
+        assert order == [] and gate.active == 1
+        waiter = threading.Thread(target=thread)
+        waiter.start()
+        time.sleep(0.05)
+        gate.release()
+        await asyncio.wait_for(task, timeout=2)
+        waiter.join(timeout=2)
+
+    asyncio.run(scenario())
+    assert order == ["coroutine", "thread"]
+    assert gate.active == 0
+
+def test_cancelled_coroutine_gives_up_its_place_in_the_queue():
+    gate = PriorityGate(1)
+    gate.acquire(1)
+
+    async def scenario():
+        task = asyncio.create_task(gate.aacquire(0))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert gate.waiters == []
+    gate.release()
+    assert gate.active == 0
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from backend.agents.prefetch import prefetch_agent, aprefetch_agent
+
+def fake_safety(is_safe):
+    def agent(state):
+        state["is_safe"] = is_safe
+        if not is_safe:
+            state["debug"] = "blocked"
+        return state
+    return agent
+
+def fake_history(state):
+    state["history"] = [{"role": "user", "content": "hi"}]
+    return state
+
+def fake_retriever(state):
+    state["context"] = "some context"
+    state["citations"] = [{"source": "doc.txt", "page": 0}]
+    return state
+
+def test_prefetch_merges_all_branches_when_safe():
+    with patch("backend.agents.prefetch.CLASSIFIER_MODE", "separate"), \
+         patch("backend.agents.prefetch.safety_agent", fake_safety(True)), \
+         patch("backend.agents.prefetch.history_loader", fake_history), \
+         patch("backend.agents.prefetch.retriever_agent", fake_retriever):
+
+        state = prefetch_agent({"question": "What is RAG?", "user_id": 1})
+
+    assert state["is_safe"] is True
+    assert state["history"] == [{"role": "user", "content": "hi"}]
+    assert state["context"] == "some context"
+    assert set(state["timings"]) == {"safety", "history", "retriever"}
+
+def test_prefetch_drops_other_branches_when_unsafe():
+    with patch("backend.agents.prefetch.CLASSIFIER_MODE", "separate"), \
+         patch("backend.agents.prefetch.safety_agent", fake_safety(False)), \
+         patch("backend.agents.prefetch.history_loader", fake_history), \
+         patch("backend.agents.prefetch.retriever_agent", fake_retriever):
+
+        state = prefetch_agent({"question": "How do I hack a server?", "user_id": 1})
+
+    assert state["is_safe"] is False
+    assert state["debug"] == "blocked"
+    assert "context" not in state
+    assert "history" not in state
+    assert list(state["timings"]) == ["safety"]
+
+def test_async_prefetch_cancels_the_other_branch_when_one_fails():
+    cancelled = []
+
+    async def safe(state):
+        state["is_safe"] = True
+        return state
+
+    async def failing_history(state):
+        raise RuntimeError("history store down")
+
+    async def slow_retriever(state):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append("retriever")
+            raise
+        return state
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await aprefetch_agent({"question": "What is RAG?", "user_id": 1})
+        # Let the cancellation reach the retriever task
+        await asyncio.sleep(0)
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    with patch("backend.agents.prefetch.CLASSIFIER_MODE", "separate"), \
+         patch("backend.agents.prefetch.asafety_agent", safe), \
+         patch("backend.agents.prefetch.ahistory_loader", failing_history), \
+         patch("backend.agents.prefetch.aretriever_agent", slow_retriever):
+        leftover = asyncio.run(scenario())
+
+    assert cancelled == ["retriever"]
+    assert leftover == []
@@ -0,0 +1,53 @@
+from unittest.mock import patch
+from backend.agents import prompt_budget
+from backend.agents.prompt_budget import fit_chunks, fit_history, plan_prompt, estimate_tokens, build_messages
+from backend.agents.coder import _messages as coder_messages
+from backend.agents.debugger import _messages as debugger_messages
+
+def turn(role, words):
+    return {"role": role, "content": "word " * words}
+
+def test_fit_chunks_keeps_rank_order_and_cuts_an_oversized_top_chunk():
+    chunks = ["a" * 400, "b" * 400, "c" * 400]
+    # 108 tokens each: two fit in 250
+    assert fit_chunks(chunks, 250) == chunks[:2]
+
+    kept = fit_chunks(["x" * 4000], 100)
+    assert len(kept) == 1 and estimate_tokens(kept[0]) <= 100
+
+def test_fit_history_keeps_the_most_recent_turns():
+    history = [turn("user", 100), turn("assistant", 100), turn("user", 10), turn("assistant", 10)]
+    kept, dropped = fit_history(history, 150)
+    assert kept == history[2:]
+    assert dropped == history[:2]
+
+    assert fit_history(history, 10_000) == (history, [])
+
+def test_plan_prompt_stays_within_the_node_budget():
+    system, question = "You are a planner.", "Current Question: how?"
+    chunks = ["c" * 2000] * 20
+    history = [turn("user", 300), turn("assistant", 300)] * 3
+
+    with patch.dict(prompt_budget.NODE_BUDGETS, {"planner": 1500}):
+        kept_chunks, kept_history, dropped = plan_prompt("planner", system, question, chunks, history)
+
+    used = estimate_tokens(system) + estimate_tokens(question)
+    used += sum(estimate_tokens(t["content"]) for t in kept_history) + sum(estimate_tokens(c) for c in kept_chunks)
+    assert used <= 1500
+    assert kept_history and dropped and kept_history[-1] is history[-1]
+    # Context gets what history leaves unused
+    assert len(kept_chunks) >= 1
+
+def test_qa_prompt_has_no_history_unless_enabled():
+    state = {"question": "What is X?", "chunks": ["X is a thing."], "history": [turn("user", 5), turn("assistant", 5)]}
+    assert len(build_messages("qa", state, "system", "Question: What is X?")) == 2
+    assert len(build_messages("planner", state, "system", "Current Question: What is X?")) == 4
+
+def test_coder_and_debugger_inputs_are_cut_to_their_budgets():
+    with patch.dict(prompt_budget.NODE_BUDGETS, {"coder": 500, "debugger": 400}):
+        coder = coder_messages({"plan": "step " * 5000})
+        debugger = debugger_messages({"code": "x = 1\n" * 5000})
+
+    assert sum(estimate_tokens(m.content) for m in coder) <= 501
+    assert coder[1].content.endswith("Write the code.")
+    assert sum(estimate_tokens(m.content) for m in debugger) <= 401
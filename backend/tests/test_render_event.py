@@ -0,0 +1,67 @@
+import time
+from types import SimpleNamespace
+from backend.main import render_event
+
+def new_progress():
+    return {"streamed_nodes": set(), "last_node": None, "answer": [], "final": None, "start": time.time(), "first_token_at": None}
+
+def token(node, text):
+    return "messages", (SimpleNamespace(content=text), {"langgraph_node": node})
+
+def render(events, conversation_id=42):
+    progress = new_progress()
+    out = []
+    for mode, chunk in events:
+        out.extend(render_event(mode, chunk, progress, conversation_id))
+    return "".join(out), progress
+
+def test_streamed_node_is_not_repeated_by_its_update():
+    text, progress = render([
+        token("qa", "Pass "),
+        token("qa", "--force."),
+        ("updates", {"qa": {"debug": "Pass --force."}}),
+        ("updates", {"memory": {"is_safe": True, "debug": "Pass --force.", "citations": [{"source": "cli.md", "page": 0}]}}),
+    ])
+    assert text.startswith("Pass --force.\n\nSOURCES:\n")
+    assert text.count("Pass --force.") == 1
+    assert text.endswith("CONVERSATION_ID: 42")
+    assert progress["answer"] == ["Pass ", "--force."]
+    assert progress["first_token_at"] is not None
+
+def test_tokens_of_unstreamed_nodes_are_dropped():
+    # Classifier and router calls also produce message chunks; they aren't the answer
+    text, progress = render([token("prefetch", '{"safe": true}'), token("router", "qa")])
+    assert text == ""
+    assert progress["first_token_at"] is None
+
+def test_coalesced_coder_output_is_sent_in_one_piece():
+    # A coalesced LLM call yields no tokens, only the node's update
+    text, _ = render([
+        ("updates", {"planner": {"plan": "1. parse args"}}),
+        ("updates", {"coder": {"code": "print('hi')"}}),
+        token("debugger", "Looks "),
+        token("debugger", "fine."),
+        ("updates", {"debugger": {"debug": "Looks fine."}}),
+    ])
+    assert text == "print('hi')\n\nLooks fine."
+
+def test_confirmed_speculative_tokens_come_from_the_custom_stream():
+    text, progress = render([
+        ("custom", {"node": "qa", "token": "Pass "}),
+        ("custom", {"node": "qa", "token": "--force."}),
+        ("updates", {"router": {"debug": "Pass --force.", "speculated": "qa"}}),
+    ])
+    assert text == "Pass --force."
+    assert progress["streamed_nodes"] == {"qa"}
+
+def test_cached_answer_is_replayed_word_by_word():
+    progress = new_progress()
+    final = {"is_safe": True, "cached": True, "debug": "Pass --force to skip it.", "citations": []}
+    pieces = list(render_event("updates", {"memory": final}, progress, 42))
+    assert pieces[:5] == ["Pass ", "--force ", "to ", "skip ", "it."]
+    assert pieces[-1] == "\n\nCONVERSATION_ID: 42"
+    assert progress["final"] is final
+
+def test_refusal_is_sent_once_without_sources():
+    text, _ = render([("updates", {"memory": {"is_safe": False, "debug": "I can't help with that."}})])
+    assert text == "I can't help with that.\n\nCONVERSATION_ID: 42"
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+from backend.agents.retriever import retrieve_batch
+
+def test_batch_retrieval_embeds_all_queries_in_one_call():
+    client = MagicMock()
+    client.embed_documents.return_value = [[0.1], [0.2]]
+    hit = SimpleNamespace(id=1, chunk_index=0, content="Phoenix is a RAG platform.", source="readme.md", page=None, tenant_id=0)
+
+    with patch("backend.agents.retriever.SessionLocal", MagicMock()), \
+         patch("backend.agents.retriever.client_for", return_value=client), \
+         patch("backend.agents.retriever.use_lexical_fast_path", return_value=False), \
+         patch("backend.agents.retriever.fetch_neighbours", return_value=[]), \
+         patch("backend.agents.retriever.retrieve_documents", return_value=[hit]) as retrieve:
+
+        results = retrieve_batch(["What is Phoenix?", "How do I register?"], 1, model="m")
+
+    client.embed_documents.assert_called_once_with(["What is Phoenix?", "How do I register?"])
+    assert retrieve.call_count == 2
+    assert results[1]["context"] == "Phoenix is a RAG platform."
+    assert results[1]["citations"] == [{"source": "readme.md", "page": None}]
+
+def test_failed_batch_is_not_counted_as_a_success():
+    from fastapi.testclient import TestClient
+    from prometheus_client import REGISTRY
+    from backend.main import app
+    from backend.auth import get_current_user
+
+    labels = {"method": "POST", "endpoint": "/retrieve/batch", "status": "200"}
+    before = REGISTRY.get_sample_value("http_requests_total", labels) or 0
+    previous = app.dependency_overrides.get(get_current_user)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=1)
+    try:
+        with patch("backend.main.retrieve_batch", side_effect=RuntimeError("db down")):
+            response = TestClient(app, raise_server_exceptions=False).post("/retrieve/batch", json={"queries": ["What is Phoenix?"]})
+        with patch("backend.main.retrieve_batch", return_value=[]):
+            TestClient(app).post("/retrieve/batch", json={"queries": ["What is Phoenix?"]})
+    finally:
+        if previous is None:
+            del app.dependency_overrides[get_current_user]
+        else:
+            app.dependency_overrides[get_current_user] = previous
+
+    assert response.status_code == 500
+    assert (REGISTRY.get_sample_value("http_requests_total", labels) or 0) - before == 1
@@ -0,0 +1,43 @@
+from unittest.mock import patch
+from backend.agents.router import classify_keywords, router_agent
+
+def test_code_fence_is_always_code():
+    intent, confidence = classify_keywords("Why does this fail?\n```python\nprint(x)\n```")
+    assert intent == "code"
+    assert confidence > 0.9
+
+def test_mixed_keywords_are_ambiguous():
+    intent, _ = classify_keywords("What is the error rate in the report?")
+    assert intent is None
+
+def test_router_skips_llm_for_confident_local_decision():
+    with patch("backend.agents.router.label_llm") as mock_llm:
+        state = router_agent({"question": "Write a python function to fix this bug"})
+
+    mock_llm.invoke.assert_not_called()
+    assert state["intent"] == "code"
+    assert state["route_tier"] == "keyword"
+
+def test_router_falls_back_to_llm_when_ambiguous():
+    with patch("backend.agents.router.label_llm") as mock_llm:
+        mock_llm.invoke.return_value.content = "qa"
+        state = router_agent({"question": "Hello there"})
+
+    mock_llm.invoke.assert_called_once()
+    assert state["intent"] == "qa"
+    assert state["route_tier"] == "llm"
+
+def test_keywords_match_whole_words_only():
+    # "whole", "decode", "prefix" and "somewhere" contain keywords but aren't them
+    assert classify_keywords("Read the whole changelog") == (None, 0.0)
+    assert classify_keywords("The decode step in the pipeline") == (None, 0.0)
+    assert classify_keywords("Explain the prefix tree") == ("qa", 0.75)
+    assert classify_keywords("It is written somewhere in the wiki") == (None, 0.0)
+
+def test_plural_keywords_still_match():
+    intent, _ = classify_keywords("These bugs keep coming back")
+    assert intent == "code"
+
+def test_why_does_my_script_crash_leans_code():
+    intent, _ = classify_keywords("Why does my script crash with a segmentation fault?")
+    assert intent == "code"
@@ -0,0 +1,34 @@
+from sqlalchemy.dialects import postgresql
+from backend.agents.embeddings import EMBEDDING_MODEL
+from backend.agents.search import (
+    binary_quantize,
+    search_query,
+    search_settings,
+    looks_like_identifier,
+    reciprocal_rank_fusion,
+)
+
+def compiled(query):
+    return str(query.compile(dialect=postgresql.dialect()))
+
+def test_binary_quantize_sets_positive_dimensions():
+    assert binary_quantize([0.5, -0.1, 0.0, 2.0]) == "1001"
+
+def test_exact_search_orders_by_full_vector():
+    sql = compiled(search_query([0.1] * 4096, 1, EMBEDDING_MODEL, mode="off"))
+    assert "embedding <->" in sql
+    assert "embedding_bit" not in sql
+
+def test_two_stage_search_shortlists_by_hamming_then_reranks():
+    sql = compiled(search_query([0.1] * 4096, 1, EMBEDDING_MODEL, mode="bit", candidates=100))
+    assert "embedding_bit <~>" in sql
+    assert "embedding <->" in sql
+    assert search_settings(EMBEDDING_MODEL, "bit", 100) == ["SET LOCAL hnsw.ef_search = 100"]
+
+def test_identifier_queries_take_the_lexical_path():
+    assert looks_like_identifier("parse_config KeyError")
+    assert looks_like_identifier("AttributeError")
+    assert not looks_like_identifier("What are the main goals of the project?")
+
+def test_rrf_rewards_ids_ranked_by_both():
+    assert reciprocal_rank_fusion([1, 2, 3], [3, 4]) == [3, 1, 2, 4]
@@ -0,0 +1,128 @@
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from backend.agents.speculation import speculative_router_agent, aspeculative_router_agent
+
+# No keyword or code fence, and no query vector: the local tiers have no opinion
+QUESTION = "Is the staging cluster healthy"
+
+def question(**extra):
+    return {"question": QUESTION, "user_id": 1, "history": [], **extra}
+
+def chunks(*texts):
+    return [SimpleNamespace(content=t) for t in texts]
+
+def slow_label(label, delay=0.1):
+    def classify(question):
+        time.sleep(delay)
+        return label
+    return classify
+
+def test_confirmed_branch_streams_its_tokens_and_saves_its_own_run_time():
+    writer = MagicMock()
+    with patch("backend.agents.speculation.qa_messages", return_value=["prompt"]), \
+         patch("backend.agents.speculation.llm") as llm, \
+         patch("backend.agents.speculation.classify_llm", side_effect=slow_label("qa")), \
+         patch("backend.agents.speculation.get_stream_writer", return_value=writer), \
+         patch("backend.agents.speculation.SPECULATION_SAVED") as saved, \
+         patch("backend.agents.speculation.SPECULATION_TOTAL") as total:
+        llm.stream.return_value = iter(chunks("All ", "green."))
+        state = speculative_router_agent(question())
+
+    assert state["intent"] == "qa" and state["route_tier"] == "llm"
+    assert state["debug"] == "All green."
+    assert state["speculated"] == "qa"
+    assert [c.args[0]["token"] for c in writer.call_args_list] == ["All ", "green."]
+    total.labels.assert_called_once_with(branch="qa", result="hit")
+    # The branch finished long before the 0.1s router: that's all it saved, not the router time
+    (observed,), _ = saved.observe.call_args
+    assert observed < 0.05
+
+def test_losing_branch_is_stopped_and_recorded_as_a_miss():
+    closed = threading.Event()
+
+    def endless(messages, config=None, **kwargs):
+        try:
+            while True:
+                time.sleep(0.01)
+                yield SimpleNamespace(content="token ")
+        finally:
+            closed.set()
+
+    with patch("backend.agents.speculation.qa_messages", return_value=["prompt"]), \
+         patch("backend.agents.speculation.llm") as llm, \
+         patch("backend.agents.speculation.classify_llm", side_effect=slow_label("code", 0.05)), \
+         patch("backend.agents.speculation.get_stream_writer") as get_writer, \
+         patch("backend.agents.speculation.SPECULATION_SAVED") as saved, \
+         patch("backend.agents.speculation.SPECULATION_TOTAL") as total:
+        llm.stream.side_effect = endless
+        state = speculative_router_agent(question())
+
+    assert closed.wait(timeout=1)
+    assert state["intent"] == "code"
+    assert "debug" not in state and "speculated" not in state
+    get_writer.assert_not_called()
+    total.labels.assert_called_once_with(branch="qa", result="miss")
+    saved.observe.assert_not_called()
+
+def test_async_losing_branch_is_cancelled():
+    cancelled = []
+
+    async def endless(messages, config=None):
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield SimpleNamespace(content="token ")
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def aclassify(question):
+        await asyncio.sleep(0.05)
+        return "code"
+
+    async def scenario():
+        state = await aspeculative_router_agent(question())
+        # Let the cancellation reach the branch task
+        await asyncio.sleep(0.02)
+        return state
+
+    with patch("backend.agents.speculation.aqa_messages", return_value=["prompt"]), \
+         patch("backend.agents.speculation.llm") as llm, \
+         patch("backend.agents.speculation.aclassify_llm", side_effect=aclassify), \
+         patch("backend.agents.speculation.SPECULATION_SAVED") as saved, \
+         patch("backend.agents.speculation.SPECULATION_TOTAL") as total:
+        llm.astream.side_effect = endless
+        state = asyncio.run(scenario())
+
+    assert cancelled == [True]
+    assert state["intent"] == "code" and "speculated" not in state
+    total.labels.assert_called_once_with(branch="qa", result="miss")
+    saved.observe.assert_not_called()
+
+def test_intent_from_the_combined_classifier_skips_speculation():
+    with patch("backend.agents.speculation.llm") as llm, \
+         patch("backend.agents.speculation.classify_llm") as classify, \
+         patch("backend.agents.speculation.aclassify_llm") as aclassify, \
+         patch("backend.agents.speculation.SPECULATION_TOTAL") as total:
+        state = speculative_router_agent(question(intent="code"))
+        astate = asyncio.run(aspeculative_router_agent(question(intent="qa")))
+
+    assert state["route_tier"] == "classifier" and state["intent"] == "code"
+    assert astate["route_tier"] == "classifier" and astate["intent"] == "qa"
+    llm.stream.assert_not_called()
+    llm.astream.assert_not_called()
+    classify.assert_not_called()
+    aclassify.assert_not_called()
+    total.labels.assert_not_called()
+
+def test_confident_keyword_skips_speculation():
+    with patch("backend.agents.speculation.llm") as llm, \
+         patch("backend.agents.speculation.classify_llm") as classify:
+        state = speculative_router_agent(question(question="Write a python function to fix this bug"))
+
+    assert state["route_tier"] == "keyword" and state["intent"] == "code"
+    llm.stream.assert_not_called()
+    classify.assert_not_called()
@@ -5,12 +5,14 @@ from backend.tasks import ingest_document_task
 def test_ingest_document_task_success():
     # Mock ingest_file and os.path.exists
     with patch("backend.tasks.ingest_file") as mock_ingest, \
+         patch("backend.tasks.invalidate_answers") as mock_invalidate, \
          patch("os.path.exists", return_value=True) as mock_exists, \
          patch("os.remove") as mock_remove:
         
         result = ingest_document_task("fake/path.txt", 1)
         
-        mock_ingest.assert_called_once_with("fake/path.txt", user_id=1)
+        mock_ingest.assert_called_once_with("fake/path.txt", user_id=1, checksum=None, source=None, replace=False)
+        mock_invalidate.assert_called_once_with(1)
         mock_remove.assert_called_once_with("fake/path.txt")
         assert result["status"] == "success"
 
@@ -0,0 +1,47 @@
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from backend.ingestion.writer import chunk_row, write_chunks
+
+# The columns ingestion writes; the Postgres-only generated ones are left out
+SQLITE_DOCUMENTS = """
+    CREATE TABLE documents (
+        id INTEGER PRIMARY KEY, user_id INTEGER, tenant_id INTEGER NOT NULL, content TEXT, metadata TEXT,
+        embedding TEXT, embedding_v2 TEXT, embedding_model TEXT, embedding_v2_model TEXT, source TEXT, page INTEGER, file_size INTEGER,
+        chunk_index INTEGER, checksum TEXT, created_at TIMESTAMP, is_deleted BOOLEAN
+    )
+"""
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text(SQLITE_DOCUMENTS))
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+def rows(count, user_id=7):
+    return [chunk_row(f"chunk {i}", {"source": "notes.txt"}, [0.1] * 4096, None, user_id, i, 100, "abc") for i in range(count)]
+
+def test_batched_insert_returns_ids_in_order(db):
+    ids = write_chunks(db, rows(7), batch_size=3)
+    stored = db.execute(text("SELECT id, tenant_id, chunk_index FROM documents ORDER BY id")).all()
+    assert ids == [row.id for row in stored]
+    assert [row.chunk_index for row in stored] == list(range(7))
+    assert {row.tenant_id for row in stored} == {7}
+
+def test_failed_batch_soft_deletes_committed_rows(db):
+    from backend.ingestion import writer
+    insert_batch = writer._insert_batch
+    calls = []
+
+    def flaky(session, batch):
+        calls.append(batch)
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        return insert_batch(session, batch)
+
+    with patch.dict(writer.WRITERS, {"insert": flaky}), pytest.raises(RuntimeError):
+        write_chunks(db, rows(4), batch_size=2, mode="insert")
+    assert db.execute(text("SELECT count(*) FROM documents WHERE is_deleted = 0")).scalar() == 0